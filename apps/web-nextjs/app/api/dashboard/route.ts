@@ -39,6 +39,18 @@ export async function GET(request: NextRequest) {
       }
     }
     
+    // Monthly totals come pre-aggregated from the calculation service rollups
+    let monthlyRollups: Array<{ key: string; total_co2e: number }> = []
+    try {
+      const rollupResponse = await fetch(`${CALCULATION_SERVICE_URL}/api/v1/dashboard/rollups/mois`)
+      if (rollupResponse.ok) {
+        const rollupData = await rollupResponse.json()
+        monthlyRollups = rollupData.buckets || []
+      }
+    } catch (error) {
+      console.error('Error fetching dashboard rollups:', error)
+    }
+    
     // Fetch ML insights
     let mlInsights = null
     try {
@@ -60,7 +72,10 @@ export async function GET(request: NextRequest) {
         parEmploye: (latestCalculation.intensity_per_employee || 0) / 1000,
         parChiffreAffaires: latestCalculation.intensity_per_revenue || 0
       } : null,
-      trends: [],
+      trends: monthlyRollups.slice(-12).map((bucket) => ({
+        month: bucket.key,
+        value: bucket.total_co2e
+      })),
       benchmark: latestCalculation ? {
         secteur: latestCalculation.company_sector || latestCalculation.company_name || 'Services',
         mediane: 0,
@@ -0,0 +1,145 @@
+"""
+CarbonScore - Synthetic questionnaires for benchmarks
+Seeded, vectorized generator that scales from one company to millions
+"""
+
+from typing import Dict, Iterator
+import numpy as np
+
+SECTORS = ["industrie", "services", "commerce", "construction", "transport",
+           "restauration", "sante", "education", "agriculture", "technologie"]
+SECTOR_WEIGHTS = [0.12, 0.28, 0.16, 0.08, 0.06, 0.07, 0.06, 0.04, 0.05, 0.08]
+
+SIZE_BANDS = ["1-9", "10-49", "50-249", "250+"]
+SIZE_WEIGHTS = [0.55, 0.30, 0.12, 0.03]
+HEADCOUNT_RANGE = {"1-9": (1, 10), "10-49": (10, 50), "50-249": (50, 250), "250+": (250, 2000)}
+
+VEHICLE_TYPES = ["essence", "diesel", "electrique", "hybride"]
+COMMUTE_MODES = ["voiture", "transport_commun", "velo", "marche", "mixte"]
+WASTE_TREATMENTS = ["incineration", "enfouissement", "compostage", "recyclage"]
+OTHER_ENERGIES = [("Combustibles", "kWh"), ("Bois", "kg"), ("Propane", "kg")]
+
+def generate_columns(n: int, seed: int = 42, chunk_size: int = 10000) -> Iterator[Dict[str, np.ndarray]]:
+    """Yield questionnaire columns in chunks, so 1M companies never sit in memory at once.
+
+    The sequence only depends on (seed, chunk_size).
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        band = rng.choice(len(SIZE_BANDS), size=size, p=SIZE_WEIGHTS)
+        low = np.array([HEADCOUNT_RANGE[b][0] for b in SIZE_BANDS])[band]
+        high = np.array([HEADCOUNT_RANGE[b][1] for b in SIZE_BANDS])[band]
+        headcount = rng.integers(low, high)
+        # Activity scales with headcount, with a heavy right tail
+        scale = headcount * rng.lognormal(0.0, 0.6, size)
+        has_revenue = rng.random(size) < 0.8
+
+        yield {
+            "index": np.arange(start, start + size),
+            "secteur": np.array(SECTORS, dtype=object)[rng.choice(len(SECTORS), size=size, p=SECTOR_WEIGHTS)],
+            "effectif_band": np.array(SIZE_BANDS, dtype=object)[band],
+            "effectif": headcount,
+            "chiffre_affaires": np.where(has_revenue, np.round(scale * rng.lognormal(11.5, 0.4, size), -3), 0.0),
+            "electricite_kwh": np.round(scale * rng.lognormal(8.0, 0.5, size)),
+            "gaz_kwh": np.round(scale * rng.lognormal(7.5, 0.8, size) * (rng.random(size) < 0.7)),
+            "fioul_litres": np.round(scale * rng.lognormal(3.0, 0.8, size) * (rng.random(size) < 0.15)),
+            "carburants_litres": np.round(scale * rng.lognormal(4.5, 0.7, size)),
+            "autre_energie": rng.integers(0, len(OTHER_ENERGIES), size),
+            "autre_quantite": np.round(scale * rng.lognormal(2.0, 1.0, size) * (rng.random(size) < 0.2)),
+            "vehicule_type": np.array(VEHICLE_TYPES, dtype=object)[rng.integers(0, len(VEHICLE_TYPES), size)],
+            "vehicule_nombre": rng.poisson(np.maximum(headcount / 15, 0.3)),
+            "vehicule_km": np.round(rng.uniform(5000, 30000, size)),
+            "voiture_km": np.round(scale * rng.lognormal(5.5, 0.8, size)),
+            "train_km": np.round(scale * rng.lognormal(5.0, 1.0, size)),
+            "avion_domestique_km": np.round(scale * rng.lognormal(4.5, 1.2, size) * (rng.random(size) < 0.5)),
+            "avion_international_km": np.round(scale * rng.lognormal(5.0, 1.2, size) * (rng.random(size) < 0.3)),
+            "domicile_travail_km": np.round(rng.uniform(2, 40, size), 1),
+            "mode_transport": np.array(COMMUTE_MODES, dtype=object)[rng.integers(0, len(COMMUTE_MODES), size)],
+            "achats_keur": np.round(scale * rng.lognormal(2.5, 0.7, size)),
+            "pourcentage_local": np.round(rng.uniform(0, 100, size), 1),
+            "equipements_keur": np.round(scale * rng.lognormal(1.0, 0.8, size)),
+            "services_keur": np.round(scale * rng.lognormal(1.5, 0.8, size)),
+            "dechets_tonnes": np.round(scale * rng.lognormal(-2.0, 0.8, size), 2),
+            "traitement": np.array(WASTE_TREATMENTS, dtype=object)[rng.integers(0, len(WASTE_TREATMENTS), size)],
+        }
+
+def calculation_questionnaires(n: int, seed: int = 42, chunk_size: int = 10000) -> Iterator[Dict]:
+    """Questionnaires in the calculation service format (QuestionnaireRequest)"""
+    for chunk in generate_columns(n, seed, chunk_size):
+        rows = zip(*(chunk[k].tolist() for k in (
+            "index", "secteur", "effectif_band", "chiffre_affaires", "electricite_kwh", "gaz_kwh",
+            "carburants_litres", "vehicule_nombre", "vehicule_km", "avion_domestique_km",
+            "avion_international_km", "achats_keur", "pourcentage_local"
+        )))
+        for i, secteur, band, ca, elec, gaz, carburants, nombre, km, domestique, international, achats, local in rows:
+            yield {
+                "entreprise": {
+                    "nom": f"Entreprise {i}",
+                    "secteur": secteur,
+                    "effectif": band,
+                    "chiffreAffaires": ca or None,
+                    "localisation": "France"
+                },
+                "energie": {"electricite_kwh": elec, "gaz_kwh": gaz, "carburants_litres": carburants},
+                "transport": {
+                    "vehicules_km_annuel": nombre * km,
+                    "vols_domestiques_km": domestique,
+                    "vols_internationaux_km": international
+                },
+                "achats": {"montant_achats_annuel": achats * 1000, "pourcentage_local": local}
+            }
+
+def calculation_columns(n: int, seed: int = 42, chunk_size: int = 10000) -> Iterator[Dict[str, np.ndarray]]:
+    """Column chunks for CarbonCalculator.calculate_emissions_batch, same companies as above"""
+    for chunk in generate_columns(n, seed, chunk_size):
+        yield {
+            "nom": np.array([f"Entreprise {i}" for i in chunk["index"].tolist()], dtype=object),
+            "secteur": chunk["secteur"],
+            "effectif": chunk["effectif_band"],
+            "chiffre_affaires": np.where(chunk["chiffre_affaires"] > 0, chunk["chiffre_affaires"], np.nan),
+            "localisation": np.full(len(chunk["index"]), "France", dtype=object),
+            "electricite_kwh": chunk["electricite_kwh"],
+            "gaz_kwh": chunk["gaz_kwh"],
+            "carburants_litres": chunk["carburants_litres"],
+            "vehicules_km_annuel": chunk["vehicule_nombre"] * chunk["vehicule_km"],
+            "vols_domestiques_km": chunk["avion_domestique_km"],
+            "vols_internationaux_km": chunk["avion_international_km"],
+            "montant_achats_annuel": chunk["achats_keur"] * 1000,
+            "pourcentage_local": chunk["pourcentage_local"],
+        }
+
+def engine_questionnaires(n: int, seed: int = 42, chunk_size: int = 10000) -> Iterator[Dict]:
+    """Questionnaires in the calc-service format (CalculationEngine)"""
+    for chunk in generate_columns(n, seed, chunk_size):
+        rows = zip(*(chunk[k].tolist() for k in (
+            "index", "effectif", "chiffre_affaires", "gaz_kwh", "fioul_litres", "electricite_kwh",
+            "autre_energie", "autre_quantite", "vehicule_type", "vehicule_nombre", "vehicule_km",
+            "voiture_km", "train_km", "avion_domestique_km", "avion_international_km",
+            "domicile_travail_km", "mode_transport", "achats_keur", "equipements_keur",
+            "services_keur", "dechets_tonnes", "traitement"
+        )))
+        for (i, effectif, ca, gaz, fioul, elec, autre, autre_quantite, vehicule, nombre, km, voiture,
+             train, domestique, international, domicile, mode, achats, equipements, services,
+             dechets, traitement) in rows:
+            autre_type, autre_unite = OTHER_ENERGIES[autre]
+            yield {
+                "entreprise": {"nom": f"Entreprise {i}", "effectif": effectif, "chiffreAffaires": ca},
+                "energie": {
+                    "gaz": gaz,
+                    "fioul": fioul,
+                    "electricite": elec,
+                    "autresEnergies": [
+                        {"type": autre_type, "quantite": autre_quantite, "unite": autre_unite}
+                    ] if autre_quantite else []
+                },
+                "transport": {
+                    "vehiculesEntreprise": [{"type": vehicule, "nombre": nombre, "kilometrage": km}],
+                    "deplacementsProfessionnels": {
+                        "voiture": voiture, "train": train, "avion": domestique + international
+                    },
+                    "trajetsEmployes": {"domicileTravail": domicile, "modeTransport": mode}
+                },
+                "achats": {"matieresPremières": achats, "equipements": equipements, "services": services},
+                "dechets": {"production": dechets, "traitement": traitement}
+            }
@@ -0,0 +1,393 @@
+"""
+CarbonScore - Benchmark suite for the calculation hot paths
+
+Each case runs in a fresh process so peak RSS is per case. The report is JSON:
+
+    python benchmarks/run_benchmarks.py --companies 10000 --output bench.json
+    python benchmarks/run_benchmarks.py --companies 10000 --compare bench.json
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from questionnaires import (
+    calculation_columns, calculation_questionnaires, engine_questionnaires
+)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CALCULATION_DIR = REPO_ROOT / "services" / "calculation"
+CALC_SERVICE_DIR = REPO_ROOT / "services" / "calc-service"
+
+class SkipCase(Exception):
+    """The case cannot run in this environment (missing dependency or data)"""
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def quiet_logs():
+    logging.disable(logging.INFO)
+    try:
+        import structlog
+        structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    except ImportError:
+        pass
+
+def measure(calls: Iterable[Tuple[Callable[[], object], int]], warmup: int) -> Dict:
+    """Time (call, number of companies it covers) pairs, skipping the first `warmup`"""
+    latencies: List[float] = []
+    companies = 0
+    for i, (call, size) in enumerate(calls):
+        # Only the call is timed; generating its input is not
+        t0 = time.perf_counter_ns()
+        call()
+        elapsed = time.perf_counter_ns() - t0
+        if i >= warmup:
+            latencies.append(elapsed / 1e6)
+            companies += size
+
+    latency = np.asarray(latencies)
+    seconds = latency.sum() / 1000
+    return {
+        "companies": companies,
+        "calls": len(latencies),
+        "seconds": round(float(seconds), 4),
+        "throughput_per_s": round(float(companies / seconds), 1) if seconds > 0 else None,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latency, 50)), 4),
+            "p99": round(float(np.percentile(latency, 99)), 4),
+            "mean": round(float(latency.mean()), 4),
+            "max": round(float(latency.max()), 4),
+        } if len(latency) else None,
+    }
+
+def case_process_questionnaire_data(n: int, seed: int, warmup: int) -> Dict:
+    sys.path.insert(0, str(CALCULATION_DIR))
+    from carbon_calculator import get_factor_registry, process_questionnaire_data
+    get_factor_registry().current()
+
+    payloads = (json.dumps(q) for q in calculation_questionnaires(n + warmup, seed))
+    calls = ((lambda p=p: process_questionnaire_data(p), 1) for p in payloads)
+    return measure(calls, warmup)
+
+# Companies checked against the scalar path before a batch case is timed
+EQUIVALENCE_COMPANIES = 2000
+
+def calculator_companies(n: int, seed: int) -> Iterator:
+    """CompanyData for CarbonCalculator, built from calculation_questionnaires"""
+    sys.path.insert(0, str(CALCULATION_DIR))
+    from carbon_calculator import CompanyData
+
+    for q in calculation_questionnaires(n, seed):
+        yield CompanyData(
+            nom=q["entreprise"]["nom"], secteur=q["entreprise"]["secteur"],
+            effectif=q["entreprise"]["effectif"], chiffre_affaires=q["entreprise"]["chiffreAffaires"],
+            localisation=q["entreprise"]["localisation"], **q["energie"], **q["transport"], **q["achats"]
+        )
+
+def batch_mismatches(expected: List[Dict], actual: List[Dict], fields: Iterable[str]) -> List[Tuple[int, str]]:
+    """(company, field) pairs where a batch result differs from the per-company one"""
+    fields = list(fields)
+    return [
+        (i, field) for i, (one, batch) in enumerate(zip(expected, actual))
+        for field in fields if one[field] != batch[field]
+    ]
+
+def case_carbon_calculator(n: int, seed: int, warmup: int) -> Dict:
+    sys.path.insert(0, str(CALCULATION_DIR))
+    from carbon_calculator import CarbonCalculator
+
+    calculator = CarbonCalculator()
+    companies = calculator_companies(n + warmup, seed)
+    calls = ((lambda c=c: calculator.calculate_emissions(c), 1) for c in companies)
+    return measure(calls, warmup)
+
+def case_carbon_calculator_batch(n: int, seed: int, warmup: int, chunk_size: int = 10000) -> Dict:
+    sys.path.insert(0, str(CALCULATION_DIR))
+    from carbon_calculator import CarbonCalculator
+
+    calculator = CarbonCalculator()
+    # Batch output must match calculate_emissions company for company
+    companies = list(calculator_companies(EQUIVALENCE_COMPANIES, seed))
+    records = calculator.calculate_emissions_batch(companies).to_records()
+    expected = [vars(calculator.calculate_emissions(c)) for c in companies]
+    mismatches = batch_mismatches(expected, records, (k for k in records[0] if k != "nom"))
+    if mismatches:
+        raise AssertionError(f"batch disagrees with calculate_emissions on {mismatches[:10]}")
+
+    # Warm up on a separate small batch, then time whole chunks
+    calculator.calculate_emissions_batch(next(calculation_columns(max(warmup, 1), seed + 1)))
+    calls = (
+        (lambda c=c: calculator.calculate_emissions_batch(c), len(c["nom"]))
+        for c in calculation_columns(n, seed, chunk_size)
+    )
+    return measure(calls, 0)
+
+def load_calc_service_factors():
+    """ADEMELoader with its cache filled from a compiled snapshot, no database needed"""
+    sys.path.insert(0, str(CALC_SERVICE_DIR))
+    try:
+        from app.services.ademe_loader import ADEMELoader
+        from app.services.factor_snapshot import FactorSnapshot, compile_snapshot, open_fresh_snapshot
+    except ImportError as e:
+        raise SkipCase(f"calc-service unavailable: {e}")
+
+    loader = ADEMELoader()
+    loader.snapshot = open_fresh_snapshot(loader.data_path, loader.snapshot_path)
+    if loader.snapshot is None:
+        if not loader.data_path.exists():
+            raise SkipCase(f"ADEME data not found: {loader.data_path}")
+        snapshot_path = Path(tempfile.mkdtemp()) / "bench.fsnap"
+        loader.snapshot = FactorSnapshot.open(compile_snapshot(loader.data_path, snapshot_path))
+    # Base snapshot only: benchmarks run without a database holding later releases
+    asyncio.run(loader.load_factors_to_cache(with_releases=False))
+    return loader
+
+def case_calculation_engine(n: int, seed: int, warmup: int) -> Dict:
+    loader = load_calc_service_factors()
+    from app.services.calculation_engine import CalculationEngine
+
+    engine = CalculationEngine(loader)
+    calls = ((lambda q=q: engine.calculate_emissions(q), 1) for q in engine_questionnaires(n + warmup, seed))
+    result = measure(calls, warmup)
+    result["factors"] = len(loader.factors_cache)
+    return result
+
+def case_calculation_engine_batch(n: int, seed: int, warmup: int, chunk_size: int = 10000) -> Dict:
+    loader = load_calc_service_factors()
+    from app.services.calculation_engine import CalculationEngine
+
+    engine = CalculationEngine(loader)
+    # Batch output must match calculate_emissions company for company, trace included
+    questionnaires = list(engine_questionnaires(EQUIVALENCE_COMPANIES, seed))
+    expected = [engine.calculate_emissions(q) for q in questionnaires]
+    mismatches = batch_mismatches(
+        expected, engine.calculate_emissions_batch(questionnaires),
+        ("scope1", "scope2", "scope3", "total", "intensites", "trace")
+    )
+    if mismatches:
+        raise AssertionError(f"batch disagrees with calculate_emissions on {mismatches[:10]}")
+
+    engine.calculate_emissions_batch(list(engine_questionnaires(max(warmup, 1), seed + 1)))
+    questionnaires = engine_questionnaires(n, seed, chunk_size)
+    chunks = iter(lambda: list(itertools.islice(questionnaires, chunk_size)), [])
+    calls = ((lambda c=c: engine.calculate_emissions_batch(c, with_trace=False), len(c)) for c in chunks)
+    result = measure(calls, 0)
+    result["factors"] = len(loader.factors_cache)
+    return result
+
+# The (category, unit) lookups CalculationEngine issues
+FACTOR_QUERIES = [
+    ("Gaz naturel", "kWh"), ("Fioul", "litre"), ("Électricité", "kWh"),
+    ("Véhicule Essence", "km"), ("Véhicule Gazole", "km"), ("Véhicule Électricité", "km"),
+    ("Voiture particulière", "km"), ("Train", "km"), ("Avion", "km"),
+    ("Transport en commun", "km"), ("Vélo", "km"), ("Marche", "km"), ("Transport mixte", "km"),
+    ("Combustibles", "kWh"), ("Bois", "kg"), ("Propane", "kg"),
+]
+
+def linear_factor_lookup(factors: List, category: str, unit: str):
+    """The pre-index ADEMELoader scan, kept as the reference for the index"""
+    for factor in factors:
+        if category.lower() in factor.category.lower() and unit.lower() in factor.unit.lower():
+            return factor
+    return None
+
+def factor_id(factor) -> Optional[str]:
+    return factor.ademe_id if factor is not None else None
+
+def case_factor_lookup(n: int, seed: int, warmup: int) -> Dict:
+    loader = load_calc_service_factors()
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(FACTOR_QUERIES), n + warmup).tolist()
+    lookup = loader.get_factor_by_category_and_unit
+    factors = list(loader.factors_cache.values())
+
+    # FactorTable hands out a fresh FactorRow view per access: compare ids, not objects
+    mismatches = [
+        q for q in FACTOR_QUERIES
+        if factor_id(lookup(*q)) != factor_id(linear_factor_lookup(factors, *q))
+    ]
+    if mismatches:
+        raise AssertionError(f"index disagrees with the linear scan on {mismatches}")
+
+    t0 = time.perf_counter()
+    loader._build_lookup_index()
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    calls = ((lambda q=FACTOR_QUERIES[i]: lookup(*q), 1) for i in picks)
+    result = measure(calls, warmup)
+    # The linear scan is slow on the full factor set, a bounded sample is enough
+    linear_picks = picks[:min(len(picks), 2000)]
+    linear = measure(((lambda q=FACTOR_QUERIES[i]: linear_factor_lookup(factors, *q), 1) for i in linear_picks), 0)
+    result["factors"] = len(factors)
+    result["index_build_ms"] = round(build_ms, 2)
+    result["linear_scan"] = linear
+    if result["throughput_per_s"] and linear["throughput_per_s"]:
+        result["speedup_vs_linear"] = round(result["throughput_per_s"] / linear["throughput_per_s"], 1)
+    return result
+
+def case_factor_table_memory(n: int, seed: int, warmup: int) -> Dict:
+    """Per-worker heap held by the factor cache: ORM objects against FactorTable"""
+    import tracemalloc
+    loader = load_calc_service_factors()
+    from app.models.emission_factor import EmissionFactor
+    from app.services.factor_table import FactorTable
+
+    snapshot = loader.snapshot
+
+    def allocated(build: Callable[[], object]) -> int:
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return size
+
+    orm_bytes = allocated(lambda: {
+        row["ademe_id"]: EmissionFactor(source="ADEME", version="v17", status="valid", **row)
+        for row in (snapshot.row(i) for i in range(len(snapshot)))
+    })
+    table_bytes = allocated(lambda: FactorTable.from_snapshot(snapshot))
+    return {
+        "factors": len(snapshot),
+        "orm_cache_mb": round(orm_bytes / 2**20, 2),
+        "factor_table_mb": round(table_bytes / 2**20, 2),
+        "saving_mb": round((orm_bytes - table_bytes) / 2**20, 2),
+    }
+
+# Typical factor browser queries, including a typo and typeahead prefixes
+SEARCH_QUERIES = [
+    ("électricité", False), ("gaz naturel", False), ("train", False), ("beton arme", False),
+    ("aluminium", False), ("electrcite", False), ("viande de boeuf", False),
+    ("ess", True), ("avion co", True), ("papier ca", True),
+]
+
+def case_factor_search(n: int, seed: int, warmup: int) -> Dict:
+    loader = load_calc_service_factors()
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(SEARCH_QUERIES), n + warmup).tolist()
+    search = loader.search_factors_ranked
+    calls = ((lambda q=SEARCH_QUERIES[i]: search(q[0], limit=10, prefix=q[1]), 1) for i in picks)
+    result = measure(calls, warmup)
+    result["factors"] = len(loader.factors_cache)
+    return result
+
+CASES = {
+    "process_questionnaire_data": case_process_questionnaire_data,
+    "carbon_calculator.calculate_emissions": case_carbon_calculator,
+    "carbon_calculator.calculate_emissions_batch": case_carbon_calculator_batch,
+    "calc_service.calculation_engine": case_calculation_engine,
+    "calc_service.calculation_engine_batch": case_calculation_engine_batch,
+    "calc_service.factor_lookup": case_factor_lookup,
+    "calc_service.factor_search": case_factor_search,
+    "calc_service.factor_table_memory": case_factor_table_memory,
+}
+
+def run_case(name: str, n: int, seed: int, warmup: int) -> Dict:
+    """Entry point of the per-case child process"""
+    quiet_logs()
+    report = {"name": name}
+    try:
+        report.update(CASES[name](n, seed, warmup))
+        report["status"] = "ok"
+    except SkipCase as e:
+        report.update(status="skipped", reason=str(e))
+    except Exception as e:
+        report.update(status="failed", reason=f"{type(e).__name__}: {e}")
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Cases whose throughput dropped by more than `tolerance` against the baseline"""
+    previous = {case["name"]: case for case in baseline["cases"] if case["status"] == "ok"}
+    regressions = []
+    for case in report["cases"]:
+        before = previous.get(case["name"])
+        if case["status"] != "ok" or before is None:
+            continue
+        if not case.get("throughput_per_s") or not before.get("throughput_per_s"):
+            # Memory-only cases have no throughput to compare
+            continue
+        ratio = case["throughput_per_s"] / before["throughput_per_s"]
+        case["throughput_vs_baseline"] = round(ratio, 3)
+        if ratio < 1 - tolerance:
+            regressions.append(f"{case['name']}: {ratio:.2f}x baseline throughput")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CarbonScore calculation hot paths")
+    parser.add_argument("--companies", type=int, default=1000, help="Companies per case (1 to 1M)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed calls before measuring")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Baseline report to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed throughput drop vs baseline")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    cases = []
+    for name in args.cases:
+        with context.Pool(1) as pool:
+            case = pool.apply(run_case, (name, args.companies, args.seed, args.warmup))
+        cases.append(case)
+        print(f"{name}: {case['status']} {case.get('throughput_per_s', '')}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "companies": args.companies,
+            "seed": args.seed,
+            "warmup": args.warmup,
+        },
+        "cases": cases,
+    }
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
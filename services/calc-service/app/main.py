@@ -5,8 +5,10 @@ from contextlib import asynccontextmanager
 import structlog
 
 from .database import get_db, init_db
-from .routers import calculation, factors, validation, dashboard
+from .routers import calculation, consolidation, factors, validation, dashboard
 from .services.ademe_loader import ADEMELoader
+from .services.calculation_engine import CalculationEngine
+from .services.consolidation import ConsolidationStore
 from .config import settings
 
 logger = structlog.get_logger()
@@ -19,9 +21,13 @@ async def lifespan(app: FastAPI):
     
     ademe_loader = ADEMELoader()
     await ademe_loader.load_factors_if_needed()
+    app.state.ademe_loader = ademe_loader
+    app.state.calculation_engine = CalculationEngine(ademe_loader)
+    app.state.consolidation = ConsolidationStore(app.state.calculation_engine)
     
     yield
     
+    ademe_loader.close()
     logger.info("Arrêt du service de calcul")
 
 app = FastAPI(
@@ -41,6 +47,7 @@ app.add_middleware(
 
 app.include_router(calculation.router, prefix="/api/v1", tags=["Calcul"])
 app.include_router(factors.router, prefix="/api/v1", tags=["Facteurs"])
+app.include_router(consolidation.router, prefix="/api/v1", tags=["Consolidation"])
 app.include_router(validation.router, prefix="/api/v1", tags=["Validation"])
 app.include_router(dashboard.router, prefix="/api/v1", tags=["Dashboard"])
 
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, List, Optional
+import structlog
+
+from ..services.calculation_engine import CalculationEngine
+
+logger = structlog.get_logger()
+
+router = APIRouter()
+
+# Measured on one core at 10k samples: ~0.35 s for 300 companies with factor
+# uncertainty only, ~0.8 s for 300 and 1.3-1.5 s for 500 with activity uncertainty
+UNCERTAINTY_DESCRIPTION = (
+    "Propage l'incertitude ADEME par Monte Carlo et ajoute les percentiles p2.5/p50/p97.5 "
+    "par scope, au total et par ligne de trace. Coût: ~0,35 s pour 300 entreprises avec "
+    "l'incertitude des facteurs seule, ~0,8 s (300) à 1,5 s (500) avec une incertitude d'activité"
+)
+
+def get_calculation_engine(request: Request) -> CalculationEngine:
+    engine = getattr(request.app.state, "calculation_engine", None)
+    if engine is None:
+        raise HTTPException(status_code=503, detail="Moteur de calcul non initialisé")
+    return engine
+
+def _calculate(engine: CalculationEngine, questionnaires: List[Dict], factor_set: Optional[str],
+               incertitude: bool, n_samples: int, activity_uncertainty: Optional[float],
+               seed: Optional[int]) -> List[Dict]:
+    if incertitude:
+        return engine.calculate_emissions_with_uncertainty(
+            questionnaires,
+            n_samples=n_samples,
+            activity_uncertainty=activity_uncertainty,
+            seed=seed,
+            factor_set=factor_set
+        )
+    return engine.calculate_emissions_batch(questionnaires, factor_set=factor_set)
+
+@router.post("/calculate")
+async def calculate(request: Request,
+                    questionnaire: Dict = Body(...),
+                    factor_set: Optional[str] = Query(None, description="Jeu de facteurs ADEME"),
+                    incertitude: bool = Query(False, description=UNCERTAINTY_DESCRIPTION),
+                    n_samples: int = Query(10000, ge=100, le=100000, description="Tirages Monte Carlo"),
+                    activity_uncertainty: Optional[float] = Query(
+                        None, ge=0, le=100, description="Incertitude des quantités d'activité (%)"),
+                    seed: Optional[int] = Query(None, description="Graine du tirage, pour un résultat reproductible")) -> Dict:
+    engine = get_calculation_engine(request)
+    try:
+        if not incertitude:
+            return await run_in_threadpool(engine.calculate_emissions, questionnaire, factor_set)
+        results = await run_in_threadpool(_calculate, engine, [questionnaire], factor_set, incertitude,
+                                          n_samples, activity_uncertainty, seed)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return results[0]
+
+@router.post("/calculate/batch")
+async def calculate_batch(request: Request,
+                          questionnaires: List[Dict] = Body(...),
+                          factor_set: Optional[str] = Query(None, description="Jeu de facteurs ADEME"),
+                          incertitude: bool = Query(False, description=UNCERTAINTY_DESCRIPTION),
+                          n_samples: int = Query(10000, ge=100, le=100000, description="Tirages Monte Carlo"),
+                          activity_uncertainty: Optional[float] = Query(
+                              None, ge=0, le=100, description="Incertitude des quantités d'activité (%)"),
+                          seed: Optional[int] = Query(None, description="Graine du tirage, pour un résultat reproductible")) -> Dict:
+    engine = get_calculation_engine(request)
+    try:
+        results = await run_in_threadpool(_calculate, engine, questionnaires, factor_set, incertitude,
+                                          n_samples, activity_uncertainty, seed)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"resultats": results, "total": len(results)}
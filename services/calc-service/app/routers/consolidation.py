@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Body, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Optional
+import structlog
+
+from ..services.consolidation import ConsolidationStore, FactorSetConflict, GroupInventory
+
+logger = structlog.get_logger()
+
+router = APIRouter()
+
+def get_consolidation_store(request: Request) -> ConsolidationStore:
+    store = getattr(request.app.state, "consolidation", None)
+    if store is None:
+        raise HTTPException(status_code=503, detail="Service de consolidation non initialisé")
+    return store
+
+def _get_group(request: Request, group_id: str) -> GroupInventory:
+    inventory = get_consolidation_store(request).get(group_id)
+    if inventory is None:
+        raise HTTPException(status_code=404, detail=f"Groupe {group_id} introuvable")
+    return inventory
+
+def _get_or_create_group(request: Request, group_id: str, factor_set: Optional[str]) -> GroupInventory:
+    try:
+        return get_consolidation_store(request).group(group_id, factor_set)
+    except FactorSetConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _site_summary(site) -> Dict:
+    return {
+        "site_id": site.site_id,
+        "updated_at": site.updated_at,
+        "scope1": site.result["scope1"],
+        "scope2": site.result["scope2"],
+        "scope3": site.result["scope3"],
+        "total": site.result["total"],
+        "intensites": site.result["intensites"]
+    }
+
+@router.put("/groups/{group_id}/sites/{site_id}")
+async def upsert_site(request: Request, group_id: str, site_id: str,
+                      questionnaire: Dict = Body(...),
+                      factor_set: Optional[str] = Query(None, description="Jeu de facteurs ADEME du groupe")) -> Dict:
+    inventory = await run_in_threadpool(_get_or_create_group, request, group_id, factor_set)
+    recomputed_before = inventory.recomputed
+    try:
+        # Calculation runs off the event loop
+        site = await run_in_threadpool(inventory.upsert_site, site_id, questionnaire)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "site": _site_summary(site),
+        "recalcule": inventory.recomputed > recomputed_before,
+        "groupe": inventory.summary(with_sites=False)
+    }
+
+@router.put("/groups/{group_id}/sites")
+async def upsert_sites(request: Request, group_id: str,
+                       questionnaires: Dict[str, Dict] = Body(...),
+                       factor_set: Optional[str] = Query(None, description="Jeu de facteurs ADEME du groupe")) -> Dict:
+    inventory = await run_in_threadpool(_get_or_create_group, request, group_id, factor_set)
+    try:
+        recomputed = await run_in_threadpool(inventory.upsert_sites, questionnaires)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"recalcules": recomputed, "groupe": inventory.summary()}
+
+@router.get("/groups/{group_id}")
+async def get_group(request: Request, group_id: str) -> Dict:
+    inventory = _get_group(request, group_id)
+    # Sites computed before a factor reload are brought up to date before reading,
+    # in a worker thread: after a reload that is a batch calculation
+    await run_in_threadpool(inventory.refresh)
+    return inventory.summary()
+
+@router.get("/groups/{group_id}/sites/{site_id}")
+async def get_site(request: Request, group_id: str, site_id: str) -> Dict:
+    site = _get_group(request, group_id).sites.get(site_id)
+    if site is None:
+        raise HTTPException(status_code=404, detail=f"Site {site_id} introuvable")
+    return {**_site_summary(site), "trace": site.result["trace"], "metadata": site.result["metadata"]}
+
+@router.delete("/groups/{group_id}/sites/{site_id}")
+async def remove_site(request: Request, group_id: str, site_id: str) -> Dict:
+    inventory = _get_group(request, group_id)
+    if not inventory.remove_site(site_id):
+        raise HTTPException(status_code=404, detail=f"Site {site_id} introuvable")
+    return inventory.summary(with_sites=False)
+
+@router.delete("/groups/{group_id}")
+async def drop_group(request: Request, group_id: str) -> Dict:
+    if not get_consolidation_store(request).drop(group_id):
+        raise HTTPException(status_code=404, detail=f"Groupe {group_id} introuvable")
+    return {"group_id": group_id, "supprime": True}
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Dict, List, Optional
+import time
+import structlog
+
+from ..services.ademe_loader import ADEMELoader
+
+logger = structlog.get_logger()
+
+router = APIRouter()
+
+def get_ademe_loader(request: Request) -> ADEMELoader:
+    loader = getattr(request.app.state, "ademe_loader", None)
+    if loader is None:
+        raise HTTPException(status_code=503, detail="Facteurs ADEME non chargés")
+    return loader
+
+def _factor_summary(factor, score: Optional[float] = None) -> Dict:
+    summary = {
+        "ademe_id": factor.ademe_id,
+        "nom": factor.nom,
+        "category": factor.category,
+        "unit": factor.unit,
+        "value": factor.value,
+        "scope": factor.scope,
+        "uncertainty": factor.uncertainty
+    }
+    if score is not None:
+        summary["score"] = round(score, 4)
+    return summary
+
+@router.get("/factors/search")
+async def search_factors(request: Request,
+                         q: str = Query(..., min_length=1, max_length=200),
+                         limit: int = Query(10, ge=1, le=100),
+                         prefix: bool = Query(False, description="Complète le dernier mot (typeahead)")) -> Dict:
+    loader = get_ademe_loader(request)
+    started = time.perf_counter()
+    hits = loader.search_factors_ranked(q, limit=limit, prefix=prefix)
+    return {
+        "query": q,
+        "count": len(hits),
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+        "results": [_factor_summary(factor, score) for factor, score in hits]
+    }
+
+@router.get("/factors/autocomplete")
+async def autocomplete_factors(request: Request,
+                               q: str = Query(..., min_length=1, max_length=200),
+                               limit: int = Query(8, ge=1, le=25)) -> List[Dict]:
+    loader = get_ademe_loader(request)
+    return [
+        {"ademe_id": factor.ademe_id, "nom": factor.nom, "unit": factor.unit}
+        for factor, _ in loader.search_factors_ranked(q, limit=limit, prefix=True)
+    ]
+
+@router.get("/factors/{ademe_id}")
+async def get_factor(request: Request, ademe_id: str) -> Dict:
+    factor = get_ademe_loader(request).get_factor(ademe_id)
+    if factor is None:
+        raise HTTPException(status_code=404, detail=f"Facteur {ademe_id} introuvable")
+    return _factor_summary(factor)
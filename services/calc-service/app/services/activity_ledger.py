@@ -0,0 +1,228 @@
+"""Columnar activity ledger for batch calculations.
+
+Questionnaires are flattened into one row per activity line, in the order
+``CalculationEngine`` traces them: (company, source, quantity, unit, scope)
+plus either a (category, unit) factor request or a fixed factor. Distinct
+factor requests are resolved once for the whole batch, joined back with a
+single ``take``, and emissions are grouped by (company, sub-total) with
+``bincount``, then added into their scope in the order ``CalculationEngine``
+adds its sub-totals, so batch totals are bit-identical to the scalar path.
+Traces are sliced out of the same arrays.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Shared with the per-questionnaire code paths in CalculationEngine
+VEHICLE_FACTORS = {
+    "essence": "Essence",
+    "diesel": "Gazole",
+    "electrique": "Électricité",
+    "hybride": "Essence"
+}
+COMMUTE_FACTORS = {
+    "voiture": "Voiture particulière",
+    "transport_commun": "Transport en commun",
+    "velo": "Vélo",
+    "marche": "Marche",
+    "mixte": "Transport mixte"
+}
+WASTE_FACTORS = {
+    "incineration": 0.5,
+    "enfouissement": 0.8,
+    "compostage": 0.1,
+    "recyclage": 0.05
+}
+DEFAULT_WASTE_FACTOR = 0.3
+PURCHASE_FACTORS = [
+    ("matieresPremières", "Matières premières", 0.5),
+    ("equipements", "Équipements", 0.3),
+    ("services", "Services", 0.2),
+]
+DEFAULT_ELECTRICITY_FACTOR = 0.0579
+ELECTRICITY_SOURCE = "Électricité réseau France"
+DEFAULT_ELECTRICITY_SOURCE = "Électricité (facteur par défaut)"
+COMMUTE_DAYS = 220
+
+# The sub-totals CalculationEngine adds into each scope, in that order, with their scope
+SUBTOTALS = (
+    ("combustibles", 1), ("vehicules", 1), ("electricite", 2),
+    ("deplacements", 3), ("trajets", 3), ("achats", 3), ("dechets", 3),
+)
+SUBTOTAL_IDS = {name: index for index, (name, _) in enumerate(SUBTOTALS)}
+
+
+LINE_FIELDS = ("company", "source", "quantity", "unit", "scope", "subtotal", "request", "fixed_factor")
+LINE_DTYPES = (np.int64, object, np.float64, object, np.int64, np.int64, np.int64, np.float64)
+
+
+class ActivityLedger:
+    def __init__(self, n_companies: int):
+        self.n_companies = n_companies
+        # One tuple per line in LINE_FIELDS order; request indexes self.requests, -1 for a fixed factor
+        self.lines: List[tuple] = []
+        self.requests: List[Tuple[str, str]] = []
+        self._request_ids: Dict[Tuple[str, str], int] = {}
+
+    def add(self, company: int, source: str, quantity: float, unit: str, subtotal: str,
+            lookup: Optional[Tuple[str, str]] = None, factor: float = np.nan):
+        subtotal_id = SUBTOTAL_IDS[subtotal]
+        scope = SUBTOTALS[subtotal_id][1]
+        request = -1
+        if lookup is not None:
+            request = self._request_ids.get(lookup)
+            if request is None:
+                request = self._request_ids[lookup] = len(self.requests)
+                self.requests.append(lookup)
+        self.lines.append((company, source, quantity, unit, scope, subtotal_id, request, factor))
+
+    def column(self, name: str) -> np.ndarray:
+        position = LINE_FIELDS.index(name)
+        dtype = LINE_DTYPES[position]
+        values = (line[position] for line in self.lines)
+        if dtype is object:
+            return np.array(list(values), dtype=object)
+        return np.fromiter(values, dtype=dtype, count=len(self.lines))
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+
+def flatten_questionnaires(questionnaires: Sequence[Dict]) -> ActivityLedger:
+    ledger = ActivityLedger(len(questionnaires))
+    for company, data in enumerate(questionnaires):
+        energie = data.get("energie", {})
+        transport = data.get("transport", {})
+        achats = data.get("achats", {})
+        dechets = data.get("dechets", {})
+
+        # Scope 1
+        gaz_kwh = energie.get("gaz", 0)
+        if gaz_kwh > 0:
+            ledger.add(company, "Gaz naturel", gaz_kwh, "kWh", "combustibles", ("Gaz naturel", "kWh"))
+        fioul_litres = energie.get("fioul", 0)
+        if fioul_litres > 0:
+            ledger.add(company, "Fioul domestique", fioul_litres, "litres", "combustibles", ("Fioul", "litre"))
+        for energie_item in energie.get("autresEnergies", []):
+            type_energie = energie_item.get("type", "")
+            quantite = energie_item.get("quantite", 0)
+            unite = energie_item.get("unite", "")
+            if quantite > 0:
+                ledger.add(company, type_energie, quantite, unite, "combustibles", (type_energie, unite))
+        for vehicule in transport.get("vehiculesEntreprise", []):
+            type_carburant = vehicule.get("type", "")
+            nombre = vehicule.get("nombre", 0)
+            kilometrage = vehicule.get("kilometrage", 0)
+            if nombre > 0 and kilometrage > 0:
+                factor_name = VEHICLE_FACTORS.get(type_carburant, "Essence")
+                ledger.add(company, f"Véhicules {type_carburant}", nombre * kilometrage, "km", "vehicules",
+                           (f"Véhicule {factor_name}", "km"))
+
+        # Scope 2, with a default factor when Base Carbone has none
+        electricite_kwh = energie.get("electricite", 0)
+        if electricite_kwh > 0:
+            ledger.add(company, ELECTRICITY_SOURCE, electricite_kwh, "kWh", "electricite", ("Électricité", "kWh"),
+                       DEFAULT_ELECTRICITY_FACTOR)
+
+        # Scope 3
+        deplacements = transport.get("deplacementsProfessionnels", {})
+        for key, source, category in (("voiture", "Déplacements voiture", "Voiture particulière"),
+                                      ("train", "Déplacements train", "Train"),
+                                      ("avion", "Déplacements avion", "Avion")):
+            km = deplacements.get(key, 0)
+            if km > 0:
+                ledger.add(company, source, km, "km", "deplacements", (category, "km"))
+        trajets = transport.get("trajetsEmployes", {})
+        km_domicile_travail = trajets.get("domicileTravail", 0)
+        if km_domicile_travail > 0:
+            mode_transport = trajets.get("modeTransport", "voiture")
+            factor_name = COMMUTE_FACTORS.get(mode_transport, "Voiture particulière")
+            ledger.add(company, f"Trajets employés {mode_transport}", km_domicile_travail * 2 * COMMUTE_DAYS,
+                       "km", "trajets", (factor_name, "km"))
+        for key, source, factor in PURCHASE_FACTORS:
+            amount = achats.get(key, 0)
+            if amount > 0:
+                ledger.add(company, source, amount, "k€", "achats", factor=factor)
+        production = dechets.get("production", 0)
+        if production > 0:
+            traitement = dechets.get("traitement", "recyclage")
+            ledger.add(company, f"Déchets {traitement}", production, "tonnes", "dechets",
+                       factor=WASTE_FACTORS.get(traitement, DEFAULT_WASTE_FACTOR))
+    return ledger
+
+
+def evaluate_ledger(ledger: ActivityLedger, resolve: Callable[[str, str], object],
+                    with_text: bool = True) -> Dict[str, np.ndarray]:
+    """Join the ledger against resolved factors and total it per (company, scope).
+
+    Lines whose factor cannot be resolved and have no default are dropped,
+    as the per-questionnaire engine skips them. ``with_text=False`` skips the
+    source/unit columns, which only traces need.
+    """
+    resolved = [resolve(category, unit) for category, unit in ledger.requests]
+    request_value = np.array([f.value if f else np.nan for f in resolved] + [np.nan], dtype=float)
+    request_uncertainty = np.array([f.uncertainty if f else np.nan for f in resolved] + [np.nan], dtype=float)
+    request_factor_id = np.array([f.ademe_id if f else None for f in resolved] + [None], dtype=object)
+
+    request = ledger.column("request")
+    fixed = ledger.column("fixed_factor")
+    # -1 (fixed factor) picks the trailing NaN sentinel
+    factor = request_value[request]
+    found = ~np.isnan(factor)
+    factor = np.where(found, factor, fixed)
+    keep = ~np.isnan(factor)
+    defaulted = (request >= 0) & ~found & keep
+
+    company = ledger.column("company")[keep]
+    scope = ledger.column("scope")[keep]
+    quantity = ledger.column("quantity")[keep]
+    factor = factor[keep]
+    emission = quantity * factor
+    found = found[keep]
+    request = request[keep]
+
+    n = ledger.n_companies
+    subtotal = ledger.column("subtotal")[keep]
+    by_subtotal = np.bincount(
+        company * len(SUBTOTALS) + subtotal, weights=emission, minlength=n * len(SUBTOTALS)
+    ).reshape(n, len(SUBTOTALS))
+    # Float addition is not associative: add sub-totals one by one, as the scalar path does
+    by_scope = np.zeros((n, 3))
+    for index, (_, subtotal_scope) in enumerate(SUBTOTALS):
+        by_scope[:, subtotal_scope - 1] += by_subtotal[:, index]
+    lines = {
+        "company": company,
+        "quantity": quantity,
+        "scope": scope,
+        "factor": factor,
+        "emission": emission,
+        "factor_id": np.where(found, request_factor_id[request], None),
+        "uncertainty": np.where(found, request_uncertainty[request], np.nan),
+        "scope_totals": by_scope,
+    }
+    if with_text:
+        source = ledger.column("source")
+        source[defaulted] = DEFAULT_ELECTRICITY_SOURCE
+        lines["source"] = source[keep]
+        lines["unit"] = ledger.column("unit")[keep]
+    return lines
+
+
+def ledger_traces(lines: Dict[str, np.ndarray], n_companies: int) -> List[List[Dict]]:
+    bounds = np.searchsorted(lines["company"], np.arange(n_companies + 1))
+    columns = [lines[name].tolist() for name in
+               ("source", "quantity", "unit", "factor", "emission", "scope", "factor_id", "uncertainty")]
+    rows = [
+        {
+            "source": source,
+            "quantity": quantity,
+            "unit": unit,
+            "emission_factor": factor,
+            "emission": emission,
+            "scope": scope,
+            "factor_id": factor_id,
+            "uncertainty": None if factor_id is None else uncertainty
+        }
+        for source, quantity, unit, factor, emission, scope, factor_id, uncertainty in zip(*columns)
+    ]
+    return [rows[bounds[i]:bounds[i + 1]] for i in range(n_companies)]
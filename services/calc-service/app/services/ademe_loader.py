@@ -1,22 +1,57 @@
-import pandas as pd
 import asyncio
+import pandas as pd
 from pathlib import Path
 from sqlalchemy.orm import Session
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 import structlog
 
 from ..database import get_db
 from ..models.emission_factor import EmissionFactor
 from ..config import settings
+from .factor_index import FactorLookupIndex
+from .factor_ingest import FACTOR_COLUMNS, IngestStats, diff_releases, ingest_csv, ingest_snapshot, read_release, write_factors
+from .factor_search import FactorSearchIndex
+from .factor_shm import DEFAULT_WAIT_SECONDS, SharedFactorCache
+from .factor_table import FLOAT_COLUMNS, FactorRow, FactorTable, version_sort_key
+from .factor_snapshot import FactorSnapshot, default_snapshot_path, open_fresh_snapshot
 
 logger = structlog.get_logger()
 
+# Pinned (historical) factor sets whose lookup index is kept around
+MAX_PINNED_INDEXES = 4
+
 class ADEMELoader:
     def __init__(self):
         self.data_path = Path(settings.ADEME_DATA_PATH)
-        self.factors_cache: Dict[str, EmissionFactor] = {}
+        self.snapshot_path = Path(
+            getattr(settings, "ADEME_SNAPSHOT_PATH", None) or default_snapshot_path(self.data_path)
+        )
+        self.base_version = getattr(settings, "ADEME_VERSION", None) or "v17"
+        self.snapshot: Optional[FactorSnapshot] = None
+        self.factors_cache: FactorTable = FactorTable.from_rows([], lambda name: [], version=self.base_version)
+        self.last_ingest: Optional[IngestStats] = None
+        # Bumped on every cache reload so consumers can drop what they derived from the old factors
+        self.factors_version = 0
+        self._lookup_index: Optional[FactorLookupIndex] = None
+        self._search_index: Optional[FactorSearchIndex] = None
+        # (table, factors_version) each index was built from
+        self._lookup_indexed: Tuple = (None, -1)
+        self._search_indexed: Tuple = (None, -1)
+        self._pinned_indexes: Dict[str, FactorLookupIndex] = {}
+        # Workers of a host share one published table when a segment name is configured
+        shared_name = getattr(settings, "FACTOR_CACHE_SHM_NAME", None)
+        self.shared_cache: Optional[SharedFactorCache] = SharedFactorCache(shared_name) if shared_name else None
         
     async def load_factors_if_needed(self):
+        if self.shared_cache is not None and not self.shared_cache.claim_publisher():
+            if await self._attach_when_published():
+                return
+        
+        # A fresh compiled snapshot replaces both the CSV parse and the DB round trip
+        self.snapshot = open_fresh_snapshot(self.data_path, self.snapshot_path)
+        if self.snapshot is not None:
+            logger.info(f"Snapshot ADEME mappé: {len(self.snapshot)} facteurs ({self.snapshot.factor_set})")
+        
         db = next(get_db())
         try:
             existing_count = db.query(EmissionFactor).count()
@@ -30,34 +65,16 @@ class ADEMELoader:
             db.close()
     
     async def load_ademe_factors(self):
-        if not self.data_path.exists():
-            raise FileNotFoundError(f"Fichier ADEME non trouvé: {self.data_path}")
-        
-        logger.info(f"Chargement des facteurs ADEME depuis {self.data_path}")
-        
-        df = pd.read_csv(self.data_path, encoding='utf-8')
-        
-        df_elements = df[df['Type Ligne'] == 'Elément'].copy()
-        df_valid = df_elements[df_elements['Statut de l\'élément'] == 'Valide générique'].copy()
-        
-        logger.info(f"Traitement de {len(df_valid)} facteurs d'émission valides")
-        
         db = next(get_db())
         try:
-            batch_size = 1000
-            for i in range(0, len(df_valid), batch_size):
-                batch = df_valid.iloc[i:i+batch_size]
-                factors = []
-                
-                for _, row in batch.iterrows():
-                    factor = self._create_emission_factor(row)
-                    if factor:
-                        factors.append(factor)
-                
-                db.add_all(factors)
-                db.commit()
-                logger.info(f"Chargé {len(factors)} facteurs (batch {i//batch_size + 1})")
-        
+            if self.snapshot is not None:
+                logger.info(f"Chargement des facteurs ADEME depuis le snapshot {self.snapshot_path}")
+                stats = ingest_snapshot(db, EmissionFactor, self.snapshot)
+            else:
+                if not self.data_path.exists():
+                    raise FileNotFoundError(f"Fichier ADEME non trouvé: {self.data_path}")
+                logger.info(f"Chargement des facteurs ADEME depuis {self.data_path}")
+                stats = ingest_csv(db, EmissionFactor, self.data_path, version=self.base_version)
         except Exception as e:
             db.rollback()
             logger.error(f"Erreur lors du chargement: {e}")
@@ -65,97 +82,210 @@ class ADEMELoader:
         finally:
             db.close()
         
+        logger.info(
+            f"Chargement des facteurs ADEME terminé: {stats.rows_written} facteurs "
+            f"en {stats.seconds:.2f}s ({stats.rows_per_second:.0f} lignes/s)"
+        )
+        self.last_ingest = stats
         await self.load_factors_to_cache()
-        logger.info("Chargement des facteurs ADEME terminé")
     
-    def _create_emission_factor(self, row: pd.Series) -> Optional[EmissionFactor]:
+    async def load_factors_to_cache(self, with_releases: bool = True):
+        if self.snapshot is not None:
+            table = FactorTable.from_snapshot(self.snapshot)
+            source = "le snapshot"
+        else:
+            table = self._load_table_from_db()
+            source = "la base"
+        if with_releases:
+            # Releases loaded with upgrade_factors live in the DB on top of the base set
+            self._replay_releases(table)
+        self._publish(table)
+        logger.info(
+            f"Cache des facteurs mis à jour depuis {source}: {len(self.factors_cache)} facteurs "
+            f"({self.factors_cache.version}), {self.factors_cache.nbytes() / 1024:.0f} Ko hors texte différé"
+        )
+    
+    def _publish(self, table: FactorTable, share: bool = True):
+        self.factors_cache = table
+        self.factors_version += 1
+        self._pinned_indexes = {}
+        self._build_lookup_index()
+        self._build_search_index()
+        if share and self.shared_cache is not None:
+            self.shared_cache.publish(table)
+    
+    async def _attach_when_published(self) -> bool:
+        timeout = getattr(settings, "FACTOR_CACHE_SHM_WAIT_SECONDS", None) or DEFAULT_WAIT_SECONDS
         try:
-            total_emission = self._safe_float(row.get('Total poste non décomposé', 0))
-            if total_emission <= 0:
-                return None
-            
-            category = self._clean_category(row.get('Code de la catégorie', ''))
-            if not category:
-                return None
-            
-            factor = EmissionFactor(
-                ademe_id=str(row.get('Identifiant de l\'élément', '')),
-                nom=str(row.get('Nom base français', '')),
-                category=category,
-                unit=str(row.get('Unité français', '')),
-                value=total_emission,
-                co2_fossil=self._safe_float(row.get('CO2f', 0)),
-                ch4_fossil=self._safe_float(row.get('CH4f', 0)),
-                ch4_biogenic=self._safe_float(row.get('CH4b', 0)),
-                n2o=self._safe_float(row.get('N2O', 0)),
-                co2_biogenic=self._safe_float(row.get('CO2b', 0)),
-                scope=self._determine_scope(category),
-                source='ADEME',
-                version='v17',
-                status='valid',
-                uncertainty=self._safe_float(row.get('Incertitude', 0)),
-                tags=str(row.get('Tags français', '')),
-                comment=str(row.get('Commentaire français', ''))
-            )
-            
-            return factor
-            
-        except Exception as e:
-            logger.warning(f"Erreur lors de la création du facteur: {e}")
-            return None
+            await self.shared_cache.wait_published(timeout)
+        except TimeoutError as e:
+            # The publishing worker died before its first publish: load locally and publish instead
+            logger.warning(f"{e}, chargement local des facteurs")
+            return False
+        self._attach_shared()
+        return True
+    
+    def _attach_shared(self):
+        self.snapshot = self.shared_cache.attach()
+        self._publish(FactorTable.from_snapshot(self.snapshot), share=False)
+        logger.info(
+            f"Cache des facteurs attaché en mémoire partagée: {len(self.factors_cache)} facteurs "
+            f"({self.factors_cache.version}, génération {self.shared_cache.generation})"
+        )
     
-    def _safe_float(self, value) -> float:
+    def sync_shared(self):
+        """Re-attach if another worker published a newer factor table since we last looked."""
+        if self.shared_cache is not None and self.shared_cache.generation and self.shared_cache.is_stale():
+            self._attach_shared()
+    
+    def close(self):
+        if self.shared_cache is not None:
+            self.shared_cache.close()
+    
+    def _stored_versions(self) -> List[str]:
+        db = next(get_db())
         try:
-            if pd.isna(value) or value == '':
-                return 0.0
-            return float(str(value).replace(',', '.'))
-        except (ValueError, TypeError):
-            return 0.0
-    
-    def _clean_category(self, category: str) -> str:
-        if not category or pd.isna(category):
-            return ''
-        return str(category).strip()
-    
-    def _determine_scope(self, category: str) -> int:
-        category_lower = category.lower()
-        
-        if any(term in category_lower for term in ['combustible', 'gaz', 'fioul', 'essence', 'diesel']):
-            return 1
-        elif any(term in category_lower for term in ['électricité', 'electricite', 'réseau', 'chauffage urbain']):
-            return 2
-        else:
-            return 3
+            versions = [row[0] for row in db.query(EmissionFactor.version).distinct().all()]
+        finally:
+            db.close()
+        return sorted(versions, key=version_sort_key)
     
-    async def load_factors_to_cache(self):
+    def _load_table_from_db(self) -> FactorTable:
+        versions = self._stored_versions()
+        base = versions[0] if versions else self.base_version
+        columns = [EmissionFactor.ademe_id, EmissionFactor.nom, EmissionFactor.category, EmissionFactor.unit,
+                   EmissionFactor.scope] + [getattr(EmissionFactor, name) for name in FLOAT_COLUMNS]
         db = next(get_db())
         try:
-            factors = db.query(EmissionFactor).all()
-            self.factors_cache = {f.ademe_id: f for f in factors}
-            logger.info(f"Cache des facteurs mis à jour: {len(self.factors_cache)} facteurs")
+            rows = db.query(*columns).filter(
+                EmissionFactor.version == base, EmissionFactor.status != "removed"
+            ).all()
         finally:
             db.close()
+        ademe_ids = [str(row[0]) for row in rows]
+        
+        def text_source(name: str) -> List[str]:
+            # tags and comment stay in the database until something reads them
+            db = next(get_db())
+            try:
+                values = dict(
+                    db.query(EmissionFactor.ademe_id, getattr(EmissionFactor, name))
+                    .filter(EmissionFactor.version == base).all()
+                )
+            finally:
+                db.close()
+            return [values.get(ademe_id) or "" for ademe_id in ademe_ids]
+        
+        return FactorTable.from_rows(rows, text_source, version=base)
     
-    def get_factor_by_category_and_unit(self, category: str, unit: str) -> Optional[EmissionFactor]:
-        for factor in self.factors_cache.values():
-            if (category.lower() in factor.category.lower() and 
-                unit.lower() in factor.unit.lower()):
-                return factor
-        return None
+    def _replay_releases(self, table: FactorTable):
+        current = version_sort_key(table.version)
+        for version in self._stored_versions():
+            if version in table.versions or version_sort_key(version) <= current:
+                continue
+            columns = [EmissionFactor.status] + [getattr(EmissionFactor, name) for name in FACTOR_COLUMNS]
+            db = next(get_db())
+            try:
+                rows = db.query(*columns).filter(EmissionFactor.version == version).all()
+            finally:
+                db.close()
+            frame = pd.DataFrame([tuple(row) for row in rows], columns=["status"] + FACTOR_COLUMNS)
+            removed = frame[frame["status"] == "removed"]["ademe_id"].astype(str).tolist()
+            table.apply_release(version, frame[frame["status"] != "removed"], removed)
     
-    def search_factors(self, query: str, limit: int = 10) -> List[EmissionFactor]:
-        query_lower = query.lower()
-        results = []
+    async def upgrade_factors(self, csv_path: Union[str, Path], version: str) -> Dict:
+        """Load a new Base Carbone release as a diff against the current factor set.
+        
+        Only changed and added factors are written, under ``version``; removed
+        ones get a 'removed' tombstone row. The cache is patched in place and
+        earlier factor sets stay available through ``factor_set=``.
+        """
+        table = self.factors_cache
+        if version in table.versions:
+            raise ValueError(f"Jeu de facteurs déjà chargé: {version}")
+        if version_sort_key(version) <= version_sort_key(table.version):
+            raise ValueError(f"{version} n'est pas postérieur au jeu courant {table.version}")
         
-        for factor in self.factors_cache.values():
-            if (query_lower in factor.nom.lower() or 
-                query_lower in factor.category.lower() or
-                query_lower in factor.tags.lower()):
-                results.append(factor)
-                if len(results) >= limit:
-                    break
+        release = read_release(csv_path)
+        current = table.to_frame()
+        updated, removed = diff_releases(current, release)
         
-        return results
+        db = next(get_db())
+        try:
+            write_factors(db, EmissionFactor, updated, version)
+            write_factors(db, EmissionFactor, removed, version, status="removed")
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Erreur lors de la mise à jour vers {version}: {e}")
+            raise
+        finally:
+            db.close()
+        
+        added = int((~updated["ademe_id"].isin(current["ademe_id"])).sum())
+        table.apply_release(version, updated, removed["ademe_id"].tolist())
+        # Same table object, patched: only derived indexes are rebuilt
+        self._publish(table)
+        summary = {
+            "version": version,
+            "previous_version": table.versions[-2],
+            "added": added,
+            "changed": len(updated) - added,
+            "removed": len(removed),
+            "unchanged": len(release) - len(updated),
+        }
+        logger.info(f"Facteurs ADEME mis à jour: {summary}")
+        return summary
+    
+    def _build_lookup_index(self) -> FactorLookupIndex:
+        self._lookup_index = FactorLookupIndex(self.factors_cache.values())
+        self._lookup_indexed = (self.factors_cache, self.factors_version)
+        return self._lookup_index
+    
+    def _is_stale(self, indexed: Tuple) -> bool:
+        # factors_cache is public; rebuild if it was swapped outside load_factors_to_cache
+        table, version = indexed
+        return table is not self.factors_cache or version != self.factors_version
+    
+    def _pinned_index(self, factor_set: str) -> FactorLookupIndex:
+        index = self._pinned_indexes.get(factor_set)
+        if index is None:
+            index = FactorLookupIndex(self.factors_cache.at(factor_set).values())
+            if len(self._pinned_indexes) >= MAX_PINNED_INDEXES:
+                self._pinned_indexes.pop(next(iter(self._pinned_indexes)))
+            self._pinned_indexes[factor_set] = index
+        return index
+    
+    def get_factor_by_category_and_unit(self, category: str, unit: str,
+                                        factor_set: Optional[str] = None) -> Optional[FactorRow]:
+        self.sync_shared()
+        if factor_set is not None and factor_set != self.factors_cache.version:
+            return self._pinned_index(factor_set).lookup(category, unit)
+        index = self._lookup_index
+        if index is None or self._is_stale(self._lookup_indexed):
+            index = self._build_lookup_index()
+        return index.lookup(category, unit)
+    
+    def _build_search_index(self) -> FactorSearchIndex:
+        self._search_index = FactorSearchIndex(self.factors_cache.values())
+        self._search_indexed = (self.factors_cache, self.factors_version)
+        return self._search_index
+    
+    def search_factors_ranked(self, query: str, limit: int = 10,
+                              prefix: bool = False) -> List[Tuple[FactorRow, float]]:
+        self.sync_shared()
+        index = self._search_index
+        if index is None or self._is_stale(self._search_indexed):
+            index = self._build_search_index()
+        return index.search(query, limit=limit, prefix=prefix)
+    
+    def search_factors(self, query: str, limit: int = 10, prefix: bool = False) -> List[FactorRow]:
+        return [factor for factor, _ in self.search_factors_ranked(query, limit, prefix)]
+    
+    def get_factor(self, ademe_id: str) -> Optional[FactorRow]:
+        self.sync_shared()
+        return self.factors_cache.get(ademe_id)
     
-    def get_factors_by_scope(self, scope: int) -> List[EmissionFactor]:
-        return [f for f in self.factors_cache.values() if f.scope == scope]
+    def get_factors_by_scope(self, scope: int) -> List[FactorRow]:
+        self.sync_shared()
+        return self.factors_cache.rows_in_scope(scope)
@@ -1,28 +1,70 @@
 from typing import Dict, List, Optional, Tuple
+import numpy as np
 import structlog
 from datetime import datetime
-from ..models.emission_factor import EmissionFactor
+from ..services.activity_ledger import (
+    COMMUTE_DAYS, COMMUTE_FACTORS, DEFAULT_ELECTRICITY_FACTOR, DEFAULT_ELECTRICITY_SOURCE, DEFAULT_WASTE_FACTOR,
+    ELECTRICITY_SOURCE, PURCHASE_FACTORS, VEHICLE_FACTORS, WASTE_FACTORS,
+    evaluate_ledger, flatten_questionnaires, ledger_traces
+)
 from ..services.ademe_loader import ADEMELoader
+from ..services.factor_table import FactorRow
+from ..services.uncertainty import DEFAULT_PERCENTILES, MonteCarloPropagator, ledger_from_traces
 
 logger = structlog.get_logger()
 
+MAX_RESOLVED_FACTORS = 1024
+
 class CalculationEngine:
+    """Stateless per call: the trace lives in the call, so one engine serves concurrent requests.
+    
+    Resolved (factor set, category, unit) -> factor entries are memoized per cache
+    version and dropped as soon as ADEMELoader publishes a new one. ``factor_set``
+    pins a calculation to an earlier ADEME release; None means the current one.
+    """
+    
     def __init__(self, ademe_loader: ADEMELoader):
         self.ademe_loader = ademe_loader
-        self.calculation_trace = []
+        self._resolved: Tuple[int, Dict[Tuple[Optional[str], str, str], Optional[FactorRow]]] = (-1, {})
+    
+    def _factor_set_label(self, factor_set: Optional[str]) -> str:
+        # Called once per calculation: pick up a table republished by another worker first
+        self.ademe_loader.sync_shared()
+        # Fails fast with KeyError on a release the cache does not know
+        table = self.ademe_loader.factors_cache
+        return table.versions[table.version_index(factor_set)]
     
-    def calculate_emissions(self, questionnaire_data: Dict) -> Dict:
-        self.calculation_trace = []
+    def _resolve_factor(self, category: str, unit: str, factor_set: Optional[str] = None) -> Optional[FactorRow]:
+        version, resolved = self._resolved
+        if version != self.ademe_loader.factors_version:
+            # Swap in a fresh plan atomically; in-flight calls keep the one they read
+            version = self.ademe_loader.factors_version
+            resolved = {}
+            self._resolved = (version, resolved)
+        key = (factor_set, category, unit)
+        try:
+            return resolved[key]
+        except KeyError:
+            factor = self.ademe_loader.get_factor_by_category_and_unit(category, unit, factor_set)
+            if len(resolved) >= MAX_RESOLVED_FACTORS:
+                # autresEnergies types come from user input; keep the plan bounded
+                resolved.clear()
+            resolved[key] = factor
+            return factor
+    
+    def calculate_emissions(self, questionnaire_data: Dict, factor_set: Optional[str] = None) -> Dict:
+        trace: List[Dict] = []
         
         try:
+            ademe_version = self._factor_set_label(factor_set)
             results = {
-                "scope1": self._calculate_scope1(questionnaire_data),
-                "scope2": self._calculate_scope2(questionnaire_data),
-                "scope3": self._calculate_scope3(questionnaire_data),
-                "trace": self.calculation_trace,
+                "scope1": self._calculate_scope1(questionnaire_data, trace, factor_set),
+                "scope2": self._calculate_scope2(questionnaire_data, trace, factor_set),
+                "scope3": self._calculate_scope3(questionnaire_data, trace, factor_set),
+                "trace": trace,
                 "metadata": {
                     "calculation_date": datetime.now().isoformat(),
-                    "ademe_version": "v17",
+                    "ademe_version": ademe_version,
                     "methodology": "ADEME Base Carbone"
                 }
             }
@@ -44,58 +86,142 @@ class CalculationEngine:
             logger.error(f"Erreur lors du calcul: {e}")
             raise
     
-    def _calculate_scope1(self, data: Dict) -> float:
+    def calculate_emissions_batch(self, questionnaires: List[Dict], with_trace: bool = True,
+                                  factor_set: Optional[str] = None) -> List[Dict]:
+        """Same results as calculate_emissions per questionnaire, computed from one activity ledger."""
+        n = len(questionnaires)
+        ademe_version = self._factor_set_label(factor_set)
+        lines = evaluate_ledger(
+            flatten_questionnaires(questionnaires),
+            lambda category, unit: self._resolve_factor(category, unit, factor_set),
+            with_text=with_trace
+        )
+        scope_totals = lines["scope_totals"]
+        totals = scope_totals.sum(axis=1)
+        
+        effectif = np.array([q.get("entreprise", {}).get("effectif", 1) for q in questionnaires], dtype=float)
+        chiffre_affaires = np.array(
+            [q.get("entreprise", {}).get("chiffreAffaires", 0) for q in questionnaires], dtype=float
+        )
+        par_employe = totals / np.maximum(effectif, 1)
+        par_chiffre_affaires = np.where(chiffre_affaires > 0, totals / np.maximum(chiffre_affaires, 1), 0)
+        
+        traces = ledger_traces(lines, n) if with_trace else [None] * n
+        metadata = {
+            "calculation_date": datetime.now().isoformat(),
+            "ademe_version": ademe_version,
+            "methodology": "ADEME Base Carbone"
+        }
+        results = []
+        for i, (scope1, scope2, scope3) in enumerate(scope_totals.tolist()):
+            result = {
+                "scope1": scope1,
+                "scope2": scope2,
+                "scope3": scope3,
+                "metadata": dict(metadata),
+                "total": scope1 + scope2 + scope3,
+                "intensites": {
+                    "par_employe": float(par_employe[i]),
+                    "par_chiffre_affaires": float(par_chiffre_affaires[i])
+                }
+            }
+            if with_trace:
+                result["trace"] = traces[i]
+            results.append(result)
+        return results
+    
+    def calculate_emissions_with_uncertainty(self, questionnaires: List[Dict], n_samples: int = 10000,
+                                             activity_uncertainty: Optional[float] = None,
+                                             default_uncertainty: float = 0.0,
+                                             percentiles: Tuple[float, ...] = DEFAULT_PERCENTILES,
+                                             seed: Optional[int] = None,
+                                             factor_set: Optional[str] = None) -> List[Dict]:
+        if not questionnaires:
+            return []
+        results = self.calculate_emissions_batch(questionnaires, factor_set=factor_set)
+        
+        ledger = ledger_from_traces([r["trace"] for r in results], default_uncertainty)
+        propagator = MonteCarloPropagator(n_samples=n_samples, percentiles=percentiles, seed=seed)
+        propagated = propagator.propagate(
+            group=ledger["group"],
+            scope=ledger["scope"],
+            factor_key=ledger["factor_key"],
+            emission=ledger["emission"],
+            factor_uncertainty=ledger["factor_uncertainty"],
+            n_groups=len(results),
+            activity_uncertainty=activity_uncertainty
+        )
+        
+        for i, result in enumerate(results):
+            result["incertitude"] = {
+                "methode": "Monte Carlo lognormal (ADEME Incertitude)",
+                "echantillons": n_samples,
+                "total": propagator.summarize(propagated["total_percentiles"][i], propagated["total_mean"][i]),
+                "scope1": propagator.summarize(propagated["scope_percentiles"][i, 0], propagated["scope_mean"][i, 0]),
+                "scope2": propagator.summarize(propagated["scope_percentiles"][i, 1], propagated["scope_mean"][i, 1]),
+                "scope3": propagator.summarize(propagated["scope_percentiles"][i, 2], propagated["scope_mean"][i, 2])
+            }
+        
+        for line, (company, position) in enumerate(zip(ledger["group"].tolist(), ledger["position"].tolist())):
+            results[company]["trace"][position]["percentiles"] = propagator.summarize(
+                propagated["line_percentiles"][line]
+            )
+        
+        return results
+    
+    def _calculate_scope1(self, data: Dict, trace: List[Dict], factor_set: Optional[str] = None) -> float:
         scope1_total = 0.0
         
         energie = data.get("energie", {})
         transport = data.get("transport", {})
         
-        scope1_total += self._calculate_combustibles(energie)
-        scope1_total += self._calculate_vehicules_entreprise(transport.get("vehiculesEntreprise", []))
+        scope1_total += self._calculate_combustibles(energie, trace, factor_set)
+        scope1_total += self._calculate_vehicules_entreprise(transport.get("vehiculesEntreprise", []), trace, factor_set)
         
         return scope1_total
     
-    def _calculate_scope2(self, data: Dict) -> float:
+    def _calculate_scope2(self, data: Dict, trace: List[Dict], factor_set: Optional[str] = None) -> float:
         scope2_total = 0.0
         
         energie = data.get("energie", {})
         
-        scope2_total += self._calculate_electricite(energie.get("electricite", 0))
+        scope2_total += self._calculate_electricite(energie.get("electricite", 0), trace, factor_set)
         
         return scope2_total
     
-    def _calculate_scope3(self, data: Dict) -> float:
+    def _calculate_scope3(self, data: Dict, trace: List[Dict], factor_set: Optional[str] = None) -> float:
         scope3_total = 0.0
         
         transport = data.get("transport", {})
         achats = data.get("achats", {})
         dechets = data.get("dechets", {})
         
-        scope3_total += self._calculate_deplacements_professionnels(transport.get("deplacementsProfessionnels", {}))
-        scope3_total += self._calculate_trajets_employes(transport.get("trajetsEmployes", {}))
-        scope3_total += self._calculate_achats(achats)
-        scope3_total += self._calculate_dechets(dechets)
+        scope3_total += self._calculate_deplacements_professionnels(transport.get("deplacementsProfessionnels", {}), trace, factor_set)
+        scope3_total += self._calculate_trajets_employes(transport.get("trajetsEmployes", {}), trace, factor_set)
+        scope3_total += self._calculate_achats(achats, trace)
+        scope3_total += self._calculate_dechets(dechets, trace)
         
         return scope3_total
     
-    def _calculate_combustibles(self, energie: Dict) -> float:
+    def _calculate_combustibles(self, energie: Dict, trace: List[Dict],
+                                factor_set: Optional[str] = None) -> float:
         total = 0.0
         
         gaz_kwh = energie.get("gaz", 0)
         if gaz_kwh > 0:
-            factor = self.ademe_loader.get_factor_by_category_and_unit("Gaz naturel", "kWh")
+            factor = self._resolve_factor("Gaz naturel", "kWh", factor_set)
             if factor:
                 emission = gaz_kwh * factor.value
                 total += emission
-                self._add_trace("Gaz naturel", gaz_kwh, "kWh", factor.value, emission, 1)
+                self._add_trace(trace, "Gaz naturel", gaz_kwh, "kWh", factor.value, emission, 1, factor)
         
         fioul_litres = energie.get("fioul", 0)
         if fioul_litres > 0:
-            factor = self.ademe_loader.get_factor_by_category_and_unit("Fioul", "litre")
+            factor = self._resolve_factor("Fioul", "litre", factor_set)
             if factor:
                 emission = fioul_litres * factor.value
                 total += emission
-                self._add_trace("Fioul domestique", fioul_litres, "litres", factor.value, emission, 1)
+                self._add_trace(trace, "Fioul domestique", fioul_litres, "litres", factor.value, emission, 1, factor)
         
         autres_energies = energie.get("autresEnergies", [])
         for energie_item in autres_energies:
@@ -104,29 +230,31 @@ class CalculationEngine:
             unite = energie_item.get("unite", "")
             
             if quantite > 0:
-                factor = self.ademe_loader.get_factor_by_category_and_unit(type_energie, unite)
+                factor = self._resolve_factor(type_energie, unite, factor_set)
                 if factor:
                     emission = quantite * factor.value
                     total += emission
-                    self._add_trace(type_energie, quantite, unite, factor.value, emission, 1)
+                    self._add_trace(trace, type_energie, quantite, unite, factor.value, emission, 1, factor)
         
         return total
     
-    def _calculate_electricite(self, electricite_kwh: float) -> float:
+    def _calculate_electricite(self, electricite_kwh: float, trace: List[Dict],
+                               factor_set: Optional[str] = None) -> float:
         if electricite_kwh <= 0:
             return 0.0
         
-        factor = self.ademe_loader.get_factor_by_category_and_unit("Électricité", "kWh")
+        factor = self._resolve_factor("Électricité", "kWh", factor_set)
         if not factor:
-            factor_value = 0.0579
-            self._add_trace("Électricité (facteur par défaut)", electricite_kwh, "kWh", factor_value, electricite_kwh * factor_value, 2)
+            factor_value = DEFAULT_ELECTRICITY_FACTOR
+            self._add_trace(trace, DEFAULT_ELECTRICITY_SOURCE, electricite_kwh, "kWh", factor_value, electricite_kwh * factor_value, 2)
             return electricite_kwh * factor_value
         
         emission = electricite_kwh * factor.value
-        self._add_trace("Électricité réseau France", electricite_kwh, "kWh", factor.value, emission, 2)
+        self._add_trace(trace, ELECTRICITY_SOURCE, electricite_kwh, "kWh", factor.value, emission, 2, factor)
         return emission
     
-    def _calculate_vehicules_entreprise(self, vehicules: List[Dict]) -> float:
+    def _calculate_vehicules_entreprise(self, vehicules: List[Dict], trace: List[Dict],
+                                        factor_set: Optional[str] = None) -> float:
         total = 0.0
         
         for vehicule in vehicules:
@@ -136,133 +264,100 @@ class CalculationEngine:
             
             if nombre > 0 and kilometrage > 0:
                 km_total = nombre * kilometrage
-                
-                factor_mapping = {
-                    "essence": "Essence",
-                    "diesel": "Gazole",
-                    "electrique": "Électricité",
-                    "hybride": "Essence"
-                }
-                
-                factor_name = factor_mapping.get(type_carburant, "Essence")
-                factor = self.ademe_loader.get_factor_by_category_and_unit(f"Véhicule {factor_name}", "km")
+                factor_name = VEHICLE_FACTORS.get(type_carburant, "Essence")
+                factor = self._resolve_factor(f"Véhicule {factor_name}", "km", factor_set)
                 
                 if factor:
                     emission = km_total * factor.value
                     total += emission
-                    self._add_trace(f"Véhicules {type_carburant}", km_total, "km", factor.value, emission, 1)
+                    self._add_trace(trace, f"Véhicules {type_carburant}", km_total, "km", factor.value, emission, 1, factor)
         
         return total
     
-    def _calculate_deplacements_professionnels(self, deplacements: Dict) -> float:
+    def _calculate_deplacements_professionnels(self, deplacements: Dict, trace: List[Dict],
+                                               factor_set: Optional[str] = None) -> float:
         total = 0.0
         
         voiture_km = deplacements.get("voiture", 0)
         if voiture_km > 0:
-            factor = self.ademe_loader.get_factor_by_category_and_unit("Voiture particulière", "km")
+            factor = self._resolve_factor("Voiture particulière", "km", factor_set)
             if factor:
                 emission = voiture_km * factor.value
                 total += emission
-                self._add_trace("Déplacements voiture", voiture_km, "km", factor.value, emission, 3)
+                self._add_trace(trace, "Déplacements voiture", voiture_km, "km", factor.value, emission, 3, factor)
         
         train_km = deplacements.get("train", 0)
         if train_km > 0:
-            factor = self.ademe_loader.get_factor_by_category_and_unit("Train", "km")
+            factor = self._resolve_factor("Train", "km", factor_set)
             if factor:
                 emission = train_km * factor.value
                 total += emission
-                self._add_trace("Déplacements train", train_km, "km", factor.value, emission, 3)
+                self._add_trace(trace, "Déplacements train", train_km, "km", factor.value, emission, 3, factor)
         
         avion_km = deplacements.get("avion", 0)
         if avion_km > 0:
-            factor = self.ademe_loader.get_factor_by_category_and_unit("Avion", "km")
+            factor = self._resolve_factor("Avion", "km", factor_set)
             if factor:
                 emission = avion_km * factor.value
                 total += emission
-                self._add_trace("Déplacements avion", avion_km, "km", factor.value, emission, 3)
+                self._add_trace(trace, "Déplacements avion", avion_km, "km", factor.value, emission, 3, factor)
         
         return total
     
-    def _calculate_trajets_employes(self, trajets: Dict) -> float:
+    def _calculate_trajets_employes(self, trajets: Dict, trace: List[Dict],
+                                    factor_set: Optional[str] = None) -> float:
         total = 0.0
         
         km_domicile_travail = trajets.get("domicileTravail", 0)
         mode_transport = trajets.get("modeTransport", "voiture")
         
         if km_domicile_travail > 0:
-            km_annuel = km_domicile_travail * 2 * 220
-            
-            factor_mapping = {
-                "voiture": "Voiture particulière",
-                "transport_commun": "Transport en commun",
-                "velo": "Vélo",
-                "marche": "Marche",
-                "mixte": "Transport mixte"
-            }
-            
-            factor_name = factor_mapping.get(mode_transport, "Voiture particulière")
-            factor = self.ademe_loader.get_factor_by_category_and_unit(factor_name, "km")
+            km_annuel = km_domicile_travail * 2 * COMMUTE_DAYS
+            factor_name = COMMUTE_FACTORS.get(mode_transport, "Voiture particulière")
+            factor = self._resolve_factor(factor_name, "km", factor_set)
             
             if factor:
                 emission = km_annuel * factor.value
                 total += emission
-                self._add_trace(f"Trajets employés {mode_transport}", km_annuel, "km", factor.value, emission, 3)
+                self._add_trace(trace, f"Trajets employés {mode_transport}", km_annuel, "km", factor.value, emission, 3, factor)
         
         return total
     
-    def _calculate_achats(self, achats: Dict) -> float:
+    def _calculate_achats(self, achats: Dict, trace: List[Dict]) -> float:
         total = 0.0
         
-        matieres_premieres = achats.get("matieresPremières", 0)
-        if matieres_premieres > 0:
-            factor_value = 0.5
-            emission = matieres_premieres * factor_value
-            total += emission
-            self._add_trace("Matières premières", matieres_premieres, "k€", factor_value, emission, 3)
-        
-        equipements = achats.get("equipements", 0)
-        if equipements > 0:
-            factor_value = 0.3
-            emission = equipements * factor_value
-            total += emission
-            self._add_trace("Équipements", equipements, "k€", factor_value, emission, 3)
-        
-        services = achats.get("services", 0)
-        if services > 0:
-            factor_value = 0.2
-            emission = services * factor_value
-            total += emission
-            self._add_trace("Services", services, "k€", factor_value, emission, 3)
+        for key, source, factor_value in PURCHASE_FACTORS:
+            amount = achats.get(key, 0)
+            if amount > 0:
+                emission = amount * factor_value
+                total += emission
+                self._add_trace(trace, source, amount, "k€", factor_value, emission, 3)
         
         return total
     
-    def _calculate_dechets(self, dechets: Dict) -> float:
+    def _calculate_dechets(self, dechets: Dict, trace: List[Dict]) -> float:
         total = 0.0
         
         production = dechets.get("production", 0)
         traitement = dechets.get("traitement", "recyclage")
         
         if production > 0:
-            factor_mapping = {
-                "incineration": 0.5,
-                "enfouissement": 0.8,
-                "compostage": 0.1,
-                "recyclage": 0.05
-            }
-            
-            factor_value = factor_mapping.get(traitement, 0.3)
+            factor_value = WASTE_FACTORS.get(traitement, DEFAULT_WASTE_FACTOR)
             emission = production * factor_value
             total += emission
-            self._add_trace(f"Déchets {traitement}", production, "tonnes", factor_value, emission, 3)
+            self._add_trace(trace, f"Déchets {traitement}", production, "tonnes", factor_value, emission, 3)
         
         return total
     
-    def _add_trace(self, source: str, quantity: float, unit: str, factor: float, emission: float, scope: int):
-        self.calculation_trace.append({
+    def _add_trace(self, trace: List[Dict], source: str, quantity: float, unit: str, factor: float, emission: float, scope: int,
+                   emission_factor: Optional[FactorRow] = None):
+        trace.append({
             "source": source,
             "quantity": quantity,
             "unit": unit,
             "emission_factor": factor,
             "emission": emission,
-            "scope": scope
+            "scope": scope,
+            "factor_id": emission_factor.ademe_id if emission_factor is not None else None,
+            "uncertainty": emission_factor.uncertainty if emission_factor is not None else None
         })
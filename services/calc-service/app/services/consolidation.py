@@ -0,0 +1,223 @@
+"""Group-level inventory over many sites, maintained incrementally.
+
+Each site keeps its last ``CalculationEngine`` result, trace included, and a
+fingerprint of the questionnaire it was computed from. Group aggregates are
+running sums (per-scope emissions, headcount, revenue), so an upsert is:
+
+- unchanged fingerprint and factor set: nothing to do;
+- otherwise recompute that site only, subtract its previous contribution and
+  add the new one.
+
+Group intensities are derived from the sums on read. Sums are rebuilt from
+the sites every ``RESUM_EVERY`` patches so subtract/add rounding cannot
+drift.
+"""
+import hashlib
+import json
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import structlog
+
+from .calculation_engine import CalculationEngine
+
+logger = structlog.get_logger()
+
+SCOPES = ("scope1", "scope2", "scope3")
+RESUM_EVERY = 1000
+
+
+class FactorSetConflict(ValueError):
+    """A group already consolidated with another factor set."""
+
+
+def questionnaire_fingerprint(questionnaire: Dict) -> str:
+    encoded = json.dumps(questionnaire, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class SiteResult:
+    __slots__ = ("site_id", "questionnaire", "fingerprint", "factors_version", "result", "effectif",
+                 "chiffre_affaires", "updated_at")
+
+    def __init__(self, site_id: str, fingerprint: str, factors_version: int, result: Dict, questionnaire: Dict):
+        entreprise = questionnaire.get("entreprise", {})
+        self.site_id = site_id
+        # Kept so a factor reload can recompute the site without the caller resending it
+        self.questionnaire = questionnaire
+        self.fingerprint = fingerprint
+        self.factors_version = factors_version
+        self.result = result
+        self.effectif = float(entreprise.get("effectif", 0) or 0)
+        self.chiffre_affaires = float(entreprise.get("chiffreAffaires", 0) or 0)
+        self.updated_at = datetime.now().isoformat()
+
+    def contribution(self) -> Tuple[float, ...]:
+        return tuple(self.result[scope] for scope in SCOPES) + (self.effectif, self.chiffre_affaires)
+
+
+class GroupInventory:
+    def __init__(self, group_id: str, engine: CalculationEngine, factor_set: Optional[str] = None):
+        self.group_id = group_id
+        self.engine = engine
+        self.factor_set = factor_set
+        self.sites: Dict[str, SiteResult] = {}
+        # scope1, scope2, scope3, effectif, chiffre d'affaires
+        self._sums = [0.0] * (len(SCOPES) + 2)
+        self._patches = 0
+        self.recomputed = 0
+        # Upserts and refreshes run in worker threads; one patch at a time per group
+        self._lock = threading.RLock()
+
+    def _patch(self, old: Optional[SiteResult], new: Optional[SiteResult]):
+        if old is not None:
+            for i, value in enumerate(old.contribution()):
+                self._sums[i] -= value
+        if new is not None:
+            for i, value in enumerate(new.contribution()):
+                self._sums[i] += value
+        self._patches += 1
+        if self._patches >= RESUM_EVERY or not self.sites:
+            self._resum()
+
+    def _resum(self):
+        contributions = [site.contribution() for site in self.sites.values()]
+        self._sums = [math.fsum(column) for column in zip(*contributions)] if contributions else [0.0] * len(self._sums)
+        self._patches = 0
+
+    def _needs_update(self, site_id: str, fingerprint: str) -> bool:
+        current = self.sites.get(site_id)
+        return (current is None or current.fingerprint != fingerprint
+                or current.factors_version != self.engine.ademe_loader.factors_version)
+
+    def _store(self, site_id: str, fingerprint: str, questionnaire: Dict, result: Dict) -> SiteResult:
+        site = SiteResult(site_id, fingerprint, self.engine.ademe_loader.factors_version, result, questionnaire)
+        old = self.sites.get(site_id)
+        self.sites[site_id] = site
+        self._patch(old, site)
+        self.recomputed += 1
+        return site
+
+    def upsert_site(self, site_id: str, questionnaire: Dict) -> SiteResult:
+        """Store a site's questionnaire, recomputing it only if it or the factors changed."""
+        fingerprint = questionnaire_fingerprint(questionnaire)
+        with self._lock:
+            if not self._needs_update(site_id, fingerprint):
+                return self.sites[site_id]
+            result = self.engine.calculate_emissions(questionnaire, factor_set=self.factor_set)
+            return self._store(site_id, fingerprint, questionnaire, result)
+
+    def upsert_sites(self, questionnaires: Dict[str, Dict]) -> List[str]:
+        """Bulk upsert; changed sites go through one batch calculation. Returns the recomputed site ids."""
+        fingerprints = [(site_id, questionnaire_fingerprint(q), q) for site_id, q in questionnaires.items()]
+        with self._lock:
+            changed = [entry for entry in fingerprints if self._needs_update(entry[0], entry[1])]
+            return self._recompute(changed)
+
+    def _recompute(self, changed: List[Tuple[str, str, Dict]]) -> List[str]:
+        if changed:
+            results = self.engine.calculate_emissions_batch([q for _, _, q in changed], factor_set=self.factor_set)
+            for (site_id, fingerprint, questionnaire), result in zip(changed, results):
+                self._store(site_id, fingerprint, questionnaire, result)
+        return [site_id for site_id, _, _ in changed]
+
+    def remove_site(self, site_id: str) -> bool:
+        with self._lock:
+            site = self.sites.pop(site_id, None)
+            if site is None:
+                return False
+            self._patch(site, None)
+            return True
+
+    def refresh(self) -> List[str]:
+        """Recompute sites calculated with a factor cache that has since been reloaded."""
+        with self._lock:
+            version = self.engine.ademe_loader.factors_version
+            stale = [
+                (site.site_id, site.fingerprint, site.questionnaire)
+                for site in self.sites.values() if site.factors_version != version
+            ]
+            if stale:
+                logger.info(f"Consolidation {self.group_id}: {len(stale)} sites recalculés après rechargement des facteurs")
+            return self._recompute(stale)
+
+    def summary(self, with_sites: bool = True) -> Dict:
+        with self._lock:
+            return self._summary(with_sites)
+
+    def _summary(self, with_sites: bool) -> Dict:
+        scope1, scope2, scope3, effectif, chiffre_affaires = self._sums
+        total = scope1 + scope2 + scope3
+        summary = {
+            "group_id": self.group_id,
+            "sites": len(self.sites),
+            "scope1": scope1,
+            "scope2": scope2,
+            "scope3": scope3,
+            "total": total,
+            "repartition": {
+                scope: (value / total if total > 0 else 0.0)
+                for scope, value in zip(SCOPES, (scope1, scope2, scope3))
+            },
+            "intensites": {
+                "par_employe": total / max(effectif, 1),
+                "par_chiffre_affaires": total / max(chiffre_affaires, 1) if chiffre_affaires > 0 else 0
+            },
+            "effectif": effectif,
+            "chiffre_affaires": chiffre_affaires,
+            "metadata": {
+                "ademe_version": self.factor_set or self.engine.ademe_loader.factors_cache.version,
+                "methodology": "ADEME Base Carbone"
+            }
+        }
+        if with_sites:
+            summary["contributions"] = [
+                {
+                    "site_id": site.site_id,
+                    "total": site.result["total"],
+                    "part": site.result["total"] / total if total > 0 else 0.0,
+                    "updated_at": site.updated_at
+                }
+                for site in self.sites.values()
+            ]
+        return summary
+
+
+class ConsolidationStore:
+    """Group inventories of the running service, keyed by group id."""
+
+    def __init__(self, engine: CalculationEngine):
+        self.engine = engine
+        self.groups: Dict[str, GroupInventory] = {}
+        self._lock = threading.Lock()
+
+    def group(self, group_id: str, factor_set: Optional[str] = None) -> GroupInventory:
+        """Group inventory, created on first use.
+
+        Raises KeyError for a factor set the cache does not know, before the
+        group is registered, and FactorSetConflict when the group already
+        uses another set. Without ``factor_set`` an existing group keeps its own.
+        """
+        if factor_set is not None:
+            self.engine._factor_set_label(factor_set)
+        with self._lock:
+            inventory = self.groups.get(group_id)
+            if inventory is None:
+                inventory = self.groups[group_id] = GroupInventory(group_id, self.engine, factor_set)
+            elif factor_set is not None and factor_set != inventory.factor_set:
+                raise FactorSetConflict(
+                    f"Le groupe {group_id} est consolidé avec le jeu de facteurs "
+                    f"{inventory.factor_set or 'courant'}, pas {factor_set}"
+                )
+        return inventory
+
+    def get(self, group_id: str) -> Optional[GroupInventory]:
+        return self.groups.get(group_id)
+
+    def drop(self, group_id: str) -> bool:
+        return self.groups.pop(group_id, None) is not None
+
+    def __iter__(self) -> Iterable[GroupInventory]:
+        return iter(self.groups.values())
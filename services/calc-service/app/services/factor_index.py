@@ -0,0 +1,96 @@
+"""Inverted index for (category, unit) factor lookups.
+
+``ADEMELoader.get_factor_by_category_and_unit`` returns the first cached
+factor, in cache order, whose lowercased category contains the lowercased
+query and whose lowercased unit contains the lowercased unit. The index keeps
+exactly those semantics:
+
+- factors are grouped by distinct category, each group holding its cache
+  positions in order, so a query only looks at distinct categories;
+- distinct categories are accent folded and indexed by trigram. Folding maps
+  each character independently, so a category containing the query also
+  contains every trigram of the folded query; intersecting postings gives a
+  superset that is then checked with the original ``in`` test;
+- resolved queries are memoized, so repeated lookups are one dict probe.
+"""
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+MAX_RESOLVED = 4096
+
+# Ligatures NFKD leaves alone
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae"})
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents: 'Électricité' -> 'electricite'."""
+    decomposed = unicodedata.normalize("NFKD", text.lower().translate(_LIGATURES))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class FactorLookupIndex:
+    def __init__(self, factors: Sequence):
+        self.factors = list(factors)
+        self._category_lower: List[str] = []
+        # Per distinct category: cache positions and the matching lowercased units
+        self._positions: List[List[int]] = []
+        self._units: List[List[str]] = []
+        self._trigrams: Dict[str, Set[int]] = {}
+        self._resolved: Dict[Tuple[str, str], Optional[int]] = {}
+
+        category_ids: Dict[str, int] = {}
+        for position, factor in enumerate(self.factors):
+            category = (factor.category or "").lower()
+            category_id = category_ids.get(category)
+            if category_id is None:
+                category_id = category_ids[category] = len(self._category_lower)
+                self._category_lower.append(category)
+                self._positions.append([])
+                self._units.append([])
+                for gram in trigrams(fold(category)):
+                    self._trigrams.setdefault(gram, set()).add(category_id)
+            self._positions[category_id].append(position)
+            self._units[category_id].append((factor.unit or "").lower())
+
+    def __len__(self) -> int:
+        return len(self.factors)
+
+    def _candidate_categories(self, category_lower: str):
+        grams = trigrams(fold(category_lower))
+        if not grams:
+            # Queries under three folded characters fall back to every category
+            return range(len(self._category_lower))
+        postings = sorted((self._trigrams.get(gram, set()) for gram in grams), key=len)
+        return set.intersection(*postings)
+
+    def _resolve(self, category_lower: str, unit_lower: str) -> Optional[int]:
+        best = None
+        for category_id in self._candidate_categories(category_lower):
+            if category_lower not in self._category_lower[category_id]:
+                continue
+            positions = self._positions[category_id]
+            if best is not None and positions[0] >= best:
+                continue
+            for position, unit in zip(positions, self._units[category_id]):
+                if best is not None and position >= best:
+                    break
+                if unit_lower in unit:
+                    best = position
+                    break
+        return best
+
+    def lookup(self, category: str, unit: str):
+        key = (category.lower(), unit.lower())
+        try:
+            position = self._resolved[key]
+        except KeyError:
+            position = self._resolve(*key)
+            if len(self._resolved) >= MAX_RESOLVED:
+                # Categories come from user input too; keep the memo bounded
+                self._resolved.clear()
+            self._resolved[key] = position
+        return None if position is None else self.factors[position]
@@ -0,0 +1,170 @@
+"""Bulk ingest of Base Carbone factors into the database.
+
+The CSV is read in chunks of raw strings. Each chunk goes through
+``normalize_ademe_frame``, which filters, coerces and classifies scopes as
+column operations, and is written in one statement per chunk:
+
+- PostgreSQL: ``COPY ... FROM STDIN`` with an in-memory CSV buffer;
+- other backends (SQLite in tests): one executemany ``INSERT``.
+
+No ORM instance is built per row.
+"""
+import io
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import structlog
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .factor_snapshot import ADEME_CSV_SEPARATOR, NUMERIC_COLUMNS, TEXT_COLUMNS, normalize_ademe_frame
+
+logger = structlog.get_logger()
+
+DEFAULT_CHUNK_SIZE = 20000
+
+FACTOR_COLUMNS = TEXT_COLUMNS + list(NUMERIC_COLUMNS)
+
+
+@dataclass
+class IngestStats:
+    rows_read: int = 0
+    rows_written: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_written / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "chunks": self.chunks,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def iter_ademe_chunks(csv_path: Union[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      sep: str = ADEME_CSV_SEPARATOR) -> Iterator[tuple]:
+    """Yield (raw row count, normalized factor frame) per CSV chunk."""
+    reader = pd.read_csv(csv_path, encoding="utf-8", sep=sep, dtype=str,
+                         keep_default_na=True, chunksize=chunk_size)
+    for chunk in reader:
+        yield len(chunk), normalize_ademe_frame(chunk)
+
+
+def _with_metadata(factors: pd.DataFrame, version: str, status: str) -> pd.DataFrame:
+    factors = factors[FACTOR_COLUMNS].copy()
+    factors["source"] = "ADEME"
+    factors["version"] = version
+    factors["status"] = status
+    return factors
+
+
+def _copy_frame(db: Session, table, factors: pd.DataFrame):
+    buffer = io.StringIO()
+    factors.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ", ".join(f'"{c}"' for c in factors.columns)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table.name}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+
+def write_factors(db: Session, model, factors: pd.DataFrame, version: str = "v17",
+                  status: str = "valid") -> int:
+    """Write normalized factor columns to ``model``'s table without ORM objects."""
+    if factors.empty:
+        return 0
+    factors = _with_metadata(factors, version, status)
+    table = model.__table__
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_frame(db, table, factors)
+    else:
+        db.execute(insert(table), factors.to_dict(orient="records"))
+    return len(factors)
+
+
+def ingest_csv(db: Session, model, csv_path: Union[str, Path], version: str = "v17",
+               chunk_size: int = DEFAULT_CHUNK_SIZE, sep: str = ADEME_CSV_SEPARATOR) -> IngestStats:
+    """Load the whole CSV in one transaction, committed once at the end."""
+    stats = IngestStats()
+    started = time.perf_counter()
+    for rows_read, factors in iter_ademe_chunks(csv_path, chunk_size, sep):
+        stats.rows_read += rows_read
+        stats.rows_written += write_factors(db, model, factors, version)
+        stats.chunks += 1
+        logger.info(f"Chargé {stats.rows_written} facteurs (bloc {stats.chunks})")
+    db.commit()
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def snapshot_frame(snapshot) -> pd.DataFrame:
+    """Factor columns of a FactorSnapshot, with interned strings decoded once."""
+    columns = {}
+    for name in TEXT_COLUMNS:
+        codes, uniques = pd.factorize(snapshot.text_ids(name))
+        strings = np.array([snapshot.string(int(i)) for i in uniques], dtype=object)
+        columns[name] = strings[codes]
+    for name in NUMERIC_COLUMNS:
+        columns[name] = snapshot.column(name)
+    return pd.DataFrame(columns)
+
+
+def ingest_snapshot(db: Session, model, snapshot, chunk_size: int = DEFAULT_CHUNK_SIZE) -> IngestStats:
+    stats = IngestStats()
+    started = time.perf_counter()
+    factors = snapshot_frame(snapshot)
+    version = snapshot.header.get("version", "v17")
+    for start in range(0, len(factors), chunk_size):
+        chunk = factors.iloc[start:start + chunk_size]
+        stats.rows_read += len(chunk)
+        stats.rows_written += write_factors(db, model, chunk, version)
+        stats.chunks += 1
+    db.commit()
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def read_release(csv_path: Union[str, Path], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 sep: str = ADEME_CSV_SEPARATOR) -> pd.DataFrame:
+    frames = [factors for _, factors in iter_ademe_chunks(csv_path, chunk_size, sep)]
+    if not frames:
+        return pd.DataFrame(columns=FACTOR_COLUMNS)
+    # Later duplicates win, as in the factor cache
+    return pd.concat(frames, ignore_index=True).drop_duplicates("ademe_id", keep="last")
+
+
+def diff_releases(current: pd.DataFrame, release: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Split a new release into (changed or added factors, removed factors).
+
+    Both frames hold FACTOR_COLUMNS. Comparison is column-wise on the merged
+    frames; a factor is unchanged only if every column matches.
+    """
+    merged = release[FACTOR_COLUMNS].merge(
+        current[FACTOR_COLUMNS], on="ademe_id", how="left", suffixes=("", "_current"), indicator=True
+    )
+    changed = merged["_merge"] == "left_only"
+    for name in FACTOR_COLUMNS:
+        if name == "ademe_id":
+            continue
+        new, old = merged[name], merged[f"{name}_current"]
+        if name in NUMERIC_COLUMNS:
+            # The cache stores missing numbers as 0
+            differs = new.astype(float).fillna(0.0) != old.astype(float).fillna(0.0)
+        else:
+            differs = new.fillna("").astype(str) != old.fillna("").astype(str)
+        changed |= differs & (merged["_merge"] == "both")
+    updated = merged.loc[changed, FACTOR_COLUMNS].reset_index(drop=True)
+    removed = current[~current["ademe_id"].isin(release["ademe_id"])][FACTOR_COLUMNS].reset_index(drop=True)
+    return updated, removed
@@ -0,0 +1,140 @@
+"""In-memory full-text search over the emission factor cache.
+
+Factors are tokenized on accent-folded, lowercased words of ``nom``,
+``category`` and ``tags``, with per-field weights, and ranked with BM25. The
+term saturation part of BM25 depends only on the document, so it is computed
+once per posting at build time; a query is then one vectorized
+``scores[docs] += idf * weight`` per matched term and an ``argpartition`` for
+the top hits.
+
+Query terms missing from the vocabulary are matched against vocabulary terms
+sharing enough trigrams (typos, plurals). In prefix mode the last query term
+also expands to every vocabulary term it starts, for typeahead.
+"""
+import bisect
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .factor_index import fold, trigrams
+
+FIELD_WEIGHTS = {"nom": 3.0, "category": 2.0, "tags": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+FUZZY_MIN_SIMILARITY = 0.5
+FUZZY_MAX_TERMS = 5
+FUZZY_PENALTY = 0.7
+PREFIX_MAX_TERMS = 50
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text or ""))
+
+
+class FactorSearchIndex:
+    def __init__(self, factors: Sequence):
+        self.factors = list(factors)
+        n = len(self.factors)
+
+        term_ids: Dict[str, int] = {}
+        doc_ids: List[List[int]] = []
+        frequencies: List[List[float]] = []
+        lengths = np.zeros(n, dtype=np.float64)
+
+        for doc, factor in enumerate(self.factors):
+            counts: Dict[int, float] = {}
+            for field, weight in FIELD_WEIGHTS.items():
+                tokens = tokenize(getattr(factor, field, ""))
+                lengths[doc] += weight * len(tokens)
+                for token in tokens:
+                    term = term_ids.get(token)
+                    if term is None:
+                        term = term_ids[token] = len(doc_ids)
+                        doc_ids.append([])
+                        frequencies.append([])
+                    counts[term] = counts.get(term, 0.0) + weight
+            for term, tf in counts.items():
+                doc_ids[term].append(doc)
+                frequencies[term].append(tf)
+
+        average_length = lengths.mean() if n and lengths.mean() > 0 else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+
+        self._terms = term_ids
+        self._tokens = sorted(term_ids, key=term_ids.get)
+        self._vocabulary = sorted(term_ids)
+        self._postings: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._idf = np.zeros(len(doc_ids), dtype=np.float64)
+        for term, (docs, tfs) in enumerate(zip(doc_ids, frequencies)):
+            docs = np.asarray(docs, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float64)
+            self._postings.append((docs, tfs * (BM25_K1 + 1) / (tfs + norm[docs])))
+            self._idf[term] = np.log1p((n - len(docs) + 0.5) / (len(docs) + 0.5))
+
+        self._trigrams: Dict[str, List[int]] = {}
+        for term, token in enumerate(self._tokens):
+            for gram in trigrams(f" {token} "):
+                self._trigrams.setdefault(gram, []).append(term)
+
+    def __len__(self) -> int:
+        return len(self.factors)
+
+    def _fuzzy_terms(self, token: str) -> List[Tuple[int, float]]:
+        grams = trigrams(f" {token} ")
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for term in self._trigrams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        matches = []
+        for term, common in shared.items():
+            # Dice coefficient on padded trigrams: a padded word of length L has L trigrams
+            similarity = 2 * common / (len(grams) + len(self._tokens[term]))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches.append((term, similarity * FUZZY_PENALTY))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches[:FUZZY_MAX_TERMS]
+
+    def _prefix_terms(self, prefix: str) -> List[Tuple[int, float]]:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        stop = bisect.bisect_left(self._vocabulary, prefix + "\uffff")
+        terms = [self._terms[token] for token in self._vocabulary[start:stop]]
+        # A short prefix can expand to hundreds of words; keep the most frequent ones
+        terms.sort(key=lambda term: (-len(self._postings[term][0]), term))
+        return [(term, 1.0) for term in terms[:PREFIX_MAX_TERMS]]
+
+    def _query_terms(self, query: str, prefix: bool) -> List[List[Tuple[int, float]]]:
+        tokens = tokenize(query)
+        groups = []
+        for i, token in enumerate(tokens):
+            if prefix and i == len(tokens) - 1:
+                groups.append(self._prefix_terms(token))
+            elif token in self._terms:
+                groups.append([(self._terms[token], 1.0)])
+            else:
+                groups.append(self._fuzzy_terms(token))
+        return groups
+
+    def search(self, query: str, limit: int = 10, prefix: bool = False) -> List[Tuple[object, float]]:
+        """Top ``limit`` factors for ``query`` with their BM25 scores, best first."""
+        if not self.factors or limit <= 0:
+            return []
+        scores: Optional[np.ndarray] = None
+        for group in self._query_terms(query, prefix):
+            for term, weight in group:
+                docs, saturation = self._postings[term]
+                if scores is None:
+                    scores = np.zeros(len(self.factors), dtype=np.float64)
+                scores[docs] += weight * self._idf[term] * saturation
+        if scores is None:
+            return []
+
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        # Ties keep cache order so results are deterministic
+        order = matched[np.lexsort((matched, -scores[matched]))]
+        return [(self.factors[doc], float(scores[doc])) for doc in order.tolist()]
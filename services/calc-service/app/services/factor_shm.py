@@ -0,0 +1,214 @@
+"""Factor table shared by every worker of a host through POSIX shared memory.
+
+One process publishes the whole factor table, releases included, as a
+snapshot (see ``factor_snapshot``) into a ``multiprocessing.shared_memory``
+segment. Other workers attach to it and build their ``FactorTable`` over the
+same pages, so resident memory stays flat as workers are added.
+
+A small control segment, ``<name>``, points at the current data segment:
+
+    8 bytes   magic b"CBFSHM01"
+    8 bytes   generation, bumped on every publish
+    8 bytes   size of the data segment
+    64 bytes  name of the data segment, ``<name>-<generation>``
+
+Readers compare the generation with the one they attached to, which is one
+``unpack_from`` per check, and re-attach when it moved. A new generation goes
+to a new segment; the previous one is unlinked, and processes still mapping
+it keep their pages until they re-attach. Publishers, a worker reloading
+factors or the CLI below, take an ``flock`` on ``<tmp>/<name>.lock`` so two of
+them never compute the same next generation.
+"""
+import asyncio
+import fcntl
+import os
+import struct
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+import structlog
+
+from .factor_snapshot import FactorSnapshot, serialize_snapshot
+
+logger = structlog.get_logger()
+
+SHM_MAGIC = b"CBFSHM01"
+CONTROL_FORMAT = "<8sQQ64s"
+CONTROL_SIZE = struct.calcsize(CONTROL_FORMAT)
+
+DEFAULT_WAIT_SECONDS = 120.0
+POLL_SECONDS = 0.2
+
+# SharedMemory(track=...) exists from Python 3.13
+_TRACK_ARGUMENT = sys.version_info >= (3, 13)
+
+
+class _Segment(shared_memory.SharedMemory):
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # Arrays of a table still being torn down reference the mapping; it goes with them
+            pass
+
+
+def _open_segment(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """Open a segment that outlives this process.
+
+    The resource tracker would unlink segments when the process that opened
+    them exits, including a worker that only attached; lifetime is managed
+    here instead.
+    """
+    if _TRACK_ARGUMENT:
+        return _Segment(name=name, create=create, size=size, track=False)
+    segment = _Segment(name=name, create=create, size=size)
+    resource_tracker.unregister(segment._name, "shared_memory")
+    return segment
+
+
+def _unlink(name: str):
+    try:
+        segment = _open_segment(name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    if not _TRACK_ARGUMENT:
+        # unlink() unregisters the name again
+        resource_tracker.register(segment._name, "shared_memory")
+    segment.unlink()
+
+
+@contextmanager
+def _publish_lock(name: str):
+    path = os.path.join(tempfile.gettempdir(), f"{name.strip('/').replace('/', '_')}.lock")
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SharedFactorCache:
+    def __init__(self, name: str):
+        self.name = name
+        # Generation this process attached to or published, 0 before either
+        self.generation = 0
+        self._control: Optional[shared_memory.SharedMemory] = None
+
+    def claim_publisher(self) -> bool:
+        """Create the control segment; only the first process of the host gets True."""
+        try:
+            self._control = _open_segment(self.name, create=True, size=CONTROL_SIZE)
+        except FileExistsError:
+            self._control = _open_segment(self.name)
+            return False
+        struct.pack_into(CONTROL_FORMAT, self._control.buf, 0, SHM_MAGIC, 0, 0, b"")
+        return True
+
+    def _read_control(self) -> Tuple[int, int, str]:
+        if self._control is None:
+            self._control = _open_segment(self.name)
+        magic, generation, size, segment_name = struct.unpack_from(CONTROL_FORMAT, self._control.buf, 0)
+        if generation and magic != SHM_MAGIC:
+            raise ValueError(f"Segment partagé invalide: {self.name}")
+        return generation, size, segment_name.rstrip(b"\0").decode("ascii")
+
+    def current_generation(self) -> int:
+        return self._read_control()[0]
+
+    def is_stale(self) -> bool:
+        return self.current_generation() != self.generation
+
+    def publish(self, table) -> int:
+        """Publish a ``FactorTable``; returns the new generation."""
+        metadata = {"version": table.versions[0], "versions": list(table.versions), "factor_set": table.version}
+        return self.publish_bytes(serialize_snapshot(table.to_snapshot_frame(), metadata))
+
+    def publish_bytes(self, data: bytes) -> int:
+        # Read-increment-write of the generation, serialized across processes
+        with _publish_lock(self.name):
+            return self._publish_locked(data)
+
+    def _publish_locked(self, data: bytes) -> int:
+        previous_generation, _, previous_name = self._read_control()
+        generation = previous_generation + 1
+        segment_name = f"{self.name}-{generation}"
+        try:
+            segment = _open_segment(segment_name, create=True, size=len(data))
+        except FileExistsError:
+            # Left over from a control segment that was unlinked and recreated
+            _unlink(segment_name)
+            segment = _open_segment(segment_name, create=True, size=len(data))
+        segment.buf[:len(data)] = data
+        segment.close()
+        # Size and name first, generation last: readers key on the generation
+        struct.pack_into(CONTROL_FORMAT, self._control.buf, 0, SHM_MAGIC, previous_generation,
+                         len(data), segment_name.encode("ascii"))
+        struct.pack_into("<Q", self._control.buf, len(SHM_MAGIC), generation)
+        if previous_name:
+            _unlink(previous_name)
+        self.generation = generation
+        logger.info(f"Facteurs publiés en mémoire partagée: {segment_name} ({len(data) / 1024:.0f} Ko)")
+        return generation
+
+    async def wait_published(self, timeout: float = DEFAULT_WAIT_SECONDS):
+        deadline = time.monotonic() + timeout
+        while self.current_generation() == 0:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Aucun cache de facteurs publié dans {self.name} après {timeout:.0f}s")
+            await asyncio.sleep(POLL_SECONDS)
+
+    def attach(self) -> FactorSnapshot:
+        """Map the current generation read-only."""
+        while True:
+            generation, size, segment_name = self._read_control()
+            try:
+                segment = _open_segment(segment_name)
+            except FileNotFoundError:
+                # Republished between the two reads; pick up the newer generation
+                continue
+            break
+        # The snapshot owns the mapping; it is released with the table built on it
+        snapshot = FactorSnapshot(segment.buf[:size], owner=segment)
+        self.generation = generation
+        return snapshot
+
+    def close(self):
+        if self._control is not None:
+            self._control.close()
+            self._control = None
+
+    def unlink(self):
+        """Remove the control segment and the current data segment."""
+        _, _, segment_name = self._read_control()
+        self.close()
+        if segment_name:
+            _unlink(segment_name)
+        _unlink(self.name)
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Publie un snapshot de facteurs en mémoire partagée")
+    parser.add_argument("command", choices=["publish", "unlink"])
+    parser.add_argument("name")
+    parser.add_argument("snapshot_path", nargs="?")
+    args = parser.parse_args()
+
+    cache = SharedFactorCache(args.name)
+    if args.command == "unlink":
+        cache.unlink()
+    else:
+        if args.snapshot_path is None:
+            parser.error("snapshot_path est requis pour publish")
+        cache.claim_publisher()
+        # A compiled snapshot is already in the shared format
+        cache.publish_bytes(Path(args.snapshot_path).read_bytes())
+        cache.close()
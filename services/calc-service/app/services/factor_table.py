@@ -0,0 +1,469 @@
+"""Compact, array-backed emission factor table.
+
+``ADEMELoader.factors_cache`` used to hold one SQLAlchemy ``EmissionFactor``
+per factor, long ``tags`` and ``comment`` strings included. ``FactorTable``
+keeps the same ``ademe_id -> factor`` mapping interface as a struct of arrays:
+
+- float64 arrays for the value, gas breakdown and uncertainty, int8 scope;
+- int32 ids into one interned string pool for category and unit;
+- ``ademe_id`` and ``nom`` kept as plain strings, needed for lookups and display;
+- ``tags`` and ``comment`` fetched from a text source on first access.
+
+Built from a snapshot, the numeric arrays are views on the memory map and the
+text source reads the mapped string table, so nothing is copied per worker.
+Items are lightweight ``FactorRow`` views with the ``EmissionFactor``
+attributes the engine, indexes and routers read.
+"""
+import re
+import sys
+from abc import abstractmethod
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def version_sort_key(version: str) -> Tuple:
+    """Natural order for factor-set labels: v9 < v17 < v17.1 < v23.0."""
+    return tuple(int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version) if part)
+
+
+FLOAT_COLUMNS = ["value", "co2_fossil", "ch4_fossil", "ch4_biogenic", "n2o", "co2_biogenic", "uncertainty"]
+
+
+class FactorRow:
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "FactorTable", row: int):
+        self._table = table
+        self._row = row
+
+    @property
+    def ademe_id(self) -> str:
+        return self._table.ademe_ids[self._row]
+
+    @property
+    def nom(self) -> str:
+        return self._table.noms[self._row]
+
+    @property
+    def category(self) -> str:
+        return self._table.strings[self._table.category_id[self._row]]
+
+    @property
+    def unit(self) -> str:
+        return self._table.strings[self._table.unit_id[self._row]]
+
+    @property
+    def scope(self) -> int:
+        return int(self._table.scope[self._row])
+
+    @property
+    def tags(self) -> str:
+        return self._table.text("tags", self._row)
+
+    @property
+    def comment(self) -> str:
+        return self._table.text("comment", self._row)
+
+    @property
+    def source(self) -> str:
+        return "ADEME"
+
+    @property
+    def version(self) -> str:
+        return self._table.versions[self._table.version_id[self._row]]
+
+    @property
+    def status(self) -> str:
+        return "valid"
+
+    def __getattr__(self, name: str):
+        if name in FLOAT_COLUMNS:
+            return float(self._table.floats[name][self._row])
+        raise AttributeError(name)
+
+    def __repr__(self) -> str:
+        return f"FactorRow({self.ademe_id!r}, {self.category!r}, {self.unit!r})"
+
+
+class _SnapshotTextColumn(Sequence):
+    """A snapshot text column decoded one row at a time from the memory map."""
+
+    def __init__(self, snapshot, name: str):
+        self._snapshot = snapshot
+        self._ids = snapshot.text_ids(name)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, row: int) -> str:
+        return self._snapshot.string(int(self._ids[row]))
+
+
+class _SnapshotStrings(Sequence):
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self) -> int:
+        return self._snapshot.header["strings"]
+
+    def __getitem__(self, string_id) -> str:
+        return self._snapshot.string(int(string_id))
+
+
+class _ChainedColumn(Sequence):
+    """A read-only base column followed by rows appended by later releases."""
+
+    def __init__(self, base: Sequence, extra: Optional[List] = None):
+        self.base = base
+        self.extra = extra if extra is not None else []
+        self._base_len = len(base)
+
+    def __len__(self) -> int:
+        return self._base_len + len(self.extra)
+
+    def __getitem__(self, index: int):
+        index = int(index)
+        return self.base[index] if index < self._base_len else self.extra[index - self._base_len]
+
+
+class _FactorRows(Mapping):
+    """ademe_id -> FactorRow mapping over a list of live table rows, in cache order."""
+
+    table: "FactorTable"
+    _order: np.ndarray
+
+    @abstractmethod
+    def _row(self, ademe_id: str) -> int:
+        """Table row of a live id, -1 if absent."""
+
+    def __getitem__(self, ademe_id: str) -> FactorRow:
+        row = self._row(ademe_id)
+        if row < 0:
+            raise KeyError(ademe_id)
+        return FactorRow(self.table, row)
+
+    def __iter__(self) -> Iterator[str]:
+        ademe_ids = self.table.ademe_ids
+        return (ademe_ids[row] for row in self._order.tolist())
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, ademe_id) -> bool:
+        return self._row(ademe_id) >= 0
+
+    def values(self) -> List[FactorRow]:
+        return [FactorRow(self.table, row) for row in self._order.tolist()]
+
+    def rows_in_scope(self, scope: int) -> List[FactorRow]:
+        rows = self._order[self.table.scope[self._order] == scope]
+        return [FactorRow(self.table, row) for row in rows.tolist()]
+
+
+class FactorTable(_FactorRows):
+    """Current factor set. Releases are appended, never rewritten.
+
+    ``apply_release`` appends changed and added factors as new rows and points
+    their ``ademe_id`` at them; removed ids become tombstones (-1). Ids touched
+    by a release keep their full (version, row) history, so ``at(version)``
+    can serve any earlier factor set from the same arrays.
+    """
+
+    def __init__(self, ademe_ids: Sequence[str], noms: Sequence[str], category_id: np.ndarray,
+                 unit_id: np.ndarray, strings: Sequence[str], floats: Dict[str, np.ndarray],
+                 scope: np.ndarray, text_source: Callable[[str], Sequence[str]], version: str = "v17"):
+        self.table = self
+        self.ademe_ids = ademe_ids
+        self.noms = noms
+        self.category_id = category_id
+        self.unit_id = unit_id
+        self.strings = strings
+        self.floats = floats
+        self.scope = scope
+        self.versions: List[str] = [version]
+        self.version_id = np.zeros(len(ademe_ids), dtype=np.int16)
+        self._base_rows = len(ademe_ids)
+        self._text_source = text_source
+        self._text: Dict[str, Sequence[str]] = {}
+        self._appended_text: Dict[str, List[str]] = {"tags": [], "comment": []}
+        self._history: Dict[str, List[Tuple[int, int]]] = {}
+        self._views: Dict[int, "FactorTableView"] = {}
+        # Same order and duplicate handling as the {f.ademe_id: f for f in factors} dict it replaces
+        self._rows: Dict[str, int] = {}
+        for row, ademe_id in enumerate(ademe_ids):
+            self._rows[ademe_id] = row
+        self._refresh_order()
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> "FactorTable":
+        # category and unit ids already point into the snapshot's interned table
+        pool = _SnapshotStrings(snapshot)
+        table = cls(
+            ademe_ids=_SnapshotTextColumn(snapshot, "ademe_id"),
+            noms=_SnapshotTextColumn(snapshot, "nom"),
+            category_id=snapshot.text_ids("category"),
+            unit_id=snapshot.text_ids("unit"),
+            strings=pool,
+            floats={name: snapshot.column(name) for name in FLOAT_COLUMNS},
+            scope=snapshot.column("scope"),
+            text_source=lambda name: _SnapshotTextColumn(snapshot, name),
+            version=snapshot.header.get("version", "v17"),
+        )
+        if "versions" in snapshot.header:
+            table._restore_releases(snapshot.header["versions"], snapshot.column("version_id"),
+                                    snapshot.column("superseded_in"))
+        return table
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence], text_source: Callable[[str], Sequence[str]],
+                  version: str = "v17") -> "FactorTable":
+        """Build from (ademe_id, nom, category, unit, scope, *FLOAT_COLUMNS) tuples."""
+        pool: Dict[str, int] = {}
+
+        def intern(value: Optional[str]) -> int:
+            value = sys.intern(value or "")
+            return pool.setdefault(value, len(pool))
+
+        n = len(rows)
+        category_id = np.empty(n, dtype=np.int32)
+        unit_id = np.empty(n, dtype=np.int32)
+        for row, record in enumerate(rows):
+            category_id[row] = intern(record[2])
+            unit_id[row] = intern(record[3])
+        columns = list(zip(*rows)) if rows else [()] * (5 + len(FLOAT_COLUMNS))
+        return cls(
+            ademe_ids=[str(v) for v in columns[0]],
+            noms=[v or "" for v in columns[1]],
+            category_id=category_id,
+            unit_id=unit_id,
+            strings=list(pool),
+            floats={
+                name: np.nan_to_num(np.asarray(columns[5 + i], dtype=np.float64))
+                for i, name in enumerate(FLOAT_COLUMNS)
+            },
+            scope=np.asarray(columns[4], dtype=np.int8),
+            text_source=text_source,
+            version=version,
+        )
+
+    @property
+    def version(self) -> str:
+        return self.versions[-1]
+
+    def version_index(self, version: Optional[str]) -> int:
+        if version is None:
+            return len(self.versions) - 1
+        try:
+            return self.versions.index(version)
+        except ValueError:
+            raise KeyError(f"Jeu de facteurs inconnu: {version}") from None
+
+    def text(self, name: str, row: int) -> str:
+        if row >= self._base_rows:
+            return self._appended_text[name][row - self._base_rows] or ""
+        column = self._text.get(name)
+        if column is None:
+            column = self._text[name] = self._text_source(name)
+        return column[row] or ""
+
+    def _row(self, ademe_id: str) -> int:
+        return self._rows.get(ademe_id, -1)
+
+    def _refresh_order(self):
+        rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        self._order = rows[rows >= 0]
+
+    def row_at(self, ademe_id: str, version_index: int) -> int:
+        history = self._history.get(ademe_id)
+        if history is None:
+            # Untouched since the base release
+            return self._rows.get(ademe_id, -1)
+        row = -1
+        for release, release_row in history:
+            if release > version_index:
+                break
+            row = release_row
+        return row
+
+    def at(self, version: Optional[str]) -> "_FactorRows":
+        """The factor set as of ``version``, sharing this table's arrays."""
+        index = self.version_index(version)
+        if index == len(self.versions) - 1:
+            return self
+        view = self._views.get(index)
+        if view is None:
+            view = self._views[index] = FactorTableView(self, index)
+        return view
+
+    def apply_release(self, version: str, factors, removed: Sequence[str] = ()):
+        """Patch in a new release: ``factors`` holds changed and added rows, in FACTOR_COLUMNS."""
+        if version in self.versions:
+            raise ValueError(f"Jeu de facteurs déjà chargé: {version}")
+        self.versions.append(version)
+        release = len(self.versions) - 1
+        start = len(self.ademe_ids)
+        n = len(factors)
+
+        def grow(column: Sequence, values: List) -> Sequence:
+            if isinstance(column, list):
+                column.extend(values)
+                return column
+            if not isinstance(column, _ChainedColumn):
+                column = _ChainedColumn(column)
+            column.extra.extend(values)
+            return column
+
+        pool_start = len(self.strings)
+        new_strings: Dict[str, int] = {}
+
+        def intern(values) -> np.ndarray:
+            return np.array([
+                new_strings.setdefault(sys.intern(str(v or "")), pool_start + len(new_strings)) for v in values
+            ], dtype=np.int32)
+
+        category_id = intern(factors["category"])
+        unit_id = intern(factors["unit"])
+        self.strings = grow(self.strings, list(new_strings))
+        self.category_id = np.concatenate([self.category_id, category_id])
+        self.unit_id = np.concatenate([self.unit_id, unit_id])
+        self.ademe_ids = grow(self.ademe_ids, [str(v) for v in factors["ademe_id"]])
+        self.noms = grow(self.noms, [str(v or "") for v in factors["nom"]])
+        for name in FLOAT_COLUMNS:
+            values = np.nan_to_num(np.asarray(factors[name], dtype=np.float64))
+            self.floats[name] = np.concatenate([self.floats[name], values])
+        self.scope = np.concatenate([self.scope, np.asarray(factors["scope"], dtype=np.int8)])
+        self.version_id = np.concatenate([self.version_id, np.full(n, release, dtype=np.int16)])
+        for name in self._appended_text:
+            values = factors[name] if name in factors else [""] * n
+            self._appended_text[name].extend(str(v or "") for v in values)
+
+        for offset, ademe_id in enumerate(self.ademe_ids[start + i] for i in range(n)):
+            self._record(ademe_id, release, start + offset)
+        for ademe_id in removed:
+            if self._rows.get(ademe_id, -1) >= 0:
+                self._record(ademe_id, release, -1)
+        self._refresh_order()
+
+    def _record(self, ademe_id: str, release: int, row: int):
+        history = self._history.get(ademe_id)
+        if history is None:
+            history = self._history[ademe_id] = [(0, self._rows.get(ademe_id, -1))]
+        history.append((release, row))
+        self._rows[ademe_id] = row
+
+    def to_frame(self):
+        """Live factors as FACTOR_COLUMNS, text columns included."""
+        import pandas as pd
+        rows = self._order.tolist()
+        frame = {
+            "ademe_id": [self.ademe_ids[row] for row in rows],
+            "nom": [self.noms[row] for row in rows],
+            "category": [self.strings[self.category_id[row]] for row in rows],
+            "unit": [self.strings[self.unit_id[row]] for row in rows],
+            "tags": [self.text("tags", row) for row in rows],
+            "comment": [self.text("comment", row) for row in rows],
+            "scope": self.scope[self._order],
+        }
+        for name in FLOAT_COLUMNS:
+            frame[name] = self.floats[name][self._order]
+        return pd.DataFrame(frame)
+
+    def to_snapshot_frame(self):
+        """Every row, superseded ones included, with the release columns ``_restore_releases`` reads.
+
+        ``version_id`` is the release that introduced a row and ``superseded_in``
+        the release that replaced or removed it (-1 while live).
+        """
+        import pandas as pd
+        n = len(self.ademe_ids)
+        superseded_in = np.full(n, -1, dtype=np.int16)
+        visible = np.zeros(n, dtype=bool)
+        visible[self._order] = True
+        for history in self._history.values():
+            for (_, row), (release, _) in zip(history, history[1:]):
+                if row >= 0:
+                    superseded_in[row] = release
+                    visible[row] = True
+        # Duplicate ids shadowed within their own release were never visible
+        shadowed = ~visible & (superseded_in < 0)
+        superseded_in[shadowed] = self.version_id[shadowed]
+        frame = {
+            "ademe_id": [self.ademe_ids[row] for row in range(n)],
+            "nom": [self.noms[row] for row in range(n)],
+            "category": [self.strings[i] for i in self.category_id.tolist()],
+            "unit": [self.strings[i] for i in self.unit_id.tolist()],
+            "tags": [self.text("tags", row) for row in range(n)],
+            "comment": [self.text("comment", row) for row in range(n)],
+            "scope": np.asarray(self.scope),
+            "version_id": self.version_id,
+            "superseded_in": superseded_in,
+        }
+        for name in FLOAT_COLUMNS:
+            frame[name] = np.asarray(self.floats[name])
+        return pd.DataFrame(frame)
+
+    def _restore_releases(self, versions: Sequence[str], version_id: np.ndarray, superseded_in: np.ndarray):
+        self.versions = list(versions)
+        self.version_id = version_id
+        self._rows = {}
+        rows_by_id: Dict[str, List[int]] = {}
+        touched = set()
+        for row, (ademe_id, introduced, superseded) in enumerate(
+                zip(self.ademe_ids, version_id.tolist(), superseded_in.tolist())):
+            # First occurrence fixes the position, live rows win, as after apply_release
+            if superseded < 0:
+                self._rows[ademe_id] = row
+            elif ademe_id not in self._rows:
+                self._rows[ademe_id] = -1
+            if superseded != introduced:
+                rows_by_id.setdefault(ademe_id, []).append(row)
+            if introduced > 0 or superseded > introduced:
+                touched.add(ademe_id)
+        for ademe_id in touched:
+            rows = sorted(rows_by_id[ademe_id], key=lambda row: version_id[row])
+            history = [] if version_id[rows[0]] == 0 else [(0, -1)]
+            for row, following in zip(rows, rows[1:] + [None]):
+                history.append((int(version_id[row]), row))
+                superseded = int(superseded_in[row])
+                if superseded >= 0 and (following is None or version_id[following] != superseded):
+                    history.append((superseded, -1))
+            self._history[ademe_id] = history
+        self._refresh_order()
+
+    def nbytes(self) -> int:
+        """Approximate resident size, not counting memory-mapped arrays or lazy text."""
+        total = sum(array.nbytes for array in self._owned_arrays())
+        for column in (self.ademe_ids, self.noms, self.strings):
+            if isinstance(column, list):
+                total += sys.getsizeof(column) + sum(sys.getsizeof(s) for s in column)
+        total += sys.getsizeof(self._rows) + self._order.nbytes
+        return total
+
+    def _owned_arrays(self) -> List[np.ndarray]:
+        arrays = [self.category_id, self.unit_id, self.scope, self.version_id, *self.floats.values()]
+        arrays = [array for array in arrays if isinstance(array, np.ndarray)]
+        # Arrays backed by a snapshot buffer live in the shared page cache
+        return [array for array in arrays if array.flags.owndata]
+
+
+class FactorTableView(_FactorRows):
+    """A pinned, read-only earlier factor set; only ids touched since then are resolved differently."""
+
+    def __init__(self, table: FactorTable, version_index: int):
+        self.table = table
+        self.version_index = version_index
+        rows = [
+            table.row_at(ademe_id, version_index) if ademe_id in table._history else row
+            for ademe_id, row in table._rows.items()
+        ]
+        rows = np.asarray(rows, dtype=np.int64)
+        self._order = rows[rows >= 0]
+
+    @property
+    def version(self) -> str:
+        return self.table.versions[self.version_index]
+
+    def _row(self, ademe_id: str) -> int:
+        return self.table.row_at(ademe_id, self.version_index)
@@ -3,16 +3,28 @@ CarbonScore Calculation API
 FastAPI service for carbon footprint calculations
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, List
+from typing import AsyncIterator, Optional, Dict, List
+import asyncio
 import json
+import os
 import uuid
 from datetime import datetime
 import logging
 
-from carbon_calculator import process_questionnaire_data, EmissionResult
+import numpy as np
+
+from carbon_calculator import (
+    process_questionnaire_data, process_company_batch, get_factor_registry, EmissionResult
+)
+from result_cache import ResultCache, canonical_key
+from calculation_store import StoredCalculation, encode_cursor, open_calculation_store
+from execution import CalculationExecutor, ExecutorSaturated
+from percentile_index import PercentileIndex, benchmark_label
+from dashboard_rollups import DIMENSIONS, DashboardRollups
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -78,10 +90,111 @@ class CalculationResponse(BaseModel):
     benchmark_position: str
     intensity_per_employee: float
     intensity_per_revenue: Optional[float]
+    peer_percentile: Optional[float] = None
     calculated_at: datetime
 
-# In-memory storage (replace with database in production)
-calculations_store: Dict[str, CalculationResponse] = {}
+class BatchCalculationRequest(BaseModel):
+    companies: List[QuestionnaireRequest] = Field(..., min_length=1, description="Questionnaires to calculate")
+
+class BatchCompanyResult(BaseModel):
+    nom: str
+    total_co2e: float
+    scope_1: float
+    scope_2: float
+    scope_3: float
+    breakdown: Dict[str, float]
+    intensity_per_employee: float
+    intensity_per_revenue: Optional[float]
+    carbon_efficiency_score: float
+    sustainability_grade: str
+    reduction_potential: Dict[str, float]
+    trajectory_2030: Dict[str, float]
+    peer_comparison: Dict[str, float]
+
+class BatchCalculationResponse(BaseModel):
+    batch_id: str
+    status: str
+    count: int
+    factor_set_version: str
+    results: List[BatchCompanyResult]
+    calculated_at: datetime
+
+# Persistent calculation storage; only a bounded hot tier is kept in memory
+calculation_store = open_calculation_store(
+    os.getenv("CALCULATION_STORE_URL", "sqlite:///calculations.db"),
+    hot_entries=int(os.getenv("CALCULATION_STORE_HOT_ENTRIES", 1000))
+)
+
+def load_calculation(calculation_id: str) -> Optional[CalculationResponse]:
+    record = calculation_store.get(calculation_id)
+    return CalculationResponse.model_validate_json(record.payload) if record else None
+
+# Largest single questionnaire accepted on the NDJSON stream endpoint
+MAX_NDJSON_LINE_BYTES = int(os.getenv("MAX_NDJSON_LINE_BYTES", 1024 * 1024))
+# Largest page of GET /api/v1/calculations
+MAX_LIST_LIMIT = int(os.getenv("MAX_LIST_LIMIT", 500))
+
+# Identical questionnaires computed against the same factor set share one result
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000)),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", 3600)),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+)
+get_factor_registry().add_reload_listener(lambda factor_set: result_cache.clear())
+
+# CPU-bound calculations run off the event loop; CALC_EXECUTOR=process sidesteps the GIL
+calculation_executor = CalculationExecutor(
+    backend=os.getenv("CALC_EXECUTOR", "thread"),
+    workers=int(os.getenv("CALC_WORKERS", 0)) or None,
+    max_pending=int(os.getenv("CALC_MAX_PENDING", 0)) or None,
+    retry_after=int(os.getenv("CALC_RETRY_AFTER_SECONDS", 1))
+)
+
+# Empirical peer distributions, built from stored calculations and updated on every new one
+percentile_index = PercentileIndex(min_samples=int(os.getenv("PEER_INDEX_MIN_SAMPLES", 20)))
+
+def rebuild_percentile_index():
+    sectors, effectifs, intensities = [], [], []
+    for record in calculation_store.iter_all():
+        sectors.append(record.sector)
+        effectifs.append(record.effectif)
+        intensities.append(json.loads(record.payload)["intensity_per_employee"])
+    percentile_index.extend(sectors, effectifs, intensities)
+    logger.info(f"Peer percentile index built from {len(intensities)} calculations")
+
+# Dashboard aggregates per sector, month and size band, patched on every stored calculation
+dashboard_rollups = DashboardRollups()
+
+def rebuild_dashboard_rollups():
+    def history():
+        # Lazy: the store is read only once the rollups log concurrent adds
+        for record in calculation_store.iter_all():
+            yield record.sector, record.effectif, json.loads(record.payload)
+    calculations = dashboard_rollups.rebuild(history())
+    logger.info(f"Dashboard rollups rebuilt from {calculations} calculations")
+
+def saturated_error(e: ExecutorSaturated) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Service saturé, réessayez plus tard",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.on_event("startup")
+async def preload_emission_factors():
+    """Load the shared emission factor set once, before serving traffic"""
+    factor_set = get_factor_registry().current()
+    logger.info(f"Emission factors preloaded: {factor_set.version}")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, rebuild_percentile_index)
+    await loop.run_in_executor(None, rebuild_dashboard_rollups)
+    # Process workers load their own copy in the pool initializer
+    await loop.run_in_executor(None, calculation_executor.start)
+
+@app.on_event("shutdown")
+async def close_calculation_store():
+    calculation_executor.shutdown()
+    calculation_store.close()
 
 @app.get("/")
 async def root():
@@ -98,10 +211,110 @@ async def health_check():
     """Detailed health check"""
     return {
         "status": "healthy",
-        "calculations_count": len(calculations_store),
+        "calculations_count": calculation_store.count(),
+        "factor_set_version": get_factor_registry().current().version,
+        "result_cache": result_cache.stats(),
+        "executor": calculation_executor.metrics(),
+        "peer_index": percentile_index.stats(),
+        "dashboard_rollups": dashboard_rollups.stats(),
         "timestamp": datetime.now().isoformat()
     }
 
+def rank_against_peers(response: CalculationResponse, sector: str, effectif: str) -> CalculationResponse:
+    """Response with its percentile among stored peers, as of now"""
+    peer_percentile = percentile_index.percentile(sector, effectif, response.intensity_per_employee)
+    if peer_percentile is None:
+        # Too few peers: keep the worker's static sector benchmark
+        return response
+    return response.model_copy(update={
+        "peer_percentile": peer_percentile,
+        "benchmark_position": benchmark_label(peer_percentile)
+    })
+
+async def run_calculation(request: QuestionnaireRequest) -> CalculationResponse:
+    """Run one questionnaire through the calculator and build the API response"""
+    cache_key = canonical_key(request.model_dump(), get_factor_registry().current().version)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Returning cached calculation {cached.calculation_id} for {request.entreprise.nom}")
+        # The cache holds the unranked result; the peer distribution keeps moving
+        return rank_against_peers(cached, request.entreprise.secteur, request.entreprise.effectif)
+    
+    logger.info(f"Starting calculation for company: {request.entreprise.nom}")
+    
+    # Generate unique calculation ID
+    calculation_id = str(uuid.uuid4())
+    
+    # Convert request to JSON format expected by calculator
+    questionnaire_data = {
+        "entreprise": {
+            "nom": request.entreprise.nom,
+            "secteur": request.entreprise.secteur,
+            "effectif": request.entreprise.effectif,
+            "chiffreAffaires": request.entreprise.chiffre_affaires,
+            "localisation": request.entreprise.localisation
+        },
+        "energie": {
+            "electricite_kwh": request.energie.electricite_kwh,
+            "gaz_kwh": request.energie.gaz_kwh,
+            "carburants_litres": request.energie.carburants_litres
+        },
+        "transport": {
+            "vehicules_km_annuel": request.transport.vehicules_km_annuel,
+            "vols_domestiques_km": request.transport.vols_domestiques_km,
+            "vols_internationaux_km": request.transport.vols_internationaux_km
+        },
+        "achats": {
+            "montant_achats_annuel": request.achats.montant_achats_annuel,
+            "pourcentage_local": request.achats.pourcentage_local
+        }
+    }
+    
+    # Process calculation on the executor, the event loop only does I/O
+    result = await calculation_executor.run(process_questionnaire_data, json.dumps(questionnaire_data))
+    
+    # Create response
+    unranked = CalculationResponse(
+        calculation_id=calculation_id,
+        status="completed",
+        total_co2e=result.total_co2e,
+        scope_1=result.scope_1,
+        scope_2=result.scope_2,
+        scope_3=result.scope_3,
+        breakdown=result.breakdown,
+        recommendations=result.recommendations,
+        benchmark_position=result.benchmark_position,
+        intensity_per_employee=result.intensity_per_employee,
+        intensity_per_revenue=result.intensity_per_revenue,
+        calculated_at=datetime.now()
+    )
+    # Rank against stored peers here, workers only know the static sector benchmarks
+    response = rank_against_peers(unranked, request.entreprise.secteur, request.entreprise.effectif)
+    
+    # Store result
+    payload = response.model_dump_json()
+    calculation_store.put(StoredCalculation(
+        calculation_id=calculation_id,
+        calculated_at=response.calculated_at,
+        company=request.entreprise.nom,
+        sector=request.entreprise.secteur,
+        effectif=request.entreprise.effectif,
+        payload=payload
+    ))
+    percentile_index.add(request.entreprise.secteur, request.entreprise.effectif, result.intensity_per_employee)
+    dashboard_rollups.add(
+        request.entreprise.secteur, request.entreprise.effectif, response.calculated_at,
+        result.total_co2e, result.scope_1, result.scope_2, result.scope_3,
+        result.intensity_per_employee, result.intensity_per_revenue,
+        calculation_id=calculation_id
+    )
+    result_cache.put(cache_key, unranked, len(payload))
+    
+    # Log success
+    logger.info(f"Calculation completed: {calculation_id} - {result.total_co2e} kgCO2e")
+    
+    return response
+
 @app.post("/api/v1/calculate", response_model=CalculationResponse)
 async def calculate_emissions(
     request: QuestionnaireRequest,
@@ -111,68 +324,156 @@ async def calculate_emissions(
     Calculate carbon footprint from questionnaire data
     """
     try:
-        logger.info(f"Starting calculation for company: {request.entreprise.nom}")
+        return await run_calculation(request)
+        
+    except ExecutorSaturated as e:
+        raise saturated_error(e)
+    except Exception as e:
+        logger.error(f"Calculation error: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Calculation failed: {str(e)}"
+        )
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Streaming response that leaves receive() to the request body reader.
+    
+    The stock StreamingResponse polls receive() for a disconnect while it sends,
+    which would steal body chunks from an endpoint still reading its upload.
+    A client disconnect surfaces through request.stream() instead.
+    """
+    media_type = "application/x-ndjson"
+    
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _iter_ndjson_lines(request: Request) -> AsyncIterator[Optional[bytes]]:
+    """Yield body lines as they arrive; None marks a line over the size limit"""
+    buffer = bytearray()
+    oversized = False
+    
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            piece = chunk[start:] if newline == -1 else chunk[start:newline]
+            
+            if not oversized:
+                buffer += piece
+                if len(buffer) > MAX_NDJSON_LINE_BYTES:
+                    # Drop the partial line instead of buffering an unbounded payload
+                    oversized = True
+                    buffer.clear()
+            
+            if newline == -1:
+                break
+            
+            yield None if oversized else bytes(buffer)
+            buffer.clear()
+            oversized = False
+            start = newline + 1
+    
+    if oversized:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
+
+async def _stream_calculations(request: Request) -> AsyncIterator[str]:
+    line_number = 0
+    async for line in _iter_ndjson_lines(request):
+        line_number += 1
         
-        # Generate unique calculation ID
-        calculation_id = str(uuid.uuid4())
+        if line is None:
+            yield json.dumps({
+                "line": line_number,
+                "status": "failed",
+                "detail": f"Line exceeds {MAX_NDJSON_LINE_BYTES} bytes"
+            }) + "\n"
+            continue
         
-        # Convert request to JSON format expected by calculator
-        questionnaire_data = {
-            "entreprise": {
-                "nom": request.entreprise.nom,
-                "secteur": request.entreprise.secteur,
-                "effectif": request.entreprise.effectif,
-                "chiffreAffaires": request.entreprise.chiffre_affaires,
-                "localisation": request.entreprise.localisation
-            },
-            "energie": {
-                "electricite_kwh": request.energie.electricite_kwh,
-                "gaz_kwh": request.energie.gaz_kwh,
-                "carburants_litres": request.energie.carburants_litres
-            },
-            "transport": {
-                "vehicules_km_annuel": request.transport.vehicules_km_annuel,
-                "vols_domestiques_km": request.transport.vols_domestiques_km,
-                "vols_internationaux_km": request.transport.vols_internationaux_km
-            },
-            "achats": {
-                "montant_achats_annuel": request.achats.montant_achats_annuel,
-                "pourcentage_local": request.achats.pourcentage_local
-            }
+        if not line.strip():
+            continue
+        
+        try:
+            questionnaire = QuestionnaireRequest.model_validate_json(line)
+            while True:
+                try:
+                    response = await run_calculation(questionnaire)
+                    break
+                except ExecutorSaturated as e:
+                    # The stream is already open, so back off instead of failing the line
+                    await asyncio.sleep(e.retry_after)
+            yield response.model_dump_json() + "\n"
+        except Exception as e:
+            logger.error(f"Stream calculation error on line {line_number}: {str(e)}")
+            yield json.dumps({
+                "line": line_number,
+                "status": "failed",
+                "detail": str(e)
+            }) + "\n"
+
+@app.post("/api/v1/calculate/stream")
+async def calculate_emissions_stream(request: Request):
+    """
+    Calculate footprints for a newline-delimited JSON upload of questionnaires.
+    
+    Each input line produces one output line, in order, as soon as it is computed.
+    Failed lines are reported with their line number instead of aborting the stream.
+    """
+    return NDJSONStreamingResponse(_stream_calculations(request))
+
+@app.post("/api/v1/calculate/batch", response_model=BatchCalculationResponse)
+async def calculate_emissions_batch(request: BatchCalculationRequest):
+    """
+    Calculate carbon footprints for a whole portfolio in one vectorized pass
+    """
+    try:
+        companies = request.companies
+        logger.info(f"Starting batch calculation for {len(companies)} companies")
+        
+        columns = {
+            "nom": [c.entreprise.nom for c in companies],
+            "secteur": [c.entreprise.secteur for c in companies],
+            "effectif": [c.entreprise.effectif for c in companies],
+            "chiffre_affaires": [c.entreprise.chiffre_affaires for c in companies],
+            "localisation": [c.entreprise.localisation for c in companies],
+            "electricite_kwh": [c.energie.electricite_kwh for c in companies],
+            "gaz_kwh": [c.energie.gaz_kwh for c in companies],
+            "carburants_litres": [c.energie.carburants_litres for c in companies],
+            "vehicules_km_annuel": [c.transport.vehicules_km_annuel for c in companies],
+            "vols_domestiques_km": [c.transport.vols_domestiques_km for c in companies],
+            "vols_internationaux_km": [c.transport.vols_internationaux_km for c in companies],
+            "montant_achats_annuel": [c.achats.montant_achats_annuel for c in companies],
+            "pourcentage_local": [c.achats.pourcentage_local for c in companies]
         }
         
-        # Process calculation
-        result = process_questionnaire_data(json.dumps(questionnaire_data))
+        factor_set_version, result = await calculation_executor.run(process_company_batch, columns)
+        empirical = percentile_index.percentiles(columns["secteur"], columns["effectif"], result.intensity_per_employee)
+        result.peer_comparison["percentile"] = np.where(
+            np.isnan(empirical), result.peer_comparison["percentile"], empirical
+        )
+        
+        batch_id = str(uuid.uuid4())
+        logger.info(f"Batch calculation completed: {batch_id} - {len(result)} companies")
         
-        # Create response
-        response = CalculationResponse(
-            calculation_id=calculation_id,
+        return BatchCalculationResponse(
+            batch_id=batch_id,
             status="completed",
-            total_co2e=result.total_co2e,
-            scope_1=result.scope_1,
-            scope_2=result.scope_2,
-            scope_3=result.scope_3,
-            breakdown=result.breakdown,
-            recommendations=result.recommendations,
-            benchmark_position=result.benchmark_position,
-            intensity_per_employee=result.intensity_per_employee,
-            intensity_per_revenue=result.intensity_per_revenue,
+            count=len(result),
+            factor_set_version=factor_set_version,
+            results=result.to_records(),
             calculated_at=datetime.now()
         )
         
-        # Store result
-        calculations_store[calculation_id] = response
-        
-        # Log success
-        logger.info(f"Calculation completed: {calculation_id} - {result.total_co2e} kgCO2e")
-        
-        return response
-        
+    except ExecutorSaturated as e:
+        raise saturated_error(e)
     except Exception as e:
-        logger.error(f"Calculation error: {str(e)}")
+        logger.error(f"Batch calculation error: {str(e)}")
         raise HTTPException(
             status_code=500,
-            detail=f"Calculation failed: {str(e)}"
+            detail=f"Batch calculation failed: {str(e)}"
         )
 
 @app.get("/api/v1/calculation/{calculation_id}", response_model=CalculationResponse)
@@ -180,41 +481,103 @@ async def get_calculation(calculation_id: str):
     """
     Retrieve calculation results by ID
     """
-    if calculation_id not in calculations_store:
+    calculation = load_calculation(calculation_id)
+    if calculation is None:
         raise HTTPException(
             status_code=404,
             detail="Calculation not found"
         )
     
-    return calculations_store[calculation_id]
+    return calculation
 
 @app.get("/api/v1/calculations")
-async def list_calculations(limit: int = 10, offset: int = 0):
+async def list_calculations(
+    limit: int = Query(10, ge=1, le=MAX_LIST_LIMIT),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    company: Optional[str] = None,
+    sector: Optional[str] = None
+):
     """
-    List recent calculations
+    List recent calculations, newest first.
+    
+    Pass the returned `next_cursor` back as `cursor` to page without offsets.
     """
-    calculations = list(calculations_store.values())
-    calculations.sort(key=lambda x: x.calculated_at, reverse=True)
+    if limit == 1 and offset == 0 and cursor is None and company is None and sector is None:
+        # Dashboard polling for the latest result
+        latest = calculation_store.latest()
+        records = [latest] if latest else []
+    else:
+        try:
+            records = calculation_store.list(
+                limit=limit, cursor=cursor, offset=offset, company=company, sector=sector
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
     return {
-        "calculations": calculations[offset:offset + limit],
-        "total": len(calculations),
+        "calculations": [CalculationResponse.model_validate_json(r.payload) for r in records],
+        "total": calculation_store.count(company=company, sector=sector),
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": encode_cursor(records[-1]) if len(records) == limit else None
     }
 
+@app.get("/api/v1/dashboard/rollups")
+async def get_dashboard_rollups():
+    """
+    Materialized totals, intensities and scope mixes: overall, per sector, per month and per size band
+    """
+    return {**dashboard_rollups.overview(), "calculations": dashboard_rollups.calculations}
+
+@app.get("/api/v1/dashboard/rollups/{dimension}")
+async def get_dashboard_rollup(dimension: str, key: Optional[str] = None):
+    """
+    One rollup dimension (secteur, mois, effectif, secteur_mois), or a single bucket with `key`
+    """
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown rollup dimension: {dimension}")
+    if key is None:
+        return {"dimension": dimension, "buckets": dashboard_rollups.view(dimension)}
+    bucket = dashboard_rollups.get(dimension, key)
+    if bucket is None:
+        raise HTTPException(status_code=404, detail=f"No calculations for {dimension}={key}")
+    return bucket
+
+@app.post("/api/v1/dashboard/rollups/rebuild")
+async def rebuild_dashboard_rollups_endpoint():
+    """
+    Recompute every rollup from the calculation store
+    """
+    await asyncio.get_running_loop().run_in_executor(None, rebuild_dashboard_rollups)
+    return {"status": "rebuilt", **dashboard_rollups.stats()}
+
+@app.get("/api/v1/cache/stats")
+async def get_cache_stats():
+    """
+    Result cache counters and occupancy
+    """
+    return result_cache.stats()
+
+@app.get("/api/v1/executor/metrics")
+async def get_executor_metrics():
+    """
+    Calculation queue depth, rejections and wait times
+    """
+    return calculation_executor.metrics()
+
 @app.get("/api/v1/emission-factors")
 async def get_emission_factors():
     """
     Get ADEME emission factors for reference
     """
-    from carbon_calculator import ADEMEDataProcessor
-    
-    processor = ADEMEDataProcessor()
+    factor_set = get_factor_registry().current()
     return {
-        "factors": processor.emission_factors,
+        "factors": dict(factor_set.emission_factors),
+        "version": factor_set.version,
         "source": "ADEME Base Carbone v17",
-        "last_updated": "2024"
+        "last_updated": "2024",
+        "loaded_at": factor_set.loaded_at.isoformat()
     }
 
 @app.get("/api/v1/sectors")
@@ -283,11 +646,10 @@ async def generate_ai_insights(calculation_id: str):
     """
     try:
         # Get calculation results
-        if calculation_id not in calculations_store:
+        result = load_calculation(calculation_id)
+        if result is None:
             raise HTTPException(status_code=404, detail="Calculation not found")
         
-        result = calculations_store[calculation_id]
-        
         # Prepare data for AI analysis
         analysis_prompt = f"""
         Analyse cette empreinte carbone d'entreprise et fournis des recommandations détaillées et personnalisées:
@@ -0,0 +1,307 @@
+"""
+CarbonScore - Calculation store
+Pluggable persistence for calculation results with an embedded SQLite backend
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import base64
+import bisect
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+@dataclass(frozen=True)
+class StoredCalculation:
+    """One persisted calculation with the columns it is indexed on"""
+    calculation_id: str
+    calculated_at: datetime
+    company: str
+    sector: str
+    effectif: str
+    payload: str  # Serialized CalculationResponse JSON
+
+    @property
+    def sort_key(self) -> Tuple[str, str]:
+        return (self.calculated_at.strftime(TIMESTAMP_FORMAT), self.calculation_id)
+
+def encode_cursor(record: StoredCalculation) -> str:
+    """Opaque keyset cursor pointing just after a record"""
+    raw = "|".join(record.sort_key).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor, raises ValueError on malformed input"""
+    try:
+        timestamp, calculation_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return timestamp, calculation_id
+
+class CalculationStore(ABC):
+    """Interface shared by all calculation store backends"""
+
+    @abstractmethod
+    def put(self, record: StoredCalculation):
+        ...
+
+    @abstractmethod
+    def get(self, calculation_id: str) -> Optional[StoredCalculation]:
+        ...
+
+    @abstractmethod
+    def latest(self) -> Optional[StoredCalculation]:
+        ...
+
+    @abstractmethod
+    def list(self, limit: int = 10, cursor: Optional[str] = None, offset: int = 0,
+             company: Optional[str] = None, sector: Optional[str] = None) -> List[StoredCalculation]:
+        """Most recent first; resume after `cursor` (keyset) or skip `offset` rows"""
+        ...
+
+    @abstractmethod
+    def count(self, company: Optional[str] = None, sector: Optional[str] = None) -> int:
+        """Number of stored calculations matching the same filters as `list`"""
+        ...
+
+    @abstractmethod
+    def iter_all(self, batch_size: int = 1000) -> Iterator[StoredCalculation]:
+        """Every stored calculation, oldest first"""
+        ...
+
+    def close(self):
+        pass
+
+class MemoryCalculationStore(CalculationStore):
+    """Bounded in-process store, for development and tests"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._records = {}
+        self._order: List[Tuple[str, str]] = []  # Sort keys, oldest first
+        self._lock = threading.Lock()
+
+    def put(self, record: StoredCalculation):
+        with self._lock:
+            previous = self._records.get(record.calculation_id)
+            if previous is not None:
+                self._order.pop(bisect.bisect_left(self._order, previous.sort_key))
+            self._records[record.calculation_id] = record
+            bisect.insort(self._order, record.sort_key)
+
+            while len(self._order) > self.max_entries:
+                _, oldest_id = self._order.pop(0)
+                del self._records[oldest_id]
+
+    def get(self, calculation_id: str) -> Optional[StoredCalculation]:
+        return self._records.get(calculation_id)
+
+    def latest(self) -> Optional[StoredCalculation]:
+        with self._lock:
+            return self._records[self._order[-1][1]] if self._order else None
+
+    def list(self, limit=10, cursor=None, offset=0, company=None, sector=None):
+        with self._lock:
+            end = bisect.bisect_left(self._order, decode_cursor(cursor)) if cursor else len(self._order)
+            results = []
+            skipped = 0
+            for i in range(end - 1, -1, -1):
+                record = self._records[self._order[i][1]]
+                if (company is not None and record.company != company) or \
+                   (sector is not None and record.sector != sector):
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                results.append(record)
+                if len(results) >= limit:
+                    break
+            return results
+
+    def count(self, company=None, sector=None) -> int:
+        if company is None and sector is None:
+            return len(self._records)
+        with self._lock:
+            return sum(
+                1 for record in self._records.values()
+                if (company is None or record.company == company) and
+                   (sector is None or record.sector == sector)
+            )
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[StoredCalculation]:
+        with self._lock:
+            records = [self._records[calculation_id] for _, calculation_id in self._order]
+        return iter(records)
+
+class SQLiteCalculationStore(CalculationStore):
+    """Embedded SQLite store with a bounded hot tier of recent records"""
+
+    def __init__(self, path: str, hot_entries: int = 1000):
+        self.path = path
+        self.hot_entries = hot_entries
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._hot: "OrderedDict[str, StoredCalculation]" = OrderedDict()
+        self._latest: Optional[StoredCalculation] = None
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS calculations (
+                    calculation_id TEXT PRIMARY KEY,
+                    calculated_at TEXT NOT NULL,
+                    company TEXT NOT NULL,
+                    sector TEXT NOT NULL,
+                    effectif TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_calculations_recent ON calculations (calculated_at, calculation_id)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_calculations_company ON calculations (company, calculated_at, calculation_id)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_calculations_sector ON calculations (sector, calculated_at, calculation_id)"
+            )
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT COUNT(*) FROM calculations").fetchone()[0]
+
+        logger.info(f"Calculation store opened at {path} ({self._count} calculations)")
+
+    def put(self, record: StoredCalculation):
+        with self._lock:
+            exists = self._hot.get(record.calculation_id) is not None or self._conn.execute(
+                "SELECT 1 FROM calculations WHERE calculation_id = ?", (record.calculation_id,)
+            ).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO calculations VALUES (?, ?, ?, ?, ?, ?)",
+                (record.calculation_id, record.sort_key[0], record.company,
+                 record.sector, record.effectif, record.payload)
+            )
+            self._conn.commit()
+            if not exists:
+                self._count += 1
+
+            self._remember(record)
+            if self._latest is None or record.sort_key >= self._latest.sort_key:
+                self._latest = record
+
+    def get(self, calculation_id: str) -> Optional[StoredCalculation]:
+        with self._lock:
+            record = self._hot.get(calculation_id)
+            if record is not None:
+                self._hot.move_to_end(calculation_id)
+                return record
+
+            row = self._conn.execute(
+                "SELECT * FROM calculations WHERE calculation_id = ?", (calculation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            record = self._from_row(row)
+            self._remember(record)
+            return record
+
+    def latest(self) -> Optional[StoredCalculation]:
+        with self._lock:
+            if self._latest is None and self._count:
+                row = self._conn.execute(
+                    "SELECT * FROM calculations ORDER BY calculated_at DESC, calculation_id DESC LIMIT 1"
+                ).fetchone()
+                self._latest = self._from_row(row) if row else None
+            return self._latest
+
+    def list(self, limit=10, cursor=None, offset=0, company=None, sector=None):
+        clauses, params = self._filters(company, sector)
+        if cursor:
+            clauses.append("(calculated_at, calculation_id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = (
+            f"SELECT * FROM calculations {where} "
+            "ORDER BY calculated_at DESC, calculation_id DESC LIMIT ? OFFSET ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(query, (*params, limit, offset)).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def count(self, company=None, sector=None) -> int:
+        if company is None and sector is None:
+            return self._count
+        clauses, params = self._filters(company, sector)
+        # Served by the company / sector indexes
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM calculations WHERE {' AND '.join(clauses)}", params
+            ).fetchone()[0]
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[StoredCalculation]:
+        after = ("", "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM calculations WHERE (calculated_at, calculation_id) > (?, ?) "
+                    "ORDER BY calculated_at, calculation_id LIMIT ?",
+                    (*after, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._from_row(row)
+            after = (rows[-1][1], rows[-1][0])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, record: StoredCalculation):
+        self._hot[record.calculation_id] = record
+        self._hot.move_to_end(record.calculation_id)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    @staticmethod
+    def _filters(company: Optional[str], sector: Optional[str]) -> Tuple[List[str], list]:
+        clauses = []
+        params: list = []
+        if company is not None:
+            clauses.append("company = ?")
+            params.append(company)
+        if sector is not None:
+            clauses.append("sector = ?")
+            params.append(sector)
+        return clauses, params
+
+    @staticmethod
+    def _from_row(row) -> StoredCalculation:
+        calculation_id, calculated_at, company, sector, effectif, payload = row
+        return StoredCalculation(
+            calculation_id=calculation_id,
+            calculated_at=datetime.strptime(calculated_at, TIMESTAMP_FORMAT),
+            company=company,
+            sector=sector,
+            effectif=effectif,
+            payload=payload
+        )
+
+def open_calculation_store(url: str, hot_entries: int = 1000) -> CalculationStore:
+    """Build a store from a URL: sqlite:///path/to/file.db or memory://"""
+    if url.startswith("sqlite:///"):
+        return SQLiteCalculationStore(url[len("sqlite:///"):], hot_entries=hot_entries)
+    if url.startswith("memory://"):
+        return MemoryCalculationStore(max_entries=hot_entries)
+    raise ValueError(f"Unsupported calculation store URL: {url}")
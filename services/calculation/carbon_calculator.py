@@ -5,13 +5,22 @@ Advanced preprocessing and calculation engine using ADEME Base Carbone v17 data
 
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
 from dataclasses import dataclass
+from datetime import datetime
 from enum import Enum
+from types import MappingProxyType
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
 from pathlib import Path
 
+from factor_snapshot import FactorSnapshot, default_snapshot_path, open_fresh_snapshot
+from percentile_index import PercentileIndex, benchmark_label
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -46,6 +55,90 @@ class CompanyData:
     montant_achats_annuel: float
     pourcentage_local: float
 
+def _round_array(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """Round like the builtin round(), which np.round misses on near-half values"""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_tie.any():
+        idx = np.flatnonzero(near_tie)
+        rounded[idx] = [round(v, ndigits) for v in values[idx].tolist()]
+    return rounded
+
+@dataclass
+class BatchEmissionResult:
+    """Columnar carbon footprint results for a batch of companies"""
+    nom: np.ndarray
+    total_co2e: np.ndarray
+    scope_1: np.ndarray
+    scope_2: np.ndarray
+    scope_3: np.ndarray
+    breakdown: Dict[str, np.ndarray]
+    intensity_per_employee: np.ndarray
+    intensity_per_revenue: np.ndarray  # NaN where revenue is unknown
+    carbon_efficiency_score: np.ndarray
+    sustainability_grade: np.ndarray
+    reduction_potential: Dict[str, np.ndarray]
+    trajectory_2030: Dict[str, np.ndarray]
+    peer_comparison: Dict[str, np.ndarray]
+    
+    def __len__(self) -> int:
+        return len(self.total_co2e)
+    
+    def to_frame(self) -> pd.DataFrame:
+        """Flatten the batch into one row per company"""
+        columns = {
+            'nom': self.nom,
+            'total_co2e': self.total_co2e,
+            'scope_1': self.scope_1,
+            'scope_2': self.scope_2,
+            'scope_3': self.scope_3,
+            'intensity_per_employee': self.intensity_per_employee,
+            'intensity_per_revenue': self.intensity_per_revenue,
+            'carbon_efficiency_score': self.carbon_efficiency_score,
+            'sustainability_grade': self.sustainability_grade,
+        }
+        for prefix in ('breakdown', 'reduction_potential', 'trajectory_2030', 'peer_comparison'):
+            for key, values in getattr(self, prefix).items():
+                columns[f"{prefix}.{key}"] = values
+        return pd.DataFrame(columns)
+    
+    def to_records(self) -> List[Dict]:
+        """Convert the batch into one nested dict per company, in input order"""
+        def nested(columns: Dict[str, np.ndarray]) -> List[Dict[str, float]]:
+            keys = list(columns)
+            rows = zip(*(columns[k].tolist() for k in keys))
+            return [dict(zip(keys, row)) for row in rows]
+        
+        intensity_per_revenue = [None if np.isnan(v) else v for v in self.intensity_per_revenue.tolist()]
+        return [
+            {
+                'nom': nom,
+                'total_co2e': total,
+                'scope_1': s1,
+                'scope_2': s2,
+                'scope_3': s3,
+                'breakdown': breakdown,
+                'intensity_per_employee': per_employee,
+                'intensity_per_revenue': per_revenue,
+                'carbon_efficiency_score': score,
+                'sustainability_grade': grade,
+                'reduction_potential': reduction,
+                'trajectory_2030': trajectory,
+                'peer_comparison': peers,
+            }
+            for nom, total, s1, s2, s3, breakdown, per_employee, per_revenue, score, grade, reduction, trajectory, peers
+            in zip(
+                self.nom.tolist(), self.total_co2e.tolist(), self.scope_1.tolist(),
+                self.scope_2.tolist(), self.scope_3.tolist(), nested(self.breakdown),
+                self.intensity_per_employee.tolist(), intensity_per_revenue,
+                self.carbon_efficiency_score.tolist(), self.sustainability_grade.tolist(),
+                nested(self.reduction_potential), nested(self.trajectory_2030),
+                nested(self.peer_comparison)
+            )
+        ]
+
 @dataclass
 class EmissionResult:
     """Carbon footprint calculation result"""
@@ -71,24 +164,53 @@ class EmissionResult:
     certification_readiness: Dict[str, bool]  # ISO 14001, etc.
     ai_insights: Dict[str, str]  # AI-generated insights
 
+# Headcount used for each questionnaire size band
+EMPLOYEE_COUNT_BY_BAND = {'1-9': 5, '10-49': 25, '50-249': 125, '250+': 500}
+DEFAULT_EMPLOYEE_COUNT = 25
+
+# Realistic reduction rate by breakdown category
+REDUCTION_RATES = {
+    'electricite': 0.30,          # 30% renewable energy
+    'vehicules': 0.50,            # 50% electric vehicles
+    'vols_domestiques': 0.25,     # 25% video conferencing
+    'vols_internationaux': 0.25,
+    'achats': 0.20,               # 20% local sourcing
+}
+DEFAULT_REDUCTION_RATE = 0.15     # 15% general efficiency
+
+# Sustainability grades by minimum carbon efficiency score
+GRADE_THRESHOLDS = [(90, "A+"), (80, "A"), (70, "B"), (60, "C"), (50, "D")]
+
+# Default location of the Base Carbone export, overridable per deployment
+ADEME_DATA_PATH = os.getenv("ADEME_DATA_PATH", "../../data/basecarbone-v17-fr.csv")
+# Compiled snapshot of that export (see factor_snapshot.py), defaults to a sibling .calc.fsnap file
+ADEME_SNAPSHOT_PATH = os.getenv("ADEME_SNAPSHOT_PATH")
+
 class ADEMEDataProcessor:
     """ADEME Base Carbone v17 data processor"""
     
-    def __init__(self, data_path: str = "../../data/basecarbone-v17-fr.csv"):
+    def __init__(self, data_path: str = ADEME_DATA_PATH, snapshot_path: Optional[str] = ADEME_SNAPSHOT_PATH):
         self.data_path = Path(data_path)
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else default_snapshot_path(self.data_path)
+        self.snapshot: Optional[FactorSnapshot] = None
         self.emission_factors = None
         self.load_ademe_data()
     
     def load_ademe_data(self):
         """Load and preprocess ADEME emission factors"""
         try:
-            logger.info("Loading ADEME Base Carbone v17 data...")
-            
-            # Load CSV with proper encoding
-            df = pd.read_csv(self.data_path, encoding='utf-8', sep=';')
-            
-            # Clean and structure the data
-            df = df.dropna(subset=['Nom base français', 'Total poste non décomposé'])
+            # A fresh compiled snapshot is memory-mapped instead of parsing the CSV
+            self.snapshot = open_fresh_snapshot(self.data_path, self.snapshot_path)
+            if self.snapshot is not None:
+                logger.info(f"Mapped ADEME snapshot {self.snapshot_path} ({len(self.snapshot)} factors)")
+            else:
+                logger.info("Loading ADEME Base Carbone v17 data...")
+                
+                # Load CSV with proper encoding
+                df = pd.read_csv(self.data_path, encoding='utf-8', sep=';')
+                
+                # Clean and structure the data
+                df = df.dropna(subset=['Nom base français', 'Total poste non décomposé'])
             
             # Create emission factors dictionary
             self.emission_factors = {
@@ -138,12 +260,138 @@ class ADEMEDataProcessor:
         """Get emission factor by name"""
         return self.emission_factors.get(factor_name, 0.0)
 
+@dataclass(frozen=True)
+class FactorSet:
+    """Immutable snapshot of emission factors, safe to share between requests"""
+    emission_factors: Mapping[str, float]
+    version: str
+    source_path: str
+    loaded_at: datetime
+    
+    def get_factor(self, factor_name: str) -> float:
+        """Get emission factor by name"""
+        return self.emission_factors.get(factor_name, 0.0)
+
+class FactorRegistry:
+    """Process-wide holder of the current FactorSet with hot reload on file change"""
+    
+    def __init__(self, data_path: str = ADEME_DATA_PATH, check_interval: float = 5.0,
+                 snapshot_path: Optional[str] = ADEME_SNAPSHOT_PATH):
+        self.data_path = Path(data_path)
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else default_snapshot_path(self.data_path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._factor_set: Optional[FactorSet] = None
+        self._file_stat: Optional[Tuple] = None
+        self._file_hash: Optional[str] = None
+        self._last_check = 0.0
+        self._listeners: List[Callable[[FactorSet], None]] = []
+    
+    def current(self) -> FactorSet:
+        """Return the current factor set, reloading it if the source file changed"""
+        factor_set = self._factor_set
+        if factor_set is None:
+            return self.reload()
+        
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._stat_source() != self._file_stat:
+                return self.reload()
+        
+        return factor_set
+    
+    def reload(self, force: bool = False) -> FactorSet:
+        """Reload factors from disk and atomically swap the shared snapshot"""
+        with self._lock:
+            file_stat = self._stat_source()
+            if not force and self._factor_set is not None and file_stat == self._file_stat:
+                return self._factor_set
+            
+            file_hash = self._hash_source() if any(file_stat) else None
+            if not force and self._factor_set is not None and file_hash == self._file_hash:
+                # Touched but unchanged file: keep the snapshot, remember the new stat
+                self._file_stat = file_stat
+                return self._factor_set
+            
+            processor = ADEMEDataProcessor(str(self.data_path), str(self.snapshot_path))
+            version = f"v17-{file_hash[:12]}" if file_hash else "v17-default"
+            factor_set = FactorSet(
+                emission_factors=MappingProxyType(dict(processor.emission_factors)),
+                version=version,
+                source_path=str(self.data_path),
+                loaded_at=datetime.now()
+            )
+            
+            self._factor_set = factor_set
+            self._file_stat = file_stat
+            self._file_hash = file_hash
+            self._last_check = time.monotonic()
+            listeners = list(self._listeners)
+        
+        logger.info(f"Emission factor set {factor_set.version} is now active")
+        for listener in listeners:
+            try:
+                listener(factor_set)
+            except Exception as e:
+                logger.error(f"Factor reload listener failed: {e}")
+        
+        return factor_set
+    
+    def add_reload_listener(self, listener: Callable[[FactorSet], None]):
+        """Register a callback invoked after every factor set swap"""
+        with self._lock:
+            self._listeners.append(listener)
+    
+    def _stat_source(self) -> Tuple:
+        stats = []
+        for path in (self.data_path, self.snapshot_path):
+            try:
+                stat = path.stat()
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append(None)
+        return tuple(stats)
+    
+    def _hash_source(self) -> Optional[str]:
+        # A fresh snapshot already records the CSV hash, no need to read the CSV
+        snapshot = open_fresh_snapshot(self.data_path, self.snapshot_path)
+        if snapshot is not None:
+            file_hash = snapshot.header.get("source_sha256")
+            snapshot.close()
+            if file_hash:
+                return file_hash
+        
+        digest = hashlib.sha256()
+        try:
+            with open(self.data_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+_factor_registry: Optional[FactorRegistry] = None
+_factor_registry_lock = threading.Lock()
+
+def get_factor_registry() -> FactorRegistry:
+    """Return the process-wide factor registry, creating it on first use"""
+    global _factor_registry
+    if _factor_registry is None:
+        with _factor_registry_lock:
+            if _factor_registry is None:
+                _factor_registry = FactorRegistry()
+    return _factor_registry
+
 class CarbonCalculator:
     """Main carbon footprint calculator"""
     
-    def __init__(self):
-        self.ademe_processor = ADEMEDataProcessor()
+    def __init__(self, factor_set: Optional[FactorSet] = None, percentile_index: Optional[PercentileIndex] = None):
+        # Any object exposing get_factor() works here; a FactorSet is shared and read-only
+        self.ademe_processor = factor_set or get_factor_registry().current()
         self.sector_benchmarks = self._load_sector_benchmarks()
+        # Empirical peer distributions; the static sector benchmarks are the fallback
+        self.percentile_index = percentile_index
     
     def _load_sector_benchmarks(self) -> Dict[str, Dict[str, float]]:
         """Load sector benchmark data"""
@@ -223,6 +471,139 @@ class CarbonCalculator:
             **advanced_kpis
         )
     
+    def calculate_emissions_batch(self, companies) -> BatchEmissionResult:
+        """Calculate footprints for many companies at once with array operations
+        
+        `companies` is a DataFrame or a mapping of columns named like the
+        CompanyData fields, or a sequence of CompanyData records.
+        """
+        df = self._company_frame(companies)
+        n = len(df)
+        logger.info(f"Calculating emissions for a batch of {n} companies")
+        
+        def column(name: str) -> np.ndarray:
+            return df[name].to_numpy(dtype=float)
+        
+        electricite_kwh = column('electricite_kwh')
+        gaz_kwh = column('gaz_kwh')
+        pourcentage_local = column('pourcentage_local')
+        chiffre_affaires = pd.to_numeric(df['chiffre_affaires'], errors='coerce').to_numpy(dtype=float)
+        factor = self.ademe_processor.get_factor
+        
+        # Unrounded emissions by category, in the same order as the scalar path
+        purchase_base = column('montant_achats_annuel') * factor('achats_biens')
+        local_reduction = (pourcentage_local / 100) * factor('transport_reduction')
+        raw = {
+            'electricite': electricite_kwh * factor('electricite_france'),
+            'gaz': gaz_kwh * factor('gaz_naturel'),
+            'carburants': column('carburants_litres') * factor('essence'),
+            'vehicules': column('vehicules_km_annuel') * factor('voiture_essence'),
+            'vols_domestiques': column('vols_domestiques_km') * factor('avion_domestique'),
+            'vols_internationaux': column('vols_internationaux_km') * factor('avion_international'),
+            'achats': purchase_base * (1 - local_reduction),
+        }
+        
+        scope_1 = raw['carburants'] + raw['gaz'] + raw['vehicules']
+        scope_2 = raw['electricite']
+        upstream_energy = electricite_kwh * 0.0134 + gaz_kwh * 0.0456
+        scope_3 = (raw['vols_domestiques'] + raw['vols_internationaux']) + raw['achats'] + upstream_energy
+        total_co2e = scope_1 + scope_2 + scope_3
+        
+        breakdown = {k: _round_array(v, 2) for k, v in raw.items()}
+        
+        employees_count = (
+            df['effectif'].map(EMPLOYEE_COUNT_BY_BAND).fillna(DEFAULT_EMPLOYEE_COUNT).to_numpy(dtype=float)
+        )
+        intensity = total_co2e / employees_count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            intensity_per_revenue = np.where(
+                np.nan_to_num(chiffre_affaires) != 0, total_co2e / chiffre_affaires * 1000, np.nan
+            )
+        # The scalar path drops only an exact zero; a small intensity rounds to 0.0
+        intensity_per_revenue[intensity_per_revenue == 0] = np.nan
+        intensity_per_revenue = _round_array(intensity_per_revenue, 4)
+        
+        # Sector benchmark columns, unknown sectors fall back to services
+        sectors = list(self.sector_benchmarks)
+        sector_idx = (
+            df['secteur'].map({s: i for i, s in enumerate(sectors)})
+            .fillna(sectors.index('services')).to_numpy(dtype=int)
+        )
+        sector_avg = np.array([self.sector_benchmarks[s]['co2e_per_employee'] for s in sectors])[sector_idx]
+        sector_p25 = np.array([self.sector_benchmarks[s]['percentile_25'] for s in sectors])[sector_idx]
+        sector_p75 = np.array([self.sector_benchmarks[s]['percentile_75'] for s in sectors])[sector_idx]
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efficiency_ratio = sector_avg / intensity
+        carbon_efficiency_score = np.clip(np.nan_to_num(efficiency_ratio * 50, nan=0.0, posinf=100.0), 0, 100)
+        sustainability_grade = np.select(
+            [carbon_efficiency_score >= threshold for threshold, _ in GRADE_THRESHOLDS],
+            [grade for _, grade in GRADE_THRESHOLDS],
+            default="F"
+        )
+        
+        reduction = {
+            k: v * REDUCTION_RATES.get(k, DEFAULT_REDUCTION_RATE) for k, v in breakdown.items()
+        }
+        feasible_with_actions = np.zeros(n)
+        for values in reduction.values():
+            feasible_with_actions = feasible_with_actions + values
+        trajectory_2030 = {
+            'current': total_co2e,
+            'target_2030': total_co2e * 0.45,
+            'annual_reduction_needed': total_co2e * 0.055,
+            'feasible_with_actions': feasible_with_actions
+        }
+        
+        percentile = np.select(
+            [intensity <= sector_p25, intensity <= sector_avg, intensity <= sector_p75],
+            [25, 50, 75],
+            default=90
+        ).astype(float)
+        if self.percentile_index is not None:
+            empirical = self.percentile_index.percentiles(df['secteur'], df['effectif'], intensity)
+            percentile = np.where(np.isnan(empirical), percentile, empirical)
+        peer_comparison = {
+            'percentile': percentile,
+            'sector_average': sector_avg * employees_count,
+            'best_in_class': sector_p25 * employees_count,
+            'improvement_needed': np.maximum(0, total_co2e - sector_p25 * employees_count)
+        }
+        
+        return BatchEmissionResult(
+            nom=df['nom'].to_numpy(dtype=object),
+            total_co2e=_round_array(total_co2e, 2),
+            scope_1=_round_array(scope_1, 2),
+            scope_2=_round_array(scope_2, 2),
+            scope_3=_round_array(scope_3, 2),
+            breakdown=breakdown,
+            intensity_per_employee=_round_array(intensity, 2),
+            intensity_per_revenue=intensity_per_revenue,
+            carbon_efficiency_score=_round_array(carbon_efficiency_score, 1),
+            sustainability_grade=sustainability_grade.astype(object),
+            reduction_potential={k: _round_array(v, 2) for k, v in reduction.items()},
+            trajectory_2030={k: _round_array(v, 2) for k, v in trajectory_2030.items()},
+            peer_comparison={k: _round_array(v, 2) for k, v in peer_comparison.items()}
+        )
+    
+    def _company_frame(self, companies) -> pd.DataFrame:
+        """Normalize batch input into a DataFrame with CompanyData columns"""
+        if isinstance(companies, pd.DataFrame):
+            df = companies
+        elif isinstance(companies, Mapping):
+            df = pd.DataFrame(companies)
+        else:
+            records = list(companies)
+            df = pd.DataFrame(
+                [[getattr(c, f) for f in CompanyData.__dataclass_fields__] for c in records],
+                columns=list(CompanyData.__dataclass_fields__)
+            )
+        
+        missing = [f for f in CompanyData.__dataclass_fields__ if f not in df.columns]
+        if missing:
+            raise ValueError(f"Missing company columns: {', '.join(missing)}")
+        return df.reset_index(drop=True)
+    
     def _calculate_scope_1(self, data: CompanyData) -> float:
         """Calculate Scope 1 emissions (direct emissions)"""
         emissions = 0.0
@@ -353,6 +734,11 @@ class CarbonCalculator:
         
         intensity = total_emissions / employees_count
         
+        if self.percentile_index is not None:
+            percentile = self.percentile_index.percentile(data.secteur, data.effectif, intensity)
+            if percentile is not None:
+                return benchmark_label(percentile)
+        
         if intensity <= sector_data['percentile_25']:
             return "Excellent - Top 25% de votre secteur"
         elif intensity <= sector_data['co2e_per_employee']:
@@ -364,16 +750,7 @@ class CarbonCalculator:
     
     def _parse_employee_count(self, effectif: str) -> int:
         """Parse employee count from string format"""
-        if effectif == '1-9':
-            return 5
-        elif effectif == '10-49':
-            return 25
-        elif effectif == '50-249':
-            return 125
-        elif effectif == '250+':
-            return 500
-        else:
-            return 25  # Default
+        return EMPLOYEE_COUNT_BY_BAND.get(effectif, DEFAULT_EMPLOYEE_COUNT)
     
     def _calculate_advanced_kpis(self, data: CompanyData, total_emissions: float, breakdown: Dict[str, float]) -> Dict:
         """Calculate advanced KPIs and metrics"""
@@ -385,32 +762,15 @@ class CarbonCalculator:
         carbon_efficiency_score = min(100, max(0, efficiency_ratio * 50))
         
         # Sustainability Grade
-        if carbon_efficiency_score >= 90:
-            sustainability_grade = "A+"
-        elif carbon_efficiency_score >= 80:
-            sustainability_grade = "A"
-        elif carbon_efficiency_score >= 70:
-            sustainability_grade = "B"
-        elif carbon_efficiency_score >= 60:
-            sustainability_grade = "C"
-        elif carbon_efficiency_score >= 50:
-            sustainability_grade = "D"
-        else:
-            sustainability_grade = "F"
+        sustainability_grade = next(
+            (grade for threshold, grade in GRADE_THRESHOLDS if carbon_efficiency_score >= threshold),
+            "F"
+        )
         
         # Reduction Potential (realistic savings by category)
         reduction_potential = {}
         for category, emissions in breakdown.items():
-            if category == 'electricite':
-                reduction_potential[category] = emissions * 0.30  # 30% renewable energy
-            elif category == 'vehicules':
-                reduction_potential[category] = emissions * 0.50  # 50% electric vehicles
-            elif category in ['vols_domestiques', 'vols_internationaux']:
-                reduction_potential[category] = emissions * 0.25  # 25% video conferencing
-            elif category == 'achats':
-                reduction_potential[category] = emissions * 0.20  # 20% local sourcing
-            else:
-                reduction_potential[category] = emissions * 0.15  # 15% general efficiency
+            reduction_potential[category] = emissions * REDUCTION_RATES.get(category, DEFAULT_REDUCTION_RATE)
         
         # 2030 Trajectory (55% reduction target)
         trajectory_2030 = {
@@ -443,7 +803,7 @@ class CarbonCalculator:
         
         # Peer Comparison
         peer_comparison = {
-            'percentile': self._calculate_percentile(data.secteur, total_emissions / employees_count),
+            'percentile': self._calculate_percentile(data.secteur, total_emissions / employees_count, data.effectif),
             'sector_average': sector_avg['co2e_per_employee'] * employees_count,
             'best_in_class': sector_avg['percentile_25'] * employees_count,
             'improvement_needed': max(0, total_emissions - sector_avg['percentile_25'] * employees_count)
@@ -477,8 +837,13 @@ class CarbonCalculator:
             'ai_insights': ai_insights
         }
     
-    def _calculate_percentile(self, sector: str, intensity: float) -> int:
+    def _calculate_percentile(self, sector: str, intensity: float, effectif: Optional[str] = None) -> float:
         """Calculate percentile position in sector"""
+        if self.percentile_index is not None and effectif is not None:
+            percentile = self.percentile_index.percentile(sector, effectif, intensity)
+            if percentile is not None:
+                return percentile
+        
         sector_data = self.sector_benchmarks.get(sector, self.sector_benchmarks['services'])
         
         if intensity <= sector_data['percentile_25']:
@@ -513,8 +878,8 @@ def process_questionnaire_data(questionnaire_json: str) -> EmissionResult:
             pourcentage_local=data_dict['achats']['pourcentage_local']
         )
         
-        # Calculate emissions
-        calculator = CarbonCalculator()
+        # Calculate emissions against the shared, preloaded factor set
+        calculator = CarbonCalculator(get_factor_registry().current())
         result = calculator.calculate_emissions(company_data)
         
         logger.info(f"Calculation completed for {company_data.nom}: {result.total_co2e} kgCO2e")
@@ -524,6 +889,11 @@ def process_questionnaire_data(questionnaire_json: str) -> EmissionResult:
         logger.error(f"Error processing questionnaire data: {e}")
         raise
 
+def process_company_batch(companies) -> Tuple[str, BatchEmissionResult]:
+    """Vectorized calculation of a portfolio, with the factor set version it used"""
+    factor_set = get_factor_registry().current()
+    return factor_set.version, CarbonCalculator(factor_set).calculate_emissions_batch(companies)
+
 if __name__ == "__main__":
     # Test with sample data
     sample_data = {
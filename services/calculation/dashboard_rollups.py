@@ -0,0 +1,270 @@
+"""
+CarbonScore - Dashboard rollups
+Materialized aggregates of stored calculations per sector, month and size band
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Rollup dimensions; "global" has a single bucket
+DIMENSIONS = ("global", "secteur", "mois", "effectif", "secteur_mois")
+GLOBAL_KEY = "*"
+
+# Summed per bucket; intensity_per_revenue only over calculations that have one
+MEASURES = ("total_co2e", "scope_1", "scope_2", "scope_3", "intensity_per_employee", "intensity_per_revenue")
+
+def month_key(calculated_at: datetime) -> str:
+    return calculated_at.strftime("%Y-%m")
+
+def bucket_keys(sector: str, effectif: str, calculated_at: datetime) -> List[Tuple[str, str]]:
+    """(dimension, key) of every bucket one calculation contributes to"""
+    month = month_key(calculated_at)
+    return [
+        ("global", GLOBAL_KEY),
+        ("secteur", sector),
+        ("mois", month),
+        ("effectif", effectif),
+        ("secteur_mois", f"{sector}|{month}")
+    ]
+
+class RollupBucket:
+    """Running sums for one (dimension, key)"""
+
+    __slots__ = ("count", "revenue_count", "sums", "last_calculated_at")
+
+    def __init__(self):
+        self.count = 0
+        self.revenue_count = 0
+        self.sums = [0.0] * len(MEASURES)
+        self.last_calculated_at: Optional[datetime] = None
+
+    def add(self, values: Tuple[float, ...], calculated_at: datetime, count: int = 1, revenue_count: int = 1):
+        self.count += count
+        self.revenue_count += revenue_count
+        for i, value in enumerate(values):
+            self.sums[i] += value
+        if self.last_calculated_at is None or calculated_at > self.last_calculated_at:
+            self.last_calculated_at = calculated_at
+
+    def to_dict(self, key: str) -> Dict:
+        total, scope_1, scope_2, scope_3, per_employee, per_revenue = self.sums
+        return {
+            "key": key,
+            "count": self.count,
+            "total_co2e": total,
+            "average_co2e": total / self.count if self.count else 0.0,
+            "scope_1": scope_1,
+            "scope_2": scope_2,
+            "scope_3": scope_3,
+            "scope_mix": {
+                "scope_1": scope_1 / total if total > 0 else 0.0,
+                "scope_2": scope_2 / total if total > 0 else 0.0,
+                "scope_3": scope_3 / total if total > 0 else 0.0
+            },
+            "intensity_per_employee": per_employee / self.count if self.count else 0.0,
+            "intensity_per_revenue": per_revenue / self.revenue_count if self.revenue_count else None,
+            "last_calculated_at": self.last_calculated_at.isoformat() if self.last_calculated_at else None
+        }
+
+class DashboardRollups:
+    """Buckets for every dimension, patched on each stored calculation.
+
+    Reads serve a per-dimension view that is built once, then kept sorted by
+    patching the entries a write touches in place, so neither a dashboard load
+    nor a write rebuilds the other buckets of a dimension.
+
+    A rebuild runs while calculations keep arriving: adds made meanwhile are
+    logged and replayed onto the rebuilt buckets before the swap, unless the
+    history it read already contained them (matched on calculation id).
+    """
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], RollupBucket] = {}
+        self._views: Dict[str, List[Dict]] = {}
+        # Index of each key in its dimension's view, kept in step with the view
+        self._positions: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuild_log: Optional[List[Tuple]] = None
+        self.calculations = 0
+
+    def add(self, sector: str, effectif: str, calculated_at: datetime, total_co2e: float,
+            scope_1: float, scope_2: float, scope_3: float, intensity_per_employee: float,
+            intensity_per_revenue: Optional[float], calculation_id: Optional[str] = None):
+        """Record one stored calculation"""
+        has_revenue = intensity_per_revenue is not None and np.isfinite(intensity_per_revenue)
+        values = (total_co2e, scope_1, scope_2, scope_3, intensity_per_employee,
+                  intensity_per_revenue if has_revenue else 0.0)
+        with self._lock:
+            if self._rebuild_log is not None:
+                self._rebuild_log.append((calculation_id, sector, effectif, calculated_at, values, has_revenue))
+            for dimension, key in self._apply(self._buckets, sector, effectif, calculated_at, values, has_revenue):
+                if dimension in self._views:
+                    self._patch_view(dimension, key)
+            self.calculations += 1
+
+    def add_payload(self, sector: str, effectif: str, payload: Dict):
+        """Record a calculation from its CalculationResponse fields"""
+        calculated_at = payload["calculated_at"]
+        if isinstance(calculated_at, str):
+            calculated_at = datetime.fromisoformat(calculated_at)
+        self.add(
+            sector, effectif, calculated_at,
+            payload["total_co2e"], payload["scope_1"], payload["scope_2"], payload["scope_3"],
+            payload["intensity_per_employee"], payload.get("intensity_per_revenue"),
+            calculation_id=payload.get("calculation_id")
+        )
+
+    def rebuild(self, history: Iterable[Tuple[str, str, Dict]]) -> int:
+        """Recompute every bucket from (sector, effectif, payload) history and swap them in at once
+
+        `history` is consumed after logging of concurrent adds has started, so
+        a lazy iterator over the store misses nothing. Returns the number of
+        calculations in the rebuilt rollups.
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                self._rebuild_log = []
+            try:
+                sectors, effectifs, payloads = [], [], []
+                for sector, effectif, payload in history:
+                    sectors.append(sector)
+                    effectifs.append(effectif)
+                    payloads.append(payload)
+                buckets = self._aggregate(sectors, effectifs, payloads)
+            except BaseException:
+                with self._lock:
+                    self._rebuild_log = None
+                raise
+
+            seen = {payload.get("calculation_id") for payload in payloads}
+            with self._lock:
+                log, self._rebuild_log = self._rebuild_log, None
+                replayed = 0
+                for calculation_id, sector, effectif, calculated_at, values, has_revenue in log:
+                    if calculation_id is not None and calculation_id in seen:
+                        continue
+                    self._apply(buckets, sector, effectif, calculated_at, values, has_revenue)
+                    replayed += 1
+                self._buckets = buckets
+                self._views = {}
+                self._positions = {}
+                self.calculations = len(payloads) + replayed
+                return self.calculations
+
+    def _aggregate(self, sectors: List[str], effectifs: List[str],
+                   payloads: List[Dict]) -> Dict[Tuple[str, str], RollupBucket]:
+        frame = pd.DataFrame(payloads, columns=["calculated_at", *MEASURES])
+        if frame.empty:
+            return {}
+        frame["secteur"] = sectors
+        frame["effectif"] = effectifs
+        frame["calculated_at"] = pd.to_datetime(frame["calculated_at"])
+        frame["mois"] = frame["calculated_at"].dt.strftime("%Y-%m")
+        frame["secteur_mois"] = frame["secteur"] + "|" + frame["mois"]
+        frame["global"] = GLOBAL_KEY
+        revenue = pd.to_numeric(frame["intensity_per_revenue"], errors="coerce")
+        frame["revenue_count"] = np.isfinite(revenue).astype(int)
+        frame["intensity_per_revenue"] = revenue.where(np.isfinite(revenue), 0.0)
+
+        buckets: Dict[Tuple[str, str], RollupBucket] = {}
+        for dimension in DIMENSIONS:
+            # One groupby per dimension instead of one Python update per calculation and bucket
+            grouped = frame.groupby(dimension, sort=False).agg(
+                count=("total_co2e", "size"),
+                revenue_count=("revenue_count", "sum"),
+                last_calculated_at=("calculated_at", "max"),
+                **{measure: (measure, "sum") for measure in MEASURES}
+            )
+            for key, row in zip(grouped.index.tolist(), grouped.itertuples(index=False)):
+                bucket = buckets[(dimension, key)] = RollupBucket()
+                bucket.add(
+                    tuple(float(getattr(row, measure)) for measure in MEASURES),
+                    row.last_calculated_at.to_pydatetime(),
+                    count=int(row.count), revenue_count=int(row.revenue_count)
+                )
+        return buckets
+
+    def view(self, dimension: str) -> List[Dict]:
+        """Every bucket of a dimension, largest emitters first"""
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown rollup dimension: {dimension}")
+        with self._lock:
+            view = self._views.get(dimension)
+            if view is None:
+                view = [
+                    bucket.to_dict(key)
+                    for (bucket_dimension, key), bucket in self._buckets.items()
+                    if bucket_dimension == dimension
+                ]
+                view.sort(key=self._sort_key(dimension))
+                self._views[dimension] = view
+                self._positions[dimension] = {entry["key"]: i for i, entry in enumerate(view)}
+            # Later writes patch the cached list; callers get a snapshot of it
+            return list(view)
+
+    @staticmethod
+    def _sort_key(dimension: str):
+        if dimension in ("mois", "secteur_mois"):
+            return lambda entry: entry["key"]
+        return lambda entry: -entry["total_co2e"]
+
+    def _patch_view(self, dimension: str, key: str):
+        """Replace one bucket's entry in a cached view and move it back into order"""
+        view = self._views[dimension]
+        positions = self._positions[dimension]
+        entry = self._buckets[(dimension, key)].to_dict(key)
+        index = positions.get(key)
+        if index is None:
+            index = len(view)
+            view.append(entry)
+        else:
+            view[index] = entry
+        sort_key = self._sort_key(dimension)
+        rank = sort_key(entry)
+        # One bucket changed, so it only has to travel past the neighbours it overtook
+        while index > 0 and sort_key(view[index - 1]) > rank:
+            view[index] = view[index - 1]
+            positions[view[index]["key"]] = index
+            index -= 1
+        while index < len(view) - 1 and sort_key(view[index + 1]) < rank:
+            view[index] = view[index + 1]
+            positions[view[index]["key"]] = index
+            index += 1
+        view[index] = entry
+        positions[key] = index
+
+    def get(self, dimension: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            bucket = self._buckets.get((dimension, key))
+            return bucket.to_dict(key) if bucket is not None else None
+
+    def overview(self) -> Dict:
+        return {
+            "global": self.get("global", GLOBAL_KEY),
+            "secteurs": self.view("secteur"),
+            "mois": self.view("mois"),
+            "effectifs": self.view("effectif")
+        }
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {dimension: 0 for dimension in DIMENSIONS}
+            for dimension, _ in self._buckets:
+                counts[dimension] += 1
+            return {"calculations": self.calculations, **counts}
+
+    @staticmethod
+    def _apply(buckets: Dict[Tuple[str, str], RollupBucket], sector: str, effectif: str,
+               calculated_at: datetime, values: Tuple[float, ...], has_revenue: bool) -> List[Tuple[str, str]]:
+        touched = bucket_keys(sector, effectif, calculated_at)
+        for bucket_key in touched:
+            bucket = buckets.get(bucket_key)
+            if bucket is None:
+                bucket = buckets[bucket_key] = RollupBucket()
+            bucket.add(values, calculated_at, revenue_count=int(has_revenue))
+        return touched
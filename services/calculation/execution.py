@@ -0,0 +1,122 @@
+"""
+CarbonScore - Calculation execution backend
+Runs CPU-bound calculations off the event loop, with admission control and queue metrics
+"""
+
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class ExecutorSaturated(Exception):
+    """Raised when the calculation queue is full; callers should retry later"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Calculation queue saturated, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+def _warm_worker():
+    """Process pool initializer: load the factor registry before the first task"""
+    from carbon_calculator import get_factor_registry
+    get_factor_registry().current()
+
+def _noop():
+    return None
+
+def _timed_call(fn: Callable, args: Tuple) -> Tuple[float, Any]:
+    # time.monotonic is system-wide, so the start time is comparable across processes
+    started = time.monotonic()
+    return started, fn(*args)
+
+class CalculationExecutor:
+    """Thread or process pool front-end with bounded admission"""
+
+    def __init__(self, backend: str = "thread", workers: Optional[int] = None,
+                 max_pending: Optional[int] = None, retry_after: int = 1, window: int = 1024):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown executor backend: {backend}")
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        self.retry_after = retry_after
+        self._pool: Optional[Executor] = None
+        self._pending = 0
+        self._waits = deque(maxlen=window)
+        self._durations = deque(maxlen=window)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Create the pool and, for processes, warm every worker up front"""
+        if self._pool is not None:
+            return
+        if self.backend == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+            # Workers are spawned on demand; force them all up now so the first requests don't pay
+            for future in [self._pool.submit(_noop) for _ in range(self.workers)]:
+                future.result()
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="calc")
+        logger.info(f"Calculation executor started: {self.backend} x {self.workers} (max pending {self.max_pending})")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in the pool, or raise ExecutorSaturated if the queue is full"""
+        if self._pool is None:
+            self.start()
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorSaturated(self.retry_after)
+
+        self._pending += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            started, result = await loop.run_in_executor(self._pool, _timed_call, fn, args)
+            finished = time.monotonic()
+            self._waits.append(max(0.0, started - submitted))
+            self._durations.append(finished - started)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._pending -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth and wait/run time percentiles over the recent window"""
+        def summary(values) -> Dict[str, float]:
+            if not values:
+                return {"p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+            array = np.fromiter(values, dtype=float) * 1000
+            return {
+                "p50_ms": round(float(np.percentile(array, 50)), 3),
+                "p99_ms": round(float(np.percentile(array, 99)), 3),
+                "max_ms": round(float(array.max()), 3)
+            }
+
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "queue_depth": max(0, self._pending - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_wait": summary(self._waits),
+            "run_time": summary(self._durations)
+        }
@@ -0,0 +1,348 @@
+"""
+CarbonScore - Compiled ADEME factor snapshot
+Binary columnar snapshot of the Base Carbone for the calculation API.
+
+The layout follows calc-service's snapshot, but the two modules evolve
+separately (calc-service also stores release columns), so this one has its
+own magic and file suffix. Each reader rejects the other's files by name
+instead of misreading them.
+
+Layout (little endian):
+    8 bytes   magic b"CBCSNAP1"
+    4 bytes   header length
+    N bytes   JSON header, padded to a 64-byte boundary
+    ...       column arrays and the interned string table, each 64-byte aligned
+
+Numeric columns are stored as raw arrays, text columns as int32 ids into a
+single interned string table (uint64 offsets + one UTF-8 blob), and
+``ademe_order`` holds the row permutation sorted by ``ademe_id`` for
+binary-search lookups. The file is meant to be memory-mapped read-only so
+every worker on a host shares the same physical pages.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"CBCSNAP1"
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_SUFFIX = ".calc.fsnap"
+# Written by calc-service (app/services/factor_snapshot.py), not readable here
+CALC_SERVICE_SNAPSHOT_MAGIC = b"CBFSNAP1"
+ALIGNMENT = 64
+
+ADEME_CSV_SEPARATOR = ";"
+
+NUMERIC_COLUMNS = {
+    "value": "<f8",
+    "co2_fossil": "<f8",
+    "ch4_fossil": "<f8",
+    "ch4_biogenic": "<f8",
+    "n2o": "<f8",
+    "co2_biogenic": "<f8",
+    "uncertainty": "<f8",
+    "scope": "<i1",
+}
+TEXT_COLUMNS = ["ademe_id", "nom", "category", "unit", "tags", "comment"]
+
+SCOPE1_TERMS = ["combustible", "gaz", "fioul", "essence", "diesel"]
+SCOPE2_TERMS = ["électricité", "electricite", "réseau", "chauffage urbain"]
+
+
+def default_snapshot_path(csv_path: Union[str, Path]) -> Path:
+    """Snapshot location used when none is configured: next to the CSV"""
+    csv_path = Path(csv_path)
+    return csv_path.with_suffix(SNAPSHOT_SUFFIX)
+
+
+def _coerce_float(column: pd.Series) -> pd.Series:
+    # Decimal commas, blanks and junk become 0, like calc-service ADEMELoader._safe_float
+    return pd.to_numeric(
+        column.astype(str).str.strip().str.replace(",", ".", regex=False),
+        errors="coerce"
+    ).fillna(0.0)
+
+
+def normalize_ademe_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Turn raw Base Carbone rows into valid emission factor columns"""
+    def raw(name: str) -> pd.Series:
+        return df[name] if name in df.columns else pd.Series("", index=df.index)
+
+    mask = (raw("Type Ligne") == "Elément") & (raw("Statut de l'élément") == "Valide générique")
+    df = df[mask]
+
+    category = raw("Code de la catégorie")[mask]
+    category = category.where(category.notna(), "").astype(str).str.strip()
+    value = _coerce_float(raw("Total poste non décomposé")[mask])
+
+    keep = (value > 0) & (category != "")
+    df = df[keep]
+    category = category[keep]
+    category_lower = category.str.lower()
+
+    scope = np.where(
+        category_lower.str.contains("|".join(SCOPE1_TERMS), regex=True), 1,
+        np.where(category_lower.str.contains("|".join(SCOPE2_TERMS), regex=True), 2, 3)
+    )
+
+    def text(name: str) -> pd.Series:
+        return df[name].astype(str) if name in df.columns else pd.Series("", index=df.index)
+
+    def number(name: str) -> pd.Series:
+        return _coerce_float(df[name]) if name in df.columns else pd.Series(0.0, index=df.index)
+
+    return pd.DataFrame({
+        "ademe_id": text("Identifiant de l'élément"),
+        "nom": text("Nom base français"),
+        "category": category,
+        "unit": text("Unité français"),
+        "value": value[keep],
+        "co2_fossil": number("CO2f"),
+        "ch4_fossil": number("CH4f"),
+        "ch4_biogenic": number("CH4b"),
+        "n2o": number("N2O"),
+        "co2_biogenic": number("CO2b"),
+        "scope": scope.astype(np.int8),
+        "uncertainty": number("Incertitude"),
+        "tags": text("Tags français"),
+        "comment": text("Commentaire français"),
+    }).reset_index(drop=True)
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_snapshot(factors: pd.DataFrame, output_path: Union[str, Path], metadata: Dict) -> Path:
+    """Serialize normalized factor columns to the snapshot format"""
+    output_path = Path(output_path)
+    n = len(factors)
+
+    # Intern every text value of every column into one table
+    stacked = pd.concat([factors[c].astype(str) for c in TEXT_COLUMNS], ignore_index=True)
+    codes, uniques = pd.factorize(stacked, sort=False)
+    codes = codes.astype(np.int32).reshape(len(TEXT_COLUMNS), n)
+    encoded = [s.encode("utf-8") for s in uniques]
+    string_offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(b) for b in encoded], out=string_offsets[1:])
+    string_blob = b"".join(encoded)
+
+    ademe_order = np.argsort(factors["ademe_id"].astype(str).to_numpy(), kind="stable").astype("<i4")
+
+    arrays = {}
+    for name, dtype in NUMERIC_COLUMNS.items():
+        arrays[name] = np.ascontiguousarray(factors[name].to_numpy(), dtype=dtype)
+    for i, name in enumerate(TEXT_COLUMNS):
+        arrays[f"{name}_id"] = np.ascontiguousarray(codes[i], dtype="<i4")
+    arrays["ademe_order"] = ademe_order
+    arrays["string_offsets"] = string_offsets
+
+    # Lay out sections after a header sized generously up front
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {"dtype": array.dtype.str, "offset": offset, "length": int(array.size)}
+        offset += array.nbytes
+    offset = _align(offset)
+    layout["string_data"] = {"dtype": "|u1", "offset": offset, "length": len(string_blob)}
+
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "rows": n,
+        "strings": len(encoded),
+        "sections": layout,
+        "created_at": datetime.now().isoformat(),
+        **metadata,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(len(SNAPSHOT_MAGIC) + 4 + len(header_bytes) + 256)
+
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<I", data_start - len(SNAPSHOT_MAGIC) - 4))
+        f.write(header_bytes.ljust(data_start - len(SNAPSHOT_MAGIC) - 4, b" "))
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.seek(data_start + layout["string_data"]["offset"])
+        f.write(string_blob)
+    # Readers keep mapping the old inode until they reopen
+    tmp_path.replace(output_path)
+    return output_path
+
+
+def compile_snapshot(csv_path: Union[str, Path], output_path: Optional[Union[str, Path]] = None,
+                     version: str = "v17", sep: str = ADEME_CSV_SEPARATOR) -> Path:
+    """Compile the Base Carbone CSV into a memory-mappable snapshot"""
+    csv_path = Path(csv_path)
+    output_path = Path(output_path) if output_path else default_snapshot_path(csv_path)
+
+    df = pd.read_csv(csv_path, encoding="utf-8", sep=sep, dtype=str, keep_default_na=True)
+    factors = normalize_ademe_frame(df)
+
+    stat = csv_path.stat()
+    sha256 = _file_sha256(csv_path)
+    write_snapshot(factors, output_path, {
+        "version": version,
+        "factor_set": f"{version}-{sha256[:12]}",
+        "source_path": str(csv_path),
+        "source_sha256": sha256,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+    })
+    logger.info(f"Compiled ADEME snapshot: {len(factors)} factors -> {output_path}")
+    return output_path
+
+
+class FactorSnapshot:
+    """Read-only view over a snapshot held in a memory map or any buffer"""
+
+    def __init__(self, buffer, owner=None):
+        self._buffer = memoryview(buffer)
+        self._owner = owner
+        magic = bytes(self._buffer[:len(SNAPSHOT_MAGIC)])
+        if magic == CALC_SERVICE_SNAPSHOT_MAGIC:
+            raise ValueError("calc-service factor snapshot, compile one with this service's factor_snapshot.py")
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Invalid factor snapshot")
+
+        header_len = struct.unpack_from("<I", self._buffer, len(SNAPSHOT_MAGIC))[0]
+        header_start = len(SNAPSHOT_MAGIC) + 4
+        self.header = json.loads(bytes(self._buffer[header_start:header_start + header_len]))
+        if self.header["format"] != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {self.header['format']}")
+
+        data_start = header_start + header_len
+        self._sections = {}
+        for name, section in self.header["sections"].items():
+            array = np.frombuffer(
+                self._buffer, dtype=np.dtype(section["dtype"]),
+                count=section["length"], offset=data_start + section["offset"]
+            )
+            array.flags.writeable = False
+            self._sections[name] = array
+        self._string_cache: Dict[int, str] = {}
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> "FactorSnapshot":
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, owner=mapped)
+
+    @property
+    def factor_set(self) -> str:
+        return self.header.get("factor_set", self.header.get("version", ""))
+
+    def __len__(self) -> int:
+        return self.header["rows"]
+
+    def column(self, name: str) -> np.ndarray:
+        return self._sections[name]
+
+    def text_ids(self, name: str) -> np.ndarray:
+        return self._sections[f"{name}_id"]
+
+    def string(self, string_id: int) -> str:
+        cached = self._string_cache.get(string_id)
+        if cached is None:
+            offsets = self._sections["string_offsets"]
+            start = int(offsets[string_id])
+            end = int(offsets[string_id + 1])
+            data = self._sections["string_data"]
+            cached = bytes(data[start:end]).decode("utf-8")
+            self._string_cache[string_id] = cached
+        return cached
+
+    def text(self, name: str, row: int) -> str:
+        return self.string(int(self.text_ids(name)[row]))
+
+    def row_for(self, ademe_id: str) -> Optional[int]:
+        order = self._sections["ademe_order"]
+        ids = self.text_ids("ademe_id")
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(int(ids[order[mid]])) < ademe_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and self.string(int(ids[order[lo]])) == ademe_id:
+            return int(order[lo])
+        return None
+
+    def row(self, index: int) -> Dict:
+        record = {name: self.text(name, index) for name in TEXT_COLUMNS}
+        for name in NUMERIC_COLUMNS:
+            record[name] = self._sections[name][index].item()
+        return record
+
+    def is_fresh_for(self, csv_path: Union[str, Path]) -> bool:
+        try:
+            stat = Path(csv_path).stat()
+        except OSError:
+            # No source to compare against: the snapshot is the only copy
+            return True
+        return (stat.st_size == self.header.get("source_size")
+                and stat.st_mtime_ns == self.header.get("source_mtime_ns"))
+
+    def close(self):
+        self._sections = {}
+        try:
+            self._buffer.release()
+            if self._owner is not None and hasattr(self._owner, "close"):
+                self._owner.close()
+        except BufferError:
+            # Arrays handed out still reference the mapping; it is unmapped once they are freed
+            pass
+
+
+def open_fresh_snapshot(csv_path: Union[str, Path],
+                        snapshot_path: Optional[Union[str, Path]] = None) -> Optional[FactorSnapshot]:
+    """Map the snapshot for a CSV if it exists and was compiled from the current file"""
+    snapshot_path = Path(snapshot_path) if snapshot_path else default_snapshot_path(csv_path)
+    if not snapshot_path.exists():
+        return None
+    try:
+        snapshot = FactorSnapshot.open(snapshot_path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable ADEME snapshot {snapshot_path}: {e}")
+        return None
+    if not snapshot.is_fresh_for(csv_path):
+        logger.warning(f"Stale ADEME snapshot, rebuild it: {snapshot_path}")
+        snapshot.close()
+        return None
+    return snapshot
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Compile the Base Carbone CSV into a binary snapshot")
+    parser.add_argument("csv_path")
+    parser.add_argument("-o", "--output", default=None)
+    parser.add_argument("--version", default="v17")
+    parser.add_argument("--sep", default=ADEME_CSV_SEPARATOR)
+    args = parser.parse_args()
+
+    compile_snapshot(args.csv_path, args.output, version=args.version, sep=args.sep)
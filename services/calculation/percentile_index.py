@@ -0,0 +1,153 @@
+"""
+CarbonScore - Peer percentile index
+Empirical per-sector, per-size-band distributions of emission intensity
+"""
+
+from bisect import bisect_right, insort
+from typing import Dict, Iterable, Optional, Tuple
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Pseudo size band holding every company of a sector
+ALL_BANDS = "*"
+
+def benchmark_label(percentile: float) -> str:
+    """Benchmark position for a peer percentile (share of peers at or below the company)"""
+    if percentile <= 25:
+        return "Excellent - Top 25% de votre secteur"
+    elif percentile <= 50:
+        return "Bon - Proche de la moyenne sectorielle"
+    elif percentile <= 75:
+        return "Moyen - Amélioration possible"
+    else:
+        return "À améliorer - Émissions élevées pour votre secteur"
+
+class PeerDistribution:
+    """Sorted sample of intensities with O(log n) ranks and cheap inserts.
+
+    New values go to a small sorted buffer that is merged into the main
+    array once it grows past `merge_threshold`, so inserts stay cheap
+    without giving up binary search on lookups.
+    """
+
+    def __init__(self, merge_threshold: int = 1024):
+        self.merge_threshold = merge_threshold
+        self._sorted = np.empty(0, dtype=float)
+        self._pending = []
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._pending)
+
+    def add(self, value: float):
+        insort(self._pending, value)
+        if len(self._pending) >= self.merge_threshold:
+            self._merge()
+
+    def extend(self, values: np.ndarray):
+        self._merge(np.asarray(values, dtype=float))
+
+    def rank(self, value: float) -> int:
+        """Number of samples at or below value"""
+        return int(np.searchsorted(self._sorted, value, side="right")) + bisect_right(self._pending, value)
+
+    def ranks(self, values: np.ndarray) -> np.ndarray:
+        self._merge()
+        return np.searchsorted(self._sorted, values, side="right")
+
+    def _merge(self, extra: Optional[np.ndarray] = None):
+        parts = [self._sorted]
+        if self._pending:
+            parts.append(np.asarray(self._pending, dtype=float))
+            self._pending = []
+        if extra is not None and len(extra):
+            parts.append(extra)
+        if len(parts) > 1:
+            self._sorted = np.sort(np.concatenate(parts), kind="mergesort")
+
+class PercentileIndex:
+    """Peer distributions keyed by (sector, size band), plus one per whole sector"""
+
+    def __init__(self, min_samples: int = 20, merge_threshold: int = 1024):
+        self.min_samples = min_samples
+        self.merge_threshold = merge_threshold
+        self._distributions: Dict[Tuple[str, str], PeerDistribution] = {}
+        self._lock = threading.Lock()
+
+    def add(self, sector: str, effectif: str, intensity: float):
+        """Record one calculation"""
+        if not np.isfinite(intensity):
+            return
+        with self._lock:
+            for key in ((sector, effectif), (sector, ALL_BANDS)):
+                self._distribution(key).add(float(intensity))
+
+    def extend(self, sectors: Iterable[str], effectifs: Iterable[str], intensities: Iterable[float]):
+        """Record many calculations at once, e.g. when rebuilding from the store"""
+        intensities = np.asarray(list(intensities), dtype=float)
+        keep = np.isfinite(intensities)
+        sector_codes, sector_names = pd.factorize(np.asarray(list(sectors), dtype=object)[keep])
+        band_codes, band_names = pd.factorize(np.asarray(list(effectifs), dtype=object)[keep])
+        intensities = intensities[keep]
+
+        def groups(codes: np.ndarray):
+            # One stable sort instead of a boolean mask per group
+            order = np.argsort(codes, kind="stable")
+            present, starts = np.unique(codes[order], return_index=True)
+            return zip(present.tolist(), np.split(intensities[order], starts[1:]))
+
+        with self._lock:
+            for code, values in groups(sector_codes):
+                self._distribution((sector_names[code], ALL_BANDS)).extend(values)
+            for code, values in groups(sector_codes * len(band_names) + band_codes):
+                sector, band = divmod(code, len(band_names))
+                self._distribution((sector_names[sector], band_names[band])).extend(values)
+
+    def percentile(self, sector: str, effectif: str, intensity: float) -> Optional[float]:
+        """Share of peers (in %) at or below intensity, None without enough peers"""
+        with self._lock:
+            distribution = self._peers(sector, effectif)
+            if distribution is None:
+                return None
+            return round(100.0 * distribution.rank(intensity) / len(distribution), 2)
+
+    def percentiles(self, sectors, effectifs, intensities) -> np.ndarray:
+        """Vectorized percentile, NaN where a company has too few peers"""
+        sectors = np.asarray(sectors, dtype=object)
+        effectifs = np.asarray(effectifs, dtype=object)
+        intensities = np.asarray(intensities, dtype=float)
+        result = np.full(len(intensities), np.nan)
+
+        with self._lock:
+            groups = {}
+            for i, key in enumerate(zip(sectors.tolist(), effectifs.tolist())):
+                groups.setdefault(key, []).append(i)
+            for (sector, effectif), rows in groups.items():
+                distribution = self._peers(sector, effectif)
+                if distribution is None:
+                    continue
+                rows = np.asarray(rows)
+                result[rows] = 100.0 * distribution.ranks(intensities[rows]) / len(distribution)
+        return np.round(result, 2)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                f"{sector}/{band}": len(distribution)
+                for (sector, band), distribution in sorted(self._distributions.items())
+            }
+
+    def _distribution(self, key: Tuple[str, str]) -> PeerDistribution:
+        distribution = self._distributions.get(key)
+        if distribution is None:
+            distribution = self._distributions[key] = PeerDistribution(self.merge_threshold)
+        return distribution
+
+    def _peers(self, sector: str, effectif: str) -> Optional[PeerDistribution]:
+        # Prefer same size band, widen to the whole sector before giving up
+        for key in ((sector, effectif), (sector, ALL_BANDS)):
+            distribution = self._distributions.get(key)
+            if distribution is not None and len(distribution) >= self.min_samples:
+                return distribution
+        return None
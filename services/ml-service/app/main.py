@@ -4,14 +4,17 @@ Advanced ML pipeline for anomaly detection, imputation, benchmarking, and action
 """
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Literal, Tuple
+import asyncio
+import os
+import sys
+import threading
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
-import lightgbm as lgb
 import joblib
 import json
 import logging
@@ -20,6 +23,10 @@ from pathlib import Path
 import mlflow
 import mlflow.sklearn
 
+from micro_batching import MicroBatcher
+from training.synthetic import ANOMALY_FEATURES
+from training.train_all import dump_atomic, fit_anomaly_detector, fit_benchmark_model, fit_imputation_model
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -42,7 +49,8 @@ app.add_middleware(
 # Pydantic models
 class CompanyData(BaseModel):
     sector: str
-    employees: str
+    # Size bands the benchmark features are defined for; others are rejected with a 422
+    employees: Literal['1-9', '10-49', '50-249', '250+']
     revenue: Optional[float] = None
     location: str
     electricite_kwh: float
@@ -81,7 +89,7 @@ class ActionRecommendation(BaseModel):
     roi_score: float
     priority_rank: int
 
-# Global model storage
+# Global model storage, filled lazily by MLService
 models = {
     'anomaly_detector': None,
     'scaler': None,
@@ -90,266 +98,424 @@ models = {
     'action_ranker': None
 }
 
+IMPUTATION_FIELDS = ['electricite_kwh', 'gaz_kwh', 'carburants_litres', 'vehicules_km_annuel', 'montant_achats_annuel']
+BENCHMARK_SECTORS = ['industrie', 'services', 'commerce', 'construction', 'transport']
+MODEL_GROUPS = ('anomaly', 'imputation', 'benchmark')
+
 class MLService:
-    """Main ML service class"""
+    """Main ML service class
+    
+    Nothing is loaded at import time. Each model is read from disk on first
+    use; a model whose artifact is missing is trained once, under its group's
+    lock, by whichever caller needs it first. `warm_up` runs the same path for every
+    model in the background at startup and drives the readiness probe.
+    """
     
-    def __init__(self):
-        self.models_dir = Path("/data/artifacts/models")
+    def __init__(self, models_dir: Optional[str] = None):
+        self.models_dir = Path(models_dir or os.getenv("MODEL_STORAGE_PATH", "/data/artifacts/models"))
         self.models_dir.mkdir(parents=True, exist_ok=True)
-        self.load_models()
-        
-    def load_models(self):
-        """Load pre-trained models or initialize new ones"""
-        try:
-            # Load anomaly detection model
-            anomaly_path = self.models_dir / "anomaly_detector.joblib"
-            if anomaly_path.exists():
-                models['anomaly_detector'] = joblib.load(anomaly_path)
-                models['scaler'] = joblib.load(self.models_dir / "scaler.joblib")
+        self._locks = {group: threading.Lock() for group in MODEL_GROUPS}
+        self.status = {group: "pending" for group in MODEL_GROUPS}
+        self.errors: Dict[str, str] = {}
+        self.warmed_up_at: Optional[str] = None
+        self.training: Dict[str, Any] = {"status": "idle"}
+        self._anomaly = None
+    
+    def is_ready(self) -> bool:
+        return all(state == "loaded" for state in self.status.values())
+    
+    def anomaly_model(self, load: bool = True):
+        """(IsolationForest, StandardScaler), loaded or trained on first use"""
+        if self._anomaly is None and load:
+            with self._locks['anomaly']:
+                if self._anomaly is None:
+                    self._load_anomaly_detector()
+                    self._mark_loaded_if_complete('anomaly')
+        return self._anomaly
+    
+    def imputation_model(self, field: str, load: bool = True):
+        """LightGBM imputation model for a field, None for a field without one"""
+        if field not in IMPUTATION_FIELDS:
+            return None
+        return self._lazy_model('imputation', 'imputation_models', field, load, self._train_imputation_model)
+    
+    def benchmark_model(self, sector: str, load: bool = True):
+        """LightGBM benchmark model for a sector, None for a sector without one"""
+        if sector not in BENCHMARK_SECTORS:
+            return None
+        return self._lazy_model('benchmark', 'benchmark_models', sector, load, self._train_benchmark_model)
+    
+    def _lazy_model(self, group: str, registry: str, name: str, load: bool, train):
+        model = models[registry].get(name)
+        if model is not None or not load:
+            return model
+        with self._locks[group]:
+            model = models[registry].get(name)
+            if model is None:
+                model_path = self.models_dir / group / f"{name}.joblib"
+                if model_path.exists():
+                    model = models[registry][name] = joblib.load(model_path)
+                    logger.info(f"Loaded {group} model {name}")
+                else:
+                    # First start, partial training run or deleted file: train just this model
+                    self._guarded(group, lambda: train(name))
+                    model = models[registry][name]
+                self._mark_loaded_if_complete(group)
+        return model
+    
+    def _load_anomaly_detector(self):
+        anomaly_path = self.models_dir / "anomaly_detector.joblib"
+        scaler_path = self.models_dir / "scaler.joblib"
+        if anomaly_path.exists() and scaler_path.exists():
+            try:
+                self._set_anomaly(joblib.load(anomaly_path), joblib.load(scaler_path))
                 logger.info("Loaded anomaly detection model")
-            else:
-                self._train_anomaly_detector()
-                
-            # Load imputation models
-            imputation_dir = self.models_dir / "imputation"
-            if imputation_dir.exists():
-                for model_file in imputation_dir.glob("*.joblib"):
-                    field_name = model_file.stem
-                    models['imputation_models'][field_name] = joblib.load(model_file)
-                logger.info(f"Loaded {len(models['imputation_models'])} imputation models")
-            else:
-                self._train_imputation_models()
-                
-            # Load benchmark models
-            benchmark_dir = self.models_dir / "benchmark"
-            if benchmark_dir.exists():
-                for model_file in benchmark_dir.glob("*.joblib"):
-                    sector = model_file.stem
-                    models['benchmark_models'][sector] = joblib.load(model_file)
-                logger.info(f"Loaded {len(models['benchmark_models'])} benchmark models")
-            else:
-                self._train_benchmark_models()
-                
+                return
+            except Exception as e:
+                logger.error(f"Error loading anomaly detection model, retraining: {e}")
+        self._guarded('anomaly', self._train_anomaly_detector)
+    
+    def _guarded(self, group: str, train):
+        previous = self.status[group]
+        self.status[group] = "training"
+        try:
+            train()
         except Exception as e:
-            logger.error(f"Error loading models: {e}")
-            self._initialize_default_models()
+            self.status[group] = "failed"
+            self.errors[group] = str(e)
+            raise
+        # Other models of the group may still be missing; _mark_loaded_if_complete settles it
+        self.status[group] = previous
     
-    def _initialize_default_models(self):
-        """Initialize default models if loading fails"""
-        logger.info("Initializing default models...")
-        
-        # Default anomaly detector
-        models['anomaly_detector'] = IsolationForest(
-            contamination=0.1,
-            random_state=42,
-            n_estimators=100
-        )
-        models['scaler'] = StandardScaler()
-        
-        # Train on synthetic data
-        self._train_anomaly_detector()
-        self._train_imputation_models()
-        self._train_benchmark_models()
+    def _missing_models(self, group: str) -> List[str]:
+        if group == 'anomaly':
+            return [] if self._anomaly is not None else ['anomaly_detector']
+        if group == 'imputation':
+            return [field for field in IMPUTATION_FIELDS if models['imputation_models'].get(field) is None]
+        return [sector for sector in BENCHMARK_SECTORS if models['benchmark_models'].get(sector) is None]
+    
+    def _mark_loaded_if_complete(self, group: str):
+        """A group that failed or was trained on demand is ready once none of its models is missing"""
+        if not self._missing_models(group):
+            self.status[group] = "loaded"
+            self.errors.pop(group, None)
+    
+    def warm_up(self):
+        """Load (or train) every model; meant to run off the event loop at startup"""
+        loaders = {
+            'anomaly': {'anomaly_detector': self.anomaly_model},
+            'imputation': {field: lambda field=field: self.imputation_model(field) for field in IMPUTATION_FIELDS},
+            'benchmark': {sector: lambda sector=sector: self.benchmark_model(sector) for sector in BENCHMARK_SECTORS}
+        }
+        for group, group_loaders in loaders.items():
+            if self.status[group] == "loaded":
+                continue
+            if self.status[group] != "training":
+                self.status[group] = "loading"
+            # Every model is tried, so one failure leaves only that model to load on demand
+            failures = {}
+            for name, load in group_loaders.items():
+                try:
+                    if load() is None:
+                        failures[name] = "not available"
+                except Exception as e:
+                    failures[name] = str(e)
+            if failures:
+                self.status[group] = "failed"
+                self.errors[group] = "; ".join(f"{name}: {error}" for name, error in failures.items())
+                logger.error(f"Warm-up of {group} models failed: {self.errors[group]}")
+            else:
+                self.status[group] = "loaded"
+                self.errors.pop(group, None)
+        self.warmed_up_at = datetime.now().isoformat()
+        logger.info(f"Model warm-up finished: {self.status}")
+    
+    def reload(self):
+        """Swap in the artifacts on disk, e.g. after the training pipeline wrote new ones"""
+        with self._locks['anomaly']:
+            anomaly_path = self.models_dir / "anomaly_detector.joblib"
+            scaler_path = self.models_dir / "scaler.joblib"
+            if anomaly_path.exists() and scaler_path.exists():
+                self._set_anomaly(joblib.load(anomaly_path), joblib.load(scaler_path))
+        for group, registry in (('imputation', 'imputation_models'), ('benchmark', 'benchmark_models')):
+            with self._locks[group]:
+                loaded = {
+                    model_file.stem: joblib.load(model_file)
+                    for model_file in (self.models_dir / group).glob("*.joblib")
+                }
+                # New dict, one assignment: readers see either the old or the new set
+                models[registry] = {**models[registry], **loaded}
+        logger.info("Reloaded models from disk")
+    
+    def _set_anomaly(self, anomaly_detector, scaler):
+        models['scaler'] = scaler
+        models['anomaly_detector'] = anomaly_detector
+        # Published as one pair so a reload never mixes a new scaler with an old detector
+        self._anomaly = (anomaly_detector, scaler)
     
     def _train_anomaly_detector(self):
         """Train anomaly detection model"""
         logger.info("Training anomaly detection model...")
-        
-        # Generate synthetic training data
-        np.random.seed(42)
-        n_samples = 1000
-        
-        # Normal company profiles
-        normal_data = []
-        sectors = ['industrie', 'services', 'commerce', 'construction', 'transport']
-        
-        for _ in range(n_samples):
-            sector = np.random.choice(sectors)
-            employees = np.random.choice(['1-9', '10-49', '50-249', '250+'])
-            
-            # Sector-specific base values with realistic variations
-            base_values = {
-                'industrie': {'elec': 80000, 'gaz': 120000, 'carb': 8000, 'veh': 40000, 'achats': 800000},
-                'services': {'elec': 25000, 'gaz': 15000, 'carb': 2000, 'veh': 15000, 'achats': 300000},
-                'commerce': {'elec': 45000, 'gaz': 25000, 'carb': 5000, 'veh': 30000, 'achats': 1200000},
-                'construction': {'elec': 35000, 'gaz': 40000, 'carb': 15000, 'veh': 60000, 'achats': 900000},
-                'transport': {'elec': 20000, 'gaz': 10000, 'carb': 25000, 'veh': 100000, 'achats': 400000}
-            }
-            
-            base = base_values[sector]
-            size_multiplier = {'1-9': 0.3, '10-49': 1.0, '50-249': 3.0, '250+': 10.0}[employees]
-            
-            # Add realistic noise
-            noise = np.random.normal(1.0, 0.2)
-            
-            sample = [
-                base['elec'] * size_multiplier * noise,
-                base['gaz'] * size_multiplier * noise,
-                base['carb'] * size_multiplier * noise,
-                base['veh'] * size_multiplier * noise,
-                np.random.uniform(1000, 10000),  # domestic flights
-                np.random.uniform(2000, 15000),  # international flights
-                base['achats'] * size_multiplier * noise,
-                np.random.uniform(20, 80)  # local percentage
-            ]
-            normal_data.append(sample)
-        
-        # Convert to DataFrame and train
-        feature_names = [
-            'electricite_kwh', 'gaz_kwh', 'carburants_litres', 'vehicules_km_annuel',
-            'vols_domestiques_km', 'vols_internationaux_km', 'montant_achats_annuel', 'pourcentage_local'
-        ]
-        
-        df = pd.DataFrame(normal_data, columns=feature_names)
-        
-        # Scale features
-        scaled_data = models['scaler'].fit_transform(df)
-        
-        # Train anomaly detector
-        models['anomaly_detector'].fit(scaled_data)
+        anomaly_detector, scaler = fit_anomaly_detector()
         
         # Save models
-        joblib.dump(models['anomaly_detector'], self.models_dir / "anomaly_detector.joblib")
-        joblib.dump(models['scaler'], self.models_dir / "scaler.joblib")
+        dump_atomic(scaler, self.models_dir / "scaler.joblib")
+        dump_atomic(anomaly_detector, self.models_dir / "anomaly_detector.joblib")
+        self._set_anomaly(anomaly_detector, scaler)
         
         logger.info("Anomaly detection model trained and saved")
     
-    def _train_imputation_models(self):
-        """Train imputation models for missing values"""
-        logger.info("Training imputation models...")
-        
-        # Generate synthetic data for imputation training
-        np.random.seed(42)
-        n_samples = 2000
-        
-        # Create complete dataset
-        data = []
-        for _ in range(n_samples):
-            sector_idx = np.random.randint(0, 5)
-            size_idx = np.random.randint(0, 4)
-            
-            # Correlated features based on sector and size
-            base_elec = [20000, 25000, 45000, 35000, 20000][sector_idx] * [0.3, 1.0, 3.0, 10.0][size_idx]
-            base_gaz = base_elec * np.random.uniform(0.3, 0.8)
-            base_carb = base_elec * np.random.uniform(0.05, 0.15)
-            base_veh = base_elec * np.random.uniform(0.3, 2.0)
-            base_achats = base_elec * np.random.uniform(8, 15)
-            
-            sample = {
-                'sector_idx': sector_idx,
-                'size_idx': size_idx,
-                'electricite_kwh': base_elec * np.random.normal(1.0, 0.2),
-                'gaz_kwh': base_gaz * np.random.normal(1.0, 0.3),
-                'carburants_litres': base_carb * np.random.normal(1.0, 0.4),
-                'vehicules_km_annuel': base_veh * np.random.normal(1.0, 0.3),
-                'montant_achats_annuel': base_achats * np.random.normal(1.0, 0.25)
-            }
-            data.append(sample)
-        
-        df = pd.DataFrame(data)
-        
-        # Train separate models for each field
-        target_fields = ['electricite_kwh', 'gaz_kwh', 'carburants_litres', 'vehicules_km_annuel', 'montant_achats_annuel']
-        feature_fields = ['sector_idx', 'size_idx']
-        
-        imputation_dir = self.models_dir / "imputation"
-        imputation_dir.mkdir(exist_ok=True)
-        
-        for target in target_fields:
-            # Use other fields as features
-            features = feature_fields + [f for f in target_fields if f != target]
-            
-            # Create training data (simulate missing values)
-            train_mask = np.random.random(len(df)) > 0.2  # 20% missing
-            X_train = df.loc[train_mask, features]
-            y_train = df.loc[train_mask, target]
-            
-            # Train LightGBM model
-            model = lgb.LGBMRegressor(
-                n_estimators=100,
-                learning_rate=0.1,
-                random_state=42,
-                verbose=-1
-            )
-            model.fit(X_train, y_train)
-            
-            models['imputation_models'][target] = model
-            joblib.dump(model, imputation_dir / f"{target}.joblib")
-        
-        logger.info(f"Trained and saved {len(target_fields)} imputation models")
+    def _train_imputation_model(self, target: str):
+        """Train one imputation model"""
+        model = fit_imputation_model(target)
+        dump_atomic(model, self.models_dir / "imputation" / f"{target}.joblib")
+        models['imputation_models'][target] = model
+        logger.info(f"Trained and saved imputation model {target}")
     
-    def _train_benchmark_models(self):
-        """Train sector-specific benchmark models"""
-        logger.info("Training benchmark models...")
-        
-        # Generate synthetic benchmark data
-        np.random.seed(42)
-        sectors = ['industrie', 'services', 'commerce', 'construction', 'transport']
-        
-        benchmark_dir = self.models_dir / "benchmark"
-        benchmark_dir.mkdir(exist_ok=True)
-        
-        for sector in sectors:
-            # Generate sector-specific data
-            n_samples = 500
-            data = []
-            
-            for _ in range(n_samples):
-                size_multiplier = np.random.choice([0.3, 1.0, 3.0, 10.0])
-                
-                # Sector base emissions (tCO2e)
-                base_emissions = {
-                    'industrie': 50, 'services': 15, 'commerce': 25,
-                    'construction': 40, 'transport': 60
-                }[sector]
-                
-                # Features: company characteristics
-                features = {
-                    'employees_numeric': size_multiplier * 25,
-                    'revenue_millions': size_multiplier * 2.5,
-                    'energy_intensity': np.random.uniform(0.5, 2.0),
-                    'transport_intensity': np.random.uniform(0.3, 1.5)
-                }
-                
-                # Target: total emissions with realistic variation
-                total_emissions = base_emissions * size_multiplier * np.random.normal(1.0, 0.3)
-                
-                data.append({**features, 'total_emissions': total_emissions})
-            
-            df = pd.DataFrame(data)
-            
-            # Train model
-            feature_cols = ['employees_numeric', 'revenue_millions', 'energy_intensity', 'transport_intensity']
-            X = df[feature_cols]
-            y = df['total_emissions']
-            
-            model = lgb.LGBMRegressor(
-                n_estimators=100,
-                learning_rate=0.1,
-                random_state=42,
-                verbose=-1
-            )
-            model.fit(X, y)
-            
-            models['benchmark_models'][sector] = model
-            joblib.dump(model, benchmark_dir / f"{sector}.joblib")
-        
-        logger.info(f"Trained and saved {len(sectors)} benchmark models")
+    def _train_benchmark_model(self, sector: str):
+        """Train one sector benchmark model"""
+        model = fit_benchmark_model(sector)
+        dump_atomic(model, self.models_dir / "benchmark" / f"{sector}.joblib")
+        models['benchmark_models'][sector] = model
+        logger.info(f"Trained and saved benchmark model {sector}")
 
-# Initialize ML service
+# Models load lazily; construction only resolves the artifacts directory
 ml_service = MLService()
 
+async def get_model(getter, *args):
+    """Model from memory, or loaded (possibly trained) off the event loop"""
+    model = getter(*args, load=False)
+    if model is None:
+        model = await run_in_threadpool(getter, *args)
+    return model
+
+@app.on_event("startup")
+async def start_model_warm_up():
+    """Accept traffic right away; models warm up in a worker thread"""
+    app.state.warm_up = asyncio.get_running_loop().run_in_executor(None, ml_service.warm_up)
+
+def models_loaded() -> Dict[str, Any]:
+    return {
+        "anomaly_detector": models['anomaly_detector'] is not None,
+        "imputation_models": len(models['imputation_models']),
+        "benchmark_models": len(models['benchmark_models'])
+    }
+
 @app.get("/")
 async def root():
-    """Health check endpoint"""
+    """Service information"""
     return {
         "service": "CarbonScore ML Service",
         "status": "healthy",
-        "models_loaded": {
-            "anomaly_detector": models['anomaly_detector'] is not None,
-            "imputation_models": len(models['imputation_models']),
-            "benchmark_models": len(models['benchmark_models'])
-        },
+        "models_loaded": models_loaded(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/health")
+async def health_check():
+    """Liveness: the process serves requests, whether or not models are warm"""
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 200 once every model is in memory, 503 while warming up"""
+    ready = ml_service.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "warming_up",
+            "models": ml_service.status,
+            "errors": ml_service.errors,
+            "models_loaded": models_loaded(),
+            "warmed_up_at": ml_service.warmed_up_at,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
+SECTOR_CODES = {'industrie': 0, 'services': 1, 'commerce': 2, 'construction': 3, 'transport': 4}
+SIZE_CODES = {'1-9': 0, '10-49': 1, '50-249': 2, '250+': 3}
+EMPLOYEES_NUMERIC = {'1-9': 5, '10-49': 25, '50-249': 125, '250+': 500}
+SECTOR_AVERAGES = {
+    'industrie': 50, 'services': 15, 'commerce': 25,
+    'construction': 40, 'transport': 60
+}
+# Imputation features after sector and size codes: the other imputed fields (simplified: default values)
+IMPUTATION_DEFAULTS = {
+    'electricite_kwh': 25000, 'gaz_kwh': 15000, 'carburants_litres': 2000,
+    'vehicules_km_annuel': 15000, 'montant_achats_annuel': 300000
+}
+MAX_BATCH_SIZE = int(os.getenv("ML_MAX_BATCH_SIZE", "10000"))
+
+def check_batch_size(rows: List[Any]):
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(rows)} rows (max {MAX_BATCH_SIZE})")
+
+def benchmark_sector(sector: str) -> str:
+    # Use default sector if not found
+    return sector if sector in BENCHMARK_SECTORS else 'services'
+
+def score_anomalies(rows: List[CompanyData], anomaly_detector, scaler) -> List[AnomalyResult]:
+    """Anomaly results for a batch: one transform and one decision_function for all rows"""
+    if not rows:
+        return []
+    features = np.array(
+        [[getattr(row, name) for name in ANOMALY_FEATURES] for row in rows],
+        dtype=float
+    ).reshape(len(rows), len(ANOMALY_FEATURES))
+    
+    # Scale features
+    scaled_features = scaler.transform(features)
+    
+    # Predict anomaly; IsolationForest.predict is the sign of decision_function
+    anomaly_scores = anomaly_detector.decision_function(scaled_features)
+    is_anomaly = anomaly_scores < 0
+    
+    # Identify anomalous fields (simplified approach)
+    # Simple heuristic: check extreme values
+    upper = np.percentile(scaled_features, 95, axis=1)[:, None]
+    lower = np.percentile(scaled_features, 5, axis=1)[:, None]
+    extreme = ((features > upper) | (features < lower)) & is_anomaly[:, None]
+    
+    return [
+        AnomalyResult(
+            is_anomaly=bool(anomaly),
+            anomaly_score=float(score),
+            anomalous_fields=[name for name, flagged in zip(ANOMALY_FEATURES, flags) if flagged],
+            confidence=min(1.0, abs(float(score)) / 2.0)
+        )
+        for anomaly, score, flags in zip(is_anomaly, anomaly_scores, extreme)
+    ]
+
+def missing_fields_of(record: Dict[str, Any]) -> List[str]:
+    """Fields given as None or 0"""
+    return [
+        field for field, value in record.items()
+        if value is None or (isinstance(value, (int, float)) and value == 0)
+    ]
+
+def impute_records(records: List[Dict[str, Any]], field_models: Dict[str, Any]) -> List[ImputationResult]:
+    """Imputation results for a batch: one predict per imputed field"""
+    missing = [missing_fields_of(record) for record in records]
+    codes = np.array([
+        [SECTOR_CODES.get(record.get('sector', 'services'), 1), SIZE_CODES.get(record.get('employees', '10-49'), 1)]
+        for record in records
+    ], dtype=float).reshape(len(records), 2)
+    
+    predictions: List[Dict[str, float]] = [{} for _ in records]
+    for field, model in field_models.items():
+        positions = [i for i, fields in enumerate(missing) if field in fields]
+        if model is None or not positions:
+            continue
+        defaults = [value for name, value in IMPUTATION_DEFAULTS.items() if name != field]
+        features = np.empty((len(positions), 2 + len(defaults)))
+        features[:, :2] = codes[positions]
+        features[:, 2:] = defaults
+        
+        # Predict missing values, with realistic variation
+        predicted = model.predict(features) * np.random.normal(1.0, 0.1, size=len(positions))
+        for i, value in zip(positions, np.maximum(predicted, 0)):
+            predictions[i][field] = float(value)
+    
+    results = []
+    for fields, predicted in zip(missing, predictions):
+        imputed_data = {field: predicted[field] for field in fields if field in predicted}
+        results.append(ImputationResult(
+            imputed_data=imputed_data,
+            imputed_fields=fields,
+            confidence_scores={field: 0.75 for field in imputed_data}  # Simplified confidence score
+        ))
+    return results
+
+def predict_benchmarks(rows: List[CompanyData], sector_models: Dict[str, Any]) -> List[BenchmarkResult]:
+    """Benchmark results for a batch: one predict per sector group"""
+    # Prepare features
+    employees_numeric = np.array([EMPLOYEES_NUMERIC[row.employees] for row in rows], dtype=float)
+    revenue_millions = np.array([(row.revenue or 1000000) / 1000000 for row in rows], dtype=float)
+    
+    # Calculate intensity metrics
+    total_energy = np.array([row.electricite_kwh + row.gaz_kwh for row in rows], dtype=float)
+    total_transport = np.array(
+        [row.vehicules_km_annuel + row.vols_domestiques_km + row.vols_internationaux_km for row in rows],
+        dtype=float
+    )
+    features = np.column_stack([
+        employees_numeric,
+        revenue_millions,
+        total_energy / employees_numeric / 1000,  # Normalize
+        total_transport / employees_numeric / 1000  # Normalize
+    ]) if rows else np.empty((0, 4))
+    
+    # Predict emissions, sector by sector
+    sectors = np.array([benchmark_sector(row.sector) for row in rows], dtype=object)
+    predicted_emissions = np.empty(len(rows))
+    for sector, model in sector_models.items():
+        positions = np.flatnonzero(sectors == sector)
+        if len(positions):
+            predicted_emissions[positions] = model.predict(features[positions])
+    
+    results = []
+    for row, predicted in zip(rows, predicted_emissions.tolist()):
+        # Calculate percentile (simplified)
+        sector_avg = SECTOR_AVERAGES.get(row.sector, 15)
+        percentile = min(90, max(10, int((predicted / sector_avg) * 50)))
+        
+        results.append(BenchmarkResult(
+            predicted_emissions=predicted,
+            percentile_position=percentile,
+            sector_average=sector_avg,
+            # Confidence interval (±20%)
+            confidence_interval=[predicted * 0.8, predicted * 1.2]
+        ))
+    return results
+
+async def benchmark_models_for(rows: List[CompanyData]) -> Dict[str, Any]:
+    return {
+        sector: await get_model(ml_service.benchmark_model, sector)
+        for sector in sorted({benchmark_sector(row.sector) for row in rows})
+    }
+
+async def imputation_models_for(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    fields = {field for record in records for field in missing_fields_of(record)}
+    return {
+        field: await get_model(ml_service.imputation_model, field)
+        for field in IMPUTATION_FIELDS if field in fields
+    }
+
+async def anomaly_models_for(rows: List[CompanyData]) -> Tuple[Any, Any]:
+    return await get_model(ml_service.anomaly_model)
+
+async def predict_anomalies(rows: List[CompanyData], model: Tuple[Any, Any]) -> List[AnomalyResult]:
+    anomaly_detector, scaler = model
+    return await run_in_threadpool(score_anomalies, rows, anomaly_detector, scaler)
+
+async def predict_benchmarks_async(rows: List[CompanyData], sector_models: Dict[str, Any]) -> List[BenchmarkResult]:
+    return await run_in_threadpool(predict_benchmarks, rows, sector_models)
+
+async def anomaly_batch(rows: List[CompanyData]) -> List[AnomalyResult]:
+    return await predict_anomalies(rows, await anomaly_models_for(rows))
+
+async def benchmark_batch(rows: List[CompanyData]) -> List[BenchmarkResult]:
+    return await predict_benchmarks_async(rows, await benchmark_models_for(rows))
+
+# Concurrent single-row requests share one vectorized predict per window
+BATCH_WINDOW_MS = float(os.getenv("ML_BATCH_WINDOW_MS", "2"))
+BATCH_MAX_SIZE = int(os.getenv("ML_BATCH_MAX_SIZE", "256"))
+# Model loading (and on-demand training) is batch-wide: a failure there fails the
+# batch instead of being retried, and retraining, once per row
+anomaly_batcher = MicroBatcher("anomaly", predict_anomalies, BATCH_WINDOW_MS, BATCH_MAX_SIZE,
+                               prepare=anomaly_models_for)
+benchmark_batcher = MicroBatcher("benchmark", predict_benchmarks_async, BATCH_WINDOW_MS, BATCH_MAX_SIZE,
+                                 prepare=benchmark_models_for)
+
+@app.get("/api/v1/ml/batching")
+async def batching_stats():
+    """Micro-batching settings and batch size metrics"""
+    return {
+        "anomaly": anomaly_batcher.to_dict(),
+        "benchmark": benchmark_batcher.to_dict(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -357,161 +523,66 @@ async def root():
 async def detect_anomalies(data: CompanyData):
     """Detect anomalies in company data"""
     try:
-        # Prepare features
-        features = np.array([[
-            data.electricite_kwh,
-            data.gaz_kwh,
-            data.carburants_litres,
-            data.vehicules_km_annuel,
-            data.vols_domestiques_km,
-            data.vols_internationaux_km,
-            data.montant_achats_annuel,
-            data.pourcentage_local
-        ]])
-        
-        # Scale features
-        scaled_features = models['scaler'].transform(features)
-        
-        # Predict anomaly
-        anomaly_pred = models['anomaly_detector'].predict(scaled_features)[0]
-        anomaly_score = models['anomaly_detector'].decision_function(scaled_features)[0]
-        
-        # Identify anomalous fields (simplified approach)
-        feature_names = [
-            'electricite_kwh', 'gaz_kwh', 'carburants_litres', 'vehicules_km_annuel',
-            'vols_domestiques_km', 'vols_internationaux_km', 'montant_achats_annuel', 'pourcentage_local'
-        ]
-        
-        # Calculate field-specific anomaly scores
-        anomalous_fields = []
-        if anomaly_pred == -1:  # Anomaly detected
-            # Simple heuristic: check extreme values
-            values = features[0]
-            for i, (name, value) in enumerate(zip(feature_names, values)):
-                if value > np.percentile(scaled_features[0], 95) or value < np.percentile(scaled_features[0], 5):
-                    anomalous_fields.append(name)
-        
-        return AnomalyResult(
-            is_anomaly=anomaly_pred == -1,
-            anomaly_score=float(anomaly_score),
-            anomalous_fields=anomalous_fields,
-            confidence=min(1.0, abs(anomaly_score) / 2.0)
-        )
+        return await anomaly_batcher.submit(data)
         
     except Exception as e:
         logger.error(f"Anomaly detection error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/ml/anomaly/batch", response_model=List[AnomalyResult])
+async def detect_anomalies_batch(data: List[CompanyData]):
+    """Detect anomalies for many companies; results follow the input order"""
+    check_batch_size(data)
+    try:
+        return await anomaly_batch(data)
+        
+    except Exception as e:
+        logger.error(f"Batch anomaly detection error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/v1/ml/impute", response_model=ImputationResult)
 async def impute_missing_values(data: Dict[str, Any]):
     """Impute missing values in company data"""
     try:
-        # Identify missing fields (None or 0 values)
-        missing_fields = []
-        for field, value in data.items():
-            if value is None or (isinstance(value, (int, float)) and value == 0):
-                missing_fields.append(field)
-        
-        if not missing_fields:
-            return ImputationResult(
-                imputed_data={},
-                imputed_fields=[],
-                confidence_scores={}
-            )
-        
-        # Prepare features for imputation
-        sector_mapping = {'industrie': 0, 'services': 1, 'commerce': 2, 'construction': 3, 'transport': 4}
-        size_mapping = {'1-9': 0, '10-49': 1, '50-249': 2, '250+': 3}
-        
-        sector_idx = sector_mapping.get(data.get('sector', 'services'), 1)
-        employees = data.get('employees', '10-49')
-        size_idx = size_mapping.get(employees, 1)
-        
-        imputed_data = {}
-        confidence_scores = {}
-        
-        for field in missing_fields:
-            if field in models['imputation_models']:
-                # Prepare features (simplified)
-                features = np.array([[sector_idx, size_idx, 25000, 15000, 2000, 15000, 300000]])  # Default values
-                
-                # Predict missing value
-                predicted_value = models['imputation_models'][field].predict(features)[0]
-                
-                # Add realistic variation
-                predicted_value *= np.random.normal(1.0, 0.1)
-                
-                imputed_data[field] = max(0, predicted_value)
-                confidence_scores[field] = 0.75  # Simplified confidence score
-        
-        return ImputationResult(
-            imputed_data=imputed_data,
-            imputed_fields=list(missing_fields),
-            confidence_scores=confidence_scores
-        )
+        return impute_records([data], await imputation_models_for([data]))[0]
         
     except Exception as e:
         logger.error(f"Imputation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/ml/impute/batch", response_model=List[ImputationResult])
+async def impute_missing_values_batch(data: List[Dict[str, Any]]):
+    """Impute missing values for many companies; results follow the input order"""
+    check_batch_size(data)
+    try:
+        field_models = await imputation_models_for(data)
+        return await run_in_threadpool(impute_records, data, field_models)
+        
+    except Exception as e:
+        logger.error(f"Batch imputation error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/v1/ml/benchmark", response_model=BenchmarkResult)
 async def predict_benchmark(data: CompanyData):
     """Predict sector benchmark for company"""
     try:
-        sector = data.sector
-        
-        if sector not in models['benchmark_models']:
-            # Use default sector if not found
-            sector = 'services'
-        
-        # Prepare features
-        employees_numeric = {'1-9': 5, '10-49': 25, '50-249': 125, '250+': 500}[data.employees]
-        revenue_millions = (data.revenue or 1000000) / 1000000
-        
-        # Calculate intensity metrics
-        total_energy = data.electricite_kwh + data.gaz_kwh
-        energy_intensity = total_energy / employees_numeric if employees_numeric > 0 else 0
-        
-        total_transport = data.vehicules_km_annuel + data.vols_domestiques_km + data.vols_internationaux_km
-        transport_intensity = total_transport / employees_numeric if employees_numeric > 0 else 0
-        
-        features = np.array([[
-            employees_numeric,
-            revenue_millions,
-            energy_intensity / 1000,  # Normalize
-            transport_intensity / 1000  # Normalize
-        ]])
-        
-        # Predict emissions
-        model = models['benchmark_models'][sector]
-        predicted_emissions = model.predict(features)[0]
-        
-        # Calculate percentile (simplified)
-        sector_averages = {
-            'industrie': 50, 'services': 15, 'commerce': 25,
-            'construction': 40, 'transport': 60
-        }
-        sector_avg = sector_averages.get(data.sector, 15)
-        
-        percentile = min(90, max(10, int((predicted_emissions / sector_avg) * 50)))
-        
-        # Confidence interval (±20%)
-        confidence_interval = [
-            predicted_emissions * 0.8,
-            predicted_emissions * 1.2
-        ]
-        
-        return BenchmarkResult(
-            predicted_emissions=predicted_emissions,
-            percentile_position=percentile,
-            sector_average=sector_avg,
-            confidence_interval=confidence_interval
-        )
+        return await benchmark_batcher.submit(data)
         
     except Exception as e:
         logger.error(f"Benchmark prediction error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/ml/benchmark/batch", response_model=List[BenchmarkResult])
+async def predict_benchmark_batch(data: List[CompanyData]):
+    """Predict sector benchmarks for many companies; results follow the input order"""
+    check_batch_size(data)
+    try:
+        return await benchmark_batch(data)
+        
+    except Exception as e:
+        logger.error(f"Batch benchmark prediction error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/v1/ml/actions", response_model=List[ActionRecommendation])
 async def rank_actions(data: CompanyData, calculation_result: Dict[str, float]):
     """Rank action recommendations based on company profile and emissions"""
@@ -604,33 +675,56 @@ async def rank_actions(data: CompanyData, calculation_result: Dict[str, float]):
         logger.error(f"Action ranking error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Training runs as its own process (pool), never on the serving event loop or its threads
+APP_DIR = Path(__file__).resolve().parent
+TRAINING_COMMAND = [sys.executable, "-m", "training.train_all"]
+
 @app.post("/api/v1/ml/train")
 async def trigger_model_training(background_tasks: BackgroundTasks):
     """Trigger model retraining"""
     try:
+        if ml_service.training["status"] == "running":
+            return {
+                "status": "training_already_running",
+                "training": ml_service.training,
+                "timestamp": datetime.now().isoformat()
+            }
+        ml_service.training = {"status": "running", "started_at": datetime.now().isoformat()}
         background_tasks.add_task(retrain_models)
         return {
             "status": "training_started",
-            "message": "Model retraining initiated in background",
+            "message": "Model retraining initiated in a separate process",
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         logger.error(f"Training trigger error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/ml/train")
+async def training_status():
+    """State of the last retraining run"""
+    return ml_service.training
+
 async def retrain_models():
-    """Background task for model retraining"""
+    """Background task: run the training pipeline, then swap in the new models"""
     try:
         logger.info("Starting model retraining...")
         
-        # Retrain all models
-        ml_service._train_anomaly_detector()
-        ml_service._train_imputation_models()
-        ml_service._train_benchmark_models()
+        # Retrain all models; worker count, CPUs and niceness come from ML_TRAIN_* settings
+        process = await asyncio.create_subprocess_exec(
+            *TRAINING_COMMAND, "--models-dir", str(ml_service.models_dir),
+            cwd=str(APP_DIR)
+        )
+        returncode = await process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"Training pipeline exited with code {returncode}")
         
+        await run_in_threadpool(ml_service.reload)
+        ml_service.training.update(status="completed", finished_at=datetime.now().isoformat())
         logger.info("Model retraining completed successfully")
         
     except Exception as e:
+        ml_service.training.update(status="failed", error=str(e), finished_at=datetime.now().isoformat())
         logger.error(f"Model retraining failed: {e}")
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+"""
+CarbonScore ML Service - Micro-batching
+Coalesces concurrent single-row inference requests into one vectorized call
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class BatchStats:
+    """Batch size histogram (power-of-two buckets) and queueing delay"""
+
+    def __init__(self, max_batch_size: int):
+        self.bounds = [1]
+        while self.bounds[-1] < max_batch_size:
+            self.bounds.append(min(self.bounds[-1] * 2, max_batch_size))
+        self.histogram = [0] * len(self.bounds)
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.full_batches = 0
+        self.fallbacks = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def record(self, size: int, waits_ms: List[float], full: bool):
+        self.batches += 1
+        self.rows += size
+        self.largest_batch = max(self.largest_batch, size)
+        self.full_batches += int(full)
+        self.histogram[next(i for i, bound in enumerate(self.bounds) if size <= bound)] += 1
+        self.total_wait_ms += sum(waits_ms)
+        self.max_wait_ms = max(self.max_wait_ms, max(waits_ms))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "full_batches": self.full_batches,
+            "fallbacks": self.fallbacks,
+            "batch_size_histogram": {
+                f"<={bound}": count for bound, count in zip(self.bounds, self.histogram)
+            },
+            "mean_wait_ms": self.total_wait_ms / self.rows if self.rows else 0.0,
+            "max_wait_ms": self.max_wait_ms
+        }
+
+class MicroBatcher:
+    """Gathers rows submitted within `window_ms` into one call to `predict_batch`
+
+    A batch is flushed when the window elapses after its first row or as soon
+    as it reaches `max_batch_size`, whichever comes first. A wider window adds
+    up to that much latency to a lone request and buys larger batches under
+    load; `window_ms=0` disables coalescing and every row is its own batch.
+
+    `predict_batch` takes the rows and returns one result per row, in order.
+    If a batch fails, its rows are retried one by one so a single bad row only
+    fails its own caller.
+
+    With `prepare`, batch-wide work such as loading or training models runs
+    first and its result is passed to `predict_batch(rows, prepared)`. A
+    `prepare` failure is not about any one row: it fails the whole batch
+    without per-row retries, and the retries reuse what it returned.
+    """
+
+    def __init__(self, name: str, predict_batch: Callable[..., Awaitable[List[Any]]],
+                 window_ms: float = 2.0, max_batch_size: int = 256,
+                 prepare: Optional[Callable[[List[Any]], Awaitable[Any]]] = None):
+        self.name = name
+        self.predict_batch = predict_batch
+        self.prepare = prepare
+        self.window_ms = window_ms
+        self.max_batch_size = max(1, max_batch_size)
+        self.stats = BatchStats(self.max_batch_size)
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, row: Any) -> Any:
+        """Queue one row and wait for its result"""
+        if self.window_ms <= 0:
+            self.stats.record(1, [0.0], full=self.max_batch_size == 1)
+            rows = [row]
+            prepared = await self.prepare(rows) if self.prepare is not None else None
+            return (await self._predict(rows, prepared))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            # Keep a reference until done; the loop only holds weak ones
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        started = time.perf_counter()
+        self.stats.record(
+            len(batch),
+            [(started - queued) * 1000 for _, _, queued in batch],
+            full=len(batch) >= self.max_batch_size
+        )
+        rows = [row for row, _, _ in batch]
+        prepared = None
+        if self.prepare is not None:
+            try:
+                prepared = await self.prepare(rows)
+            except Exception as e:
+                logger.warning(f"{self.name} batch of {len(batch)} failed before predicting: {e}")
+                for _, future, _ in batch:
+                    self._settle(future, error=e)
+                return
+        try:
+            results = await self._predict(rows, prepared)
+        except Exception as e:
+            if len(batch) == 1:
+                self._settle(batch[0][1], error=e)
+                return
+            logger.warning(f"{self.name} batch of {len(batch)} failed, retrying rows one by one: {e}")
+            self.stats.fallbacks += 1
+            for row, future, _ in batch:
+                try:
+                    self._settle(future, (await self._predict([row], prepared))[0])
+                except Exception as row_error:
+                    self._settle(future, error=row_error)
+            return
+        for (_, future, _), result in zip(batch, results):
+            self._settle(future, result)
+
+    def _predict(self, rows: List[Any], prepared: Any) -> Awaitable[List[Any]]:
+        if self.prepare is None:
+            return self.predict_batch(rows)
+        return self.predict_batch(rows, prepared)
+
+    @staticmethod
+    def _settle(future: asyncio.Future, result: Any = None, error: Optional[Exception] = None):
+        # The caller may have gone away (client disconnect cancels its await)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "pending": len(self._pending),
+            **self.stats.to_dict()
+        }
@@ -0,0 +1,131 @@
+"""
+CarbonScore ML Service - Synthetic training data
+Vectorized, seeded generators of realistic company profiles
+
+Every generator draws whole columns from a numpy Generator, so a million rows
+cost a handful of array operations. `seed` is anything `np.random.default_rng`
+accepts: an int, a SeedSequence, or a Generator to continue an existing stream.
+"""
+
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+SeedLike = Union[None, int, np.random.SeedSequence, np.random.Generator]
+
+SECTORS = ['industrie', 'services', 'commerce', 'construction', 'transport']
+SIZE_BANDS = ['1-9', '10-49', '50-249', '250+']
+SIZE_MULTIPLIERS = [0.3, 1.0, 3.0, 10.0]
+
+ANOMALY_FEATURES = [
+    'electricite_kwh', 'gaz_kwh', 'carburants_litres', 'vehicules_km_annuel',
+    'vols_domestiques_km', 'vols_internationaux_km', 'montant_achats_annuel', 'pourcentage_local'
+]
+IMPUTATION_TARGETS = ['electricite_kwh', 'gaz_kwh', 'carburants_litres', 'vehicules_km_annuel', 'montant_achats_annuel']
+BENCHMARK_FEATURES = ['employees_numeric', 'revenue_millions', 'energy_intensity', 'transport_intensity']
+
+# Sector-specific base values of a 10-49 company, in SECTORS order:
+# elec, gaz, carb, veh, achats
+PROFILE_BASES = np.array([
+    [80000, 120000, 8000, 40000, 800000],
+    [25000, 15000, 2000, 15000, 300000],
+    [45000, 25000, 5000, 30000, 1200000],
+    [35000, 40000, 15000, 60000, 900000],
+    [20000, 10000, 25000, 100000, 400000]
+], dtype=float)
+
+# Base electricity for imputation profiles, per sector
+IMPUTATION_ELEC_BASES = np.array([20000, 25000, 45000, 35000, 20000], dtype=float)
+# (low, high) ratio to electricity for gaz, carb, veh, achats, then noise sigma per target
+IMPUTATION_RATIOS = np.array([[0.3, 0.8], [0.05, 0.15], [0.3, 2.0], [8, 15]], dtype=float)
+IMPUTATION_NOISE = np.array([0.2, 0.3, 0.4, 0.3, 0.25])
+
+# Sector base emissions (tCO2e) of a 10-49 company
+BENCHMARK_BASE_EMISSIONS = {
+    'industrie': 50, 'services': 15, 'commerce': 25,
+    'construction': 40, 'transport': 60
+}
+
+def company_profiles(n_samples: int, seed: SeedLike = 42) -> pd.DataFrame:
+    """Normal company profiles with the anomaly detector features
+
+    Sector and size band are uniform; the five activity fields share one
+    N(1, 0.2) noise draw per company, flights and local share are uniform.
+    """
+    rng = np.random.default_rng(seed)
+    sector_idx = rng.integers(0, len(SECTORS), n_samples)
+    size_idx = rng.integers(0, len(SIZE_BANDS), n_samples)
+    noise = rng.normal(1.0, 0.2, n_samples)
+
+    # elec, gaz, carb, veh, achats scaled by size and noise
+    activity = PROFILE_BASES[sector_idx] * (np.asarray(SIZE_MULTIPLIERS)[size_idx] * noise)[:, None]
+
+    frame = pd.DataFrame({
+        'electricite_kwh': activity[:, 0],
+        'gaz_kwh': activity[:, 1],
+        'carburants_litres': activity[:, 2],
+        'vehicules_km_annuel': activity[:, 3],
+        'vols_domestiques_km': rng.uniform(1000, 10000, n_samples),
+        'vols_internationaux_km': rng.uniform(2000, 15000, n_samples),
+        'montant_achats_annuel': activity[:, 4],
+        'pourcentage_local': rng.uniform(20, 80, n_samples)
+    }, columns=ANOMALY_FEATURES)
+    frame['sector'] = pd.Categorical.from_codes(sector_idx, SECTORS)
+    frame['employees'] = pd.Categorical.from_codes(size_idx, SIZE_BANDS)
+    return frame
+
+def imputation_profiles(n_samples: int, seed: SeedLike = 42) -> pd.DataFrame:
+    """Complete profiles with correlated activity fields, for imputation training
+
+    Gaz, fuel, vehicles and purchases are uniform ratios of electricity, and
+    each field then gets its own multiplicative normal noise.
+    """
+    rng = np.random.default_rng(seed)
+    sector_idx = rng.integers(0, len(SECTORS), n_samples)
+    size_idx = rng.integers(0, len(SIZE_BANDS), n_samples)
+
+    base_elec = IMPUTATION_ELEC_BASES[sector_idx] * np.asarray(SIZE_MULTIPLIERS)[size_idx]
+    ratios = rng.uniform(IMPUTATION_RATIOS[:, 0], IMPUTATION_RATIOS[:, 1], (n_samples, len(IMPUTATION_RATIOS)))
+    bases = np.column_stack([base_elec, base_elec[:, None] * ratios])
+    values = bases * rng.normal(1.0, IMPUTATION_NOISE, (n_samples, len(IMPUTATION_TARGETS)))
+
+    frame = pd.DataFrame(values, columns=IMPUTATION_TARGETS)
+    frame.insert(0, 'size_idx', size_idx)
+    frame.insert(0, 'sector_idx', sector_idx)
+    return frame
+
+def imputation_features(target: str) -> List[str]:
+    """Model inputs for imputing `target`: sector, size and the other fields"""
+    return ['sector_idx', 'size_idx'] + [field for field in IMPUTATION_TARGETS if field != target]
+
+def benchmark_profiles(sector: str, n_samples: int, seed: SeedLike = 42) -> pd.DataFrame:
+    """Company characteristics and total emissions for one sector
+
+    Size multiplier is uniform over the size bands, intensities are uniform,
+    and emissions get N(1, 0.3) multiplicative variation.
+    """
+    rng = np.random.default_rng(seed)
+    size_multiplier = rng.choice(SIZE_MULTIPLIERS, n_samples)
+
+    frame = pd.DataFrame({
+        'employees_numeric': size_multiplier * 25,
+        'revenue_millions': size_multiplier * 2.5,
+        'energy_intensity': rng.uniform(0.5, 2.0, n_samples),
+        'transport_intensity': rng.uniform(0.3, 1.5, n_samples)
+    }, columns=BENCHMARK_FEATURES)
+    frame['total_emissions'] = (
+        BENCHMARK_BASE_EMISSIONS[sector] * size_multiplier * rng.normal(1.0, 0.3, n_samples)
+    )
+    return frame
+
+def benchmark_datasets(n_samples: int, seed: SeedLike = 42,
+                       sectors: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """`benchmark_profiles` for each sector, from independent child seeds"""
+    sectors = sectors or SECTORS
+    if isinstance(seed, np.random.Generator):
+        children = [seed] * len(sectors)
+    else:
+        sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        children = sequence.spawn(len(sectors))
+    return {sector: benchmark_profiles(sector, n_samples, child) for sector, child in zip(sectors, children)}
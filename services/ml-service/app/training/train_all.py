@@ -0,0 +1,201 @@
+"""
+CarbonScore ML Service - Training pipeline
+Fits every model in a process pool, apart from the serving process
+
+The anomaly detector, each imputation target and each sector benchmark are
+independent, so they are fitted concurrently, one task per model. Artifacts
+are written atomically; the service picks them up with `MLService.reload`.
+
+    python -m training.train_all --models-dir /data/artifacts/models --n-jobs 4
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+import argparse
+import logging
+import os
+import time
+
+import joblib
+import lightgbm as lgb
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from training.synthetic import (
+    ANOMALY_FEATURES, BENCHMARK_FEATURES, IMPUTATION_TARGETS, SECTORS, benchmark_profiles,
+    company_profiles, imputation_features, imputation_profiles
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEED = 42
+ANOMALY_SAMPLES = 1000
+IMPUTATION_SAMPLES = 2000
+BENCHMARK_SAMPLES = 500
+
+def fit_anomaly_detector(n_samples: int = ANOMALY_SAMPLES, seed: int = DEFAULT_SEED) -> Tuple[IsolationForest, StandardScaler]:
+    """IsolationForest and its scaler, fitted on normal company profiles"""
+    df = company_profiles(n_samples, seed=seed)[ANOMALY_FEATURES]
+    scaler = StandardScaler()
+    scaled_data = scaler.fit_transform(df)
+    anomaly_detector = IsolationForest(
+        contamination=0.1,
+        random_state=42,
+        n_estimators=100
+    )
+    anomaly_detector.fit(scaled_data)
+    return anomaly_detector, scaler
+
+def fit_imputation_model(target: str, n_samples: int = IMPUTATION_SAMPLES, seed: int = DEFAULT_SEED,
+                         n_threads: Optional[int] = None) -> lgb.LGBMRegressor:
+    """LightGBM model imputing `target` from sector, size and the other fields"""
+    # Same dataset for every target; the missing-value mask is drawn per target
+    df = imputation_profiles(n_samples, seed=seed)
+    mask_rng = np.random.default_rng([seed, IMPUTATION_TARGETS.index(target)])
+    train_mask = mask_rng.random(len(df)) > 0.2  # 20% missing
+    features = imputation_features(target)
+
+    model = lgb.LGBMRegressor(
+        n_estimators=100,
+        learning_rate=0.1,
+        random_state=42,
+        verbose=-1,
+        n_jobs=n_threads
+    )
+    model.fit(df.loc[train_mask, features], df.loc[train_mask, target])
+    return model
+
+def fit_benchmark_model(sector: str, n_samples: int = BENCHMARK_SAMPLES, seed: int = DEFAULT_SEED,
+                        n_threads: Optional[int] = None) -> lgb.LGBMRegressor:
+    """LightGBM model of total emissions for one sector"""
+    # The child seed benchmark_datasets would give this sector
+    sector_seed = np.random.SeedSequence(seed, spawn_key=(SECTORS.index(sector),))
+    df = benchmark_profiles(sector, n_samples, sector_seed)
+
+    model = lgb.LGBMRegressor(
+        n_estimators=100,
+        learning_rate=0.1,
+        random_state=42,
+        verbose=-1,
+        n_jobs=n_threads
+    )
+    model.fit(df[BENCHMARK_FEATURES], df['total_emissions'])
+    return model
+
+def dump_atomic(model: Any, path: Path):
+    """Write next to `path` and rename, so readers never see a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+def training_tasks() -> List[Tuple[str, str]]:
+    """(kind, name) of every independently trained model"""
+    return (
+        [('anomaly', 'anomaly_detector')]
+        + [('imputation', target) for target in IMPUTATION_TARGETS]
+        + [('benchmark', sector) for sector in SECTORS]
+    )
+
+def run_task(kind: str, name: str, models_dir: str, seed: int = DEFAULT_SEED) -> Tuple[str, str, float]:
+    """Fit one model and write its artifacts; executed in a pool worker"""
+    started = time.perf_counter()
+    models_dir = Path(models_dir)
+    # LightGBM gets one thread per worker: the pool provides the parallelism
+    if kind == 'anomaly':
+        anomaly_detector, scaler = fit_anomaly_detector(seed=seed)
+        # Scaler first: the detector file is what marks the pair as present
+        dump_atomic(scaler, models_dir / "scaler.joblib")
+        dump_atomic(anomaly_detector, models_dir / "anomaly_detector.joblib")
+    elif kind == 'imputation':
+        dump_atomic(fit_imputation_model(name, seed=seed, n_threads=1), models_dir / "imputation" / f"{name}.joblib")
+    elif kind == 'benchmark':
+        dump_atomic(fit_benchmark_model(name, seed=seed, n_threads=1), models_dir / "benchmark" / f"{name}.joblib")
+    else:
+        raise ValueError(f"Unknown model kind: {kind}")
+    return kind, name, time.perf_counter() - started
+
+def available_cpus() -> Set[int]:
+    """CPUs this process may run on (affinity mask, cgroup cpusets included)"""
+    if hasattr(os, "sched_getaffinity"):
+        return os.sched_getaffinity(0)
+    return set(range(os.cpu_count() or 1))
+
+def parse_cpus(spec: str) -> Set[int]:
+    """CPU list in taskset syntax, e.g. "2-5,8" """
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        low, _, high = part.partition("-")
+        cpus.update(range(int(low), int(high or low) + 1))
+    return cpus
+
+def training_cpus(allowed: Set[int], reserve: int) -> Set[int]:
+    """Allowed CPUs minus the `reserve` lowest-numbered ones, kept for serving; never empty"""
+    ordered = sorted(allowed)
+    return set(ordered[min(max(reserve, 0), len(ordered) - 1):])
+
+def resolve_n_jobs(n_jobs: Optional[int]) -> int:
+    """Worker count: None uses every allowed CPU, negatives count back from it like joblib"""
+    cpus = len(available_cpus())
+    if n_jobs is None or n_jobs == 0:
+        return cpus
+    if n_jobs < 0:
+        return max(1, cpus + 1 + n_jobs)
+    return n_jobs
+
+def train_all(models_dir: str, n_jobs: Optional[int] = None, seed: int = DEFAULT_SEED) -> Dict[str, float]:
+    """Fit every model concurrently; returns the fit time of each, keyed kind/name"""
+    tasks = training_tasks()
+    workers = min(resolve_n_jobs(n_jobs), len(tasks))
+    logger.info(f"Training {len(tasks)} models with {workers} workers on CPUs {sorted(available_cpus())}")
+
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    # Workers inherit this process's affinity mask and niceness
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_task, kind, name, str(models_dir), seed) for kind, name in tasks]
+        for future in as_completed(futures):
+            kind, name, seconds = future.result()
+            timings[f"{kind}/{name}"] = seconds
+            logger.info(f"Trained {kind} model {name} in {seconds:.2f}s")
+
+    logger.info(f"Trained {len(tasks)} models in {time.perf_counter() - started:.2f}s")
+    return timings
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Train every CarbonScore ML model")
+    parser.add_argument("--models-dir", default=os.getenv("MODEL_STORAGE_PATH", "/data/artifacts/models"))
+    parser.add_argument("--n-jobs", type=int, default=int(os.getenv("ML_TRAIN_N_JOBS", "0")),
+                        help="Worker processes; 0 or -1 uses every allowed CPU, -2 all but one")
+    parser.add_argument("--cpus", default=os.getenv("ML_TRAIN_CPUS", ""),
+                        help="Restrict training to these CPUs, e.g. 2-7, leaving the rest to serving")
+    parser.add_argument("--reserve-cpus", type=int, default=int(os.getenv("ML_TRAIN_RESERVE_CPUS", "1")),
+                        help="Without --cpus, leave this many of the lowest allowed CPUs to serving (0 uses all)")
+    parser.add_argument("--nice", type=int, default=int(os.getenv("ML_TRAIN_NICE", "10")),
+                        help="Niceness increment, so serving keeps priority on shared CPUs")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.cpus:
+        cpus = parse_cpus(args.cpus) & available_cpus()
+        if not cpus:
+            parser.error(f"--cpus {args.cpus} leaves no CPU this process may use")
+        os.sched_setaffinity(0, cpus)
+    elif args.reserve_cpus and hasattr(os, "sched_setaffinity"):
+        cpus = training_cpus(available_cpus(), args.reserve_cpus)
+        if len(cpus) == len(available_cpus()):
+            logger.warning("Only one CPU available, training shares it with serving")
+        os.sched_setaffinity(0, cpus)
+    if args.nice:
+        os.nice(args.nice)
+
+    train_all(args.models_dir, n_jobs=args.n_jobs, seed=args.seed)
+
+if __name__ == "__main__":
+    main()